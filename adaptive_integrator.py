@@ -0,0 +1,556 @@
+#   ADAPTIVE-STEP TRAJECTORY INTEGRATOR
+
+# optional alternative to the fixed-step Euler loop in trajectory_core
+#
+# integrates the same equations of motion with an embedded Dormand-Prince
+# 5(4) Runge-Kutta pair and error control, and root-finds the flight
+# events (burnout, engine shutdown, apogee, drogue/main deployment,
+# ground impact) so they land on their exact times instead of the
+# nearest multiple of time_increment
+
+import math
+from time import perf_counter
+
+from trajectory_core import (SimResult, FlightState, InsufficientThrustError, ChuteOrderError,
+                             apogeeCheckHoldoff, standard_atmosphere)
+
+# Dormand-Prince 5(4) tableau
+C2, C3, C4, C5 = 1/5, 3/10, 4/5, 8/9
+
+A21 = 1/5
+A31, A32 = 3/40, 9/40
+A41, A42, A43 = 44/45, -56/15, 32/9
+A51, A52, A53, A54 = 19372/6561, -25360/2187, 64448/6561, -212/729
+A61, A62, A63, A64, A65 = 9017/3168, -355/33, 46732/5247, 49/176, -5103/18656
+
+B1, B3, B4, B5, B6 = 35/384, 500/1113, 125/192, -2187/6784, 11/84
+
+# difference between the 5th and 4th order weights, for the error estimate
+E1, E3, E4, E5, E6, E7 = 71/57600, -71/16695, 71/1920, -17253/339200, 22/525, -1/40
+
+# state vector layout
+ALT, VEL, MASS, DROGUE, CHUTE = 0, 1, 2, 3, 4
+
+def dopri_step(deriv, t, y, h, f0, rtol, atol):
+    """Takes a single Dormand-Prince step of size h from (t, y).
+
+       f0 is deriv(t, y). Returns the new state, its derivative
+       (first stage of the next step) and the scaled RMS error
+       estimate (accept the step if it is <= 1)."""
+
+    n = len(y)
+    k1 = f0
+    k2 = deriv(t + C2*h, [y[i] + h*(A21*k1[i]) for i in range(n)])
+    k3 = deriv(t + C3*h, [y[i] + h*(A31*k1[i] + A32*k2[i]) for i in range(n)])
+    k4 = deriv(t + C4*h, [y[i] + h*(A41*k1[i] + A42*k2[i] + A43*k3[i]) for i in range(n)])
+    k5 = deriv(t + C5*h, [y[i] + h*(A51*k1[i] + A52*k2[i] + A53*k3[i] + A54*k4[i]) for i in range(n)])
+    k6 = deriv(t + h, [y[i] + h*(A61*k1[i] + A62*k2[i] + A63*k3[i] + A64*k4[i] + A65*k5[i]) for i in range(n)])
+
+    y_new = [y[i] + h*(B1*k1[i] + B3*k3[i] + B4*k4[i] + B5*k5[i] + B6*k6[i]) for i in range(n)]
+    k7 = deriv(t + h, y_new)
+
+    err_sum = 0.0
+    for i in range(n):
+        err = h*(E1*k1[i] + E3*k3[i] + E4*k4[i] + E5*k5[i] + E6*k6[i] + E7*k7[i])
+        scale = atol + rtol*max(abs(y[i]), abs(y_new[i]))
+        err_sum += (err/scale)**2
+
+    return y_new, k7, math.sqrt(err_sum/n)
+
+def hermite(t0, y0, f0, t1, y1, f1, t):
+    """Cubic Hermite interpolation of the state between two accepted steps."""
+
+    h = t1 - t0
+    s = (t - t0)/h
+    h00 = (1 + 2*s) * (1 - s)**2
+    h10 = s * (1 - s)**2
+    h01 = s**2 * (3 - 2*s)
+    h11 = s**2 * (s - 1)
+    return [h00*y0[i] + h10*h*f0[i] + h01*y1[i] + h11*h*f1[i] for i in range(len(y0))]
+
+class Event:
+    """A zero crossing of func(t, y) to be located during integration.
+
+       direction -1 triggers on a positive-to-non-positive crossing,
+       +1 on negative-to-non-negative. action(t, y) is called at the
+       located time, it may change the flight phase or the state in
+       place, and returns True to end the integration. Events fire
+       once unless repeat is set."""
+
+    def __init__(self, name, func, direction, action, active=True, repeat=False):
+        self.name = name
+        self.func = func
+        self.direction = direction
+        self.action = action
+        self.active = active
+        self.repeat = repeat
+        self.last_value = None
+        self.new_value = None
+
+    def crossed(self, g0, g1):
+        if self.direction < 0:
+            return g0 > 0 and g1 <= 0
+        else:
+            return g0 < 0 and g1 >= 0
+
+def integrate(deriv, t, y, h, events, rtol, atol, max_step, on_step=None):
+    """Integrates until a terminal event, returns (t, y) at that event.
+
+       on_step(t, y, f) is called after every accepted step, and
+       right before and after every event."""
+
+    f = deriv(t, y)
+    for event in events:
+        if event.active:
+            event.last_value = event.func(t, y)
+
+    while True:
+
+        h = min(h, max_step)
+        y_new, f_new, err = dopri_step(deriv, t, y, h, f, rtol, atol)
+
+        if err > 1.0:
+            h = h * max(0.2, 0.9 * err**-0.2)
+            continue
+
+        t_new = t + h
+
+        # look for the earliest event inside the accepted step
+        first_event = None
+        first_time = t_new
+        for event in events:
+            if not event.active:
+                continue
+            g1 = event.func(t_new, y_new)
+            if event.crossed(event.last_value, g1):
+                event_time = locate_event(event, t, y, f, t_new, y_new, f_new)
+                if first_event is None or event_time < first_time:
+                    first_event = event
+                    first_time = event_time
+            event.new_value = g1
+
+        if first_event is None:
+            for event in events:
+                if event.active:
+                    event.last_value = event.new_value
+            t, y, f = t_new, y_new, f_new
+            if on_step is not None:
+                on_step(t, y, f)
+
+            h = h * (5.0 if err == 0 else min(5.0, max(0.2, 0.9 * err**-0.2)))
+            continue
+
+        # re-step exactly onto the event instead of using the interpolant
+        if first_time > t:
+            y, f, _ = dopri_step(deriv, t, y, first_time - t, f, rtol, atol)
+        t = first_time
+
+        # the state is reported both right before and right after the event
+        if on_step is not None:
+            on_step(t, y, f)
+
+        if not first_event.repeat:
+            first_event.active = False
+        stop = first_event.action(t, y)
+
+        # the action may have changed the phase (and so the derivative)
+        f = deriv(t, y)
+        for event in events:
+            if event.active:
+                event.last_value = event.func(t, y)
+        if on_step is not None:
+            on_step(t, y, f)
+
+        if stop:
+            return t, y
+
+def locate_event(event, t0, y0, f0, t1, y1, f1):
+    """Bisects the event function on the interpolated state, returns the crossing time."""
+
+    low = t0
+    high = t1
+    g_low = event.last_value
+    tolerance = 1e-10 * max(1.0, abs(t1))
+
+    while high - low > tolerance:
+        mid = 0.5 * (low + high)
+        g_mid = event.func(mid, hermite(t0, y0, f0, t1, y1, f1, mid))
+        if event.crossed(g_low, g_mid):
+            high = mid
+        else:
+            low = mid
+            g_low = g_mid
+
+    return high
+
+# - - - - - - - - - - - - - - - - - - - - - - - - - - - -
+#                  EQUATIONS OF MOTION
+# - - - - - - - - - - - - - - - - - - - - - - - - - - - -
+
+class FlightModel:
+    """Equations of motion of the vehicle in its current flight phase."""
+
+    def __init__(self, inputs, atmosphere):
+        self.inputs = inputs
+        self.atmosphere = atmosphere
+
+        self.engine_on = True
+        self.drogue_deploying = False
+        self.chute_deploying = False
+        self.drogue_released = False
+
+    def copy(self):
+        model = FlightModel(self.inputs, self.atmosphere)
+        model.engine_on = self.engine_on
+        model.drogue_deploying = self.drogue_deploying
+        model.chute_deploying = self.chute_deploying
+        model.drogue_released = self.drogue_released
+        return model
+
+    def thrust(self, alt):
+        if self.engine_on:
+            inputs = self.inputs
+            return inputs.mdot * inputs.eev + inputs.exit_area * (inputs.exit_pressure - self.atmosphere.pressure(alt))
+        return 0.0
+
+    def drag(self, alt, vel, drogue_deployment, chute_deployment):
+        """Returns drag force and dynamic pressure."""
+
+        inputs = self.inputs
+        if not inputs.drag_enabled:
+            return 0.0, 0.0
+
+        dynamic_press = 0.5 * self.atmosphere.density(alt) * vel**2
+
+        if self.drogue_deploying and not self.drogue_released:
+            airflow_area = inputs.cross_sec + (inputs.drogue_area - inputs.cross_sec) * drogue_deployment
+            drag = dynamic_press * inputs.drogue_coeff * airflow_area
+        elif self.chute_deploying:
+            airflow_area = inputs.cross_sec + (inputs.chute_area - inputs.cross_sec) * chute_deployment
+            drag = dynamic_press * inputs.chute_coeff * airflow_area
+        else:
+            drag = dynamic_press * inputs.drag_coeff * inputs.cross_sec
+
+        if vel >= 0:
+            drag = -drag
+
+        return drag, dynamic_press
+
+    def deriv(self, t, y):
+
+        alt, vel, mass, drogue_deployment, chute_deployment = y
+
+        thrust = self.thrust(alt)
+        drag, _ = self.drag(alt, vel, drogue_deployment, chute_deployment)
+        accel = (thrust + drag)/mass - self.atmosphere.gravity(alt)
+
+        if self.engine_on:
+            mass_rate = -self.inputs.mdot
+        else:
+            mass_rate = 0.0
+
+        if self.drogue_deploying and drogue_deployment < 1.0:
+            drogue_rate = 1/self.inputs.drogue_deploy_time
+        else:
+            drogue_rate = 0.0
+
+        if self.chute_deploying and chute_deployment < 1.0:
+            chute_rate = 1/self.inputs.chute_deploy_time
+        else:
+            chute_rate = 0.0
+
+        return [vel, accel, mass_rate, drogue_rate, chute_rate]
+
+    def dynamic_press_rate(self, t, y, f):
+        """Time derivative of dynamic pressure, zero at max. Q."""
+
+        alt, vel = y[ALT], y[VEL]
+        density = self.atmosphere.density(alt)
+        density_slope = (self.atmosphere.density(alt + 1.0) - self.atmosphere.density(alt - 1.0))/2.0
+        return 0.5 * density_slope * vel**3 + density * vel * f[VEL]
+
+# - - - - - - - - - - - - - - - - - - - - - - - - - - - -
+#                    APOGEE PREDICTION
+# - - - - - - - - - - - - - - - - - - - - - - - - - - - -
+
+def predict_apogee(model, t, y, h, rtol, atol, max_step, profiler=None):
+    """Apogee reached if the engine shutdown command was sent at (t, y).
+
+       Unlike calcApogeeDelayed, which extrapolates the last two
+       acceleration readings like a flight computer would, this runs
+       the real thrust model through the shutdown delay. A profiler,
+       if given, counts the steps of the prediction."""
+
+    inputs = model.inputs
+    prediction = model.copy()
+    mass_dry = inputs.mass_init - inputs.mass_propellant
+    shutdown_time = t + max(inputs.engine_shutdown_delay, 0.0)
+    apogee = [y[ALT]]
+
+    def engine_off(t, y):
+        prediction.engine_on = False
+        return False
+
+    def reach_apogee(t, y):
+        apogee[0] = y[ALT]
+        return True
+
+    events = [Event("burnout", lambda t, y: y[MASS] - mass_dry, -1, engine_off, active=prediction.engine_on),
+              Event("shutdown", lambda t, y: shutdown_time - t, -1, engine_off, active=prediction.engine_on),
+              Event("apogee", lambda t, y: y[VEL], -1, reach_apogee)]
+
+    if inputs.engine_shutdown_delay <= 0:
+        prediction.engine_on = False
+
+    if y[VEL] <= 0 and not prediction.engine_on:
+        return y[ALT]
+
+    on_step = None
+    if profiler is not None:
+        def on_step(t, y, f):
+            profiler.count("predictor iterations")
+
+    integrate(prediction.deriv, t, list(y), h, events, rtol, atol, max_step, on_step)
+    return apogee[0]
+
+# - - - - - - - - - - - - - - - - - - - - - - - - - - - -
+#                     SIMULATION
+# - - - - - - - - - - - - - - - - - - - - - - - - - - - -
+
+def simulate_adaptive(inputs, step_callback=None, atmosphere=standard_atmosphere, rtol=1e-6, atol=1e-6, max_step=float("inf"), store=None,
+                      profiler=None):
+    """Runs a single trajectory simulation with the adaptive integrator.
+
+       Returns a SimResult like trajectory_core.simulate(), sampled at
+       the accepted steps and at the exact event times. The events are
+       also listed in result.events as (name, time, altitude, velocity).
+       time_increment is only used as the first step size. store and
+       profiler are the same as for simulate()."""
+
+    inputs.validate()
+
+    profiling = profiler is not None
+    if profiling:
+        run_start = perf_counter()
+    # [apogee prediction, step callback] seconds, [predictions]
+    phase_times = [0.0, 0.0]
+    predictions = [0]
+
+    model = FlightModel(inputs, atmosphere)
+    result = SimResult(inputs) if store is None else SimResult(inputs, channels=store)
+
+    alt_init = inputs.alt_init
+    mass_dry = inputs.mass_init - inputs.mass_propellant
+    target_apogee_enabled = inputs.target_apogee_enabled
+
+    # not enough thrust at lift-off!
+    if model.thrust(alt_init) < (atmosphere.gravity(alt_init) * inputs.mass_init):
+        raise InsufficientThrustError("Not enough thrust - vehicle won't lift off.")
+
+    # main chute deployment before main
+    if inputs.drogue_enabled and inputs.chute_enabled and inputs.drogue_deploy_alt <= inputs.chute_deploy_alt:
+        raise ChuteOrderError("Attempt to deploy main chute before drogue!")
+
+    result.isp_min = model.thrust(alt_init)/(inputs.mdot * 9.80665)
+    result.ground_level = alt_init
+    channels = result.channels
+    record_row = channels.append
+    max_Q = [0.0]
+
+    if step_callback is not None:
+        state = FlightState(result)
+
+    def record(t, y, f):
+
+        alt, vel, mass, drogue_deployment, chute_deployment = y
+        thrust = model.thrust(alt)
+        drag, dyn_press = model.drag(alt, vel, drogue_deployment, chute_deployment)
+        gravity = atmosphere.gravity(alt)
+
+        # see results.flight_channels for the order
+        record_row((t, alt, vel, f[VEL], thrust, atmosphere.pressure(alt), gravity, thrust/(inputs.mdot * 9.80665),
+                    drag, dyn_press, drogue_deployment if not model.drogue_released else 0.0, chute_deployment, mass))
+
+        if step_callback is not None:
+            state.time = t
+            state.alt = alt
+            state.alt_g = alt - alt_init
+            state.vel = vel
+            state.accel = f[VEL]
+            state.mass = mass
+            state.drogue_deployment = drogue_deployment
+            state.chute_deployment = chute_deployment
+            state.drogue_released = model.drogue_released
+            state.is_accelerating_up = model.engine_on
+            if profiling:
+                phase_start = perf_counter()
+                step_callback(state)
+                phase_times[1] = phase_times[1] + (perf_counter() - phase_start)
+            else:
+                step_callback(state)
+
+    def log_event(name, t, y):
+        result.events.append((name, t, y[ALT], y[VEL]))
+
+    # - - - EVENT ACTIONS - - -
+
+    def cut_engine(name):
+        def action(t, y):
+            model.engine_on = False
+            log_event(name, t, y)
+            burnout.active = False
+            shutdown.active = False
+            shutdown_command.active = False
+
+            result.tt_max_vel = t
+            result.vel_max = max(channels.max("vel"), y[VEL])
+            result.accel_max = channels.max("accel")
+            result.isp_max = channels.max("isp")
+            result.cutoff_time = t
+            return False
+        return action
+
+    def command_shutdown(t, y):
+        log_event("shutdown_command", t, y)
+        if inputs.engine_shutdown_delay <= 0:
+            return cut_engine("shutdown")(t, y)
+        shutdown_at[0] = t + inputs.engine_shutdown_delay
+        shutdown.active = True
+        return False
+
+    def reach_max_Q(t, y):
+        max_Q[0] = max(max_Q[0], model.drag(y[ALT], y[VEL], y[DROGUE], y[CHUTE])[1])
+        return False
+
+    def reach_apogee(t, y):
+        log_event("apogee", t, y)
+        result.tt_apoapsis = t
+        result.alt_max = y[ALT]
+        result.max_Q = max(max_Q[0], channels.max("dyn_press"))
+        max_Q_event.active = False
+
+        # below the deployment altitude already? deploy right away
+        if inputs.drogue_enabled:
+            if y[ALT] <= inputs.drogue_deploy_alt:
+                deploy_drogue(t, y)
+            else:
+                drogue_deploy.active = True
+        if inputs.chute_enabled:
+            if y[ALT] <= inputs.chute_deploy_alt:
+                deploy_chute(t, y)
+            else:
+                chute_deploy.active = True
+        return False
+
+    def deploy_drogue(t, y):
+        log_event("drogue_deploy", t, y)
+        model.drogue_deploying = True
+        drogue_deployed.active = True
+        return False
+
+    def drogue_full(t, y):
+        log_event("drogue_deployed", t, y)
+        y[DROGUE] = 1.0
+        return False
+
+    def deploy_chute(t, y):
+        log_event("main_deploy", t, y)
+        if inputs.drogue_enabled and not model.drogue_released:
+            model.drogue_released = True
+            y[MASS] = y[MASS] - inputs.drogue_mass
+        model.chute_deploying = True
+        chute_deployed.active = True
+        return False
+
+    def chute_full(t, y):
+        log_event("main_deployed", t, y)
+        y[CHUTE] = 1.0
+        return False
+
+    def impact(t, y):
+        log_event("impact", t, y)
+        result.flight_time = t
+        result.impact_vel = y[VEL]
+        return True
+
+    # - - - PREDICTED APOGEE FOR THE TARGET - - -
+
+    shutdown_at = [None]
+    next_check = [0.0]
+    last_h = [inputs.time_increment]
+
+    if target_apogee_enabled:
+        accel_max = (inputs.mdot * inputs.eev + inputs.exit_area * max(inputs.exit_pressure, 0.0))/mass_dry
+        gravity_min = atmosphere.gravity(max(inputs.target_apogee, alt_init))
+
+    # predicted apogee minus target, only evaluated when it could have
+    # changed sign since the last real evaluation (see apogeeCheckHoldoff)
+    def apogee_margin(t, y):
+        if t < next_check[0]:
+            return -1.0
+        if profiling:
+            phase_start = perf_counter()
+            predicted = predict_apogee(model, t, y, last_h[0], rtol, atol, max_step, profiler)
+            phase_times[0] = phase_times[0] + (perf_counter() - phase_start)
+            predictions[0] = predictions[0] + 1
+        else:
+            predicted = predict_apogee(model, t, y, last_h[0], rtol, atol, max_step)
+        margin = predicted - inputs.target_apogee
+        if margin < 0:
+            next_check[0] = t + apogeeCheckHoldoff(predicted, inputs.target_apogee, y[VEL], accel_max,
+                                                   gravity_min, inputs.engine_shutdown_delay)
+        return margin
+
+    burnout = Event("burnout", lambda t, y: y[MASS] - mass_dry, -1, cut_engine("burnout"))
+    shutdown = Event("shutdown", lambda t, y: shutdown_at[0] - t, -1, cut_engine("shutdown"), active=False)
+    # a preset command time replaces the predictor
+    if inputs.shutdown_command_time >= 0.0:
+        command_margin = lambda t, y: t - inputs.shutdown_command_time
+    else:
+        command_margin = apogee_margin
+
+    shutdown_command = Event("shutdown_command", command_margin, 1, command_shutdown, active=target_apogee_enabled)
+    max_Q_event = Event("max_Q", lambda t, y: model.dynamic_press_rate(t, y, model.deriv(t, y)), -1, reach_max_Q,
+                        active=inputs.drag_enabled, repeat=True)
+    apogee = Event("apogee", lambda t, y: y[VEL], -1, reach_apogee)
+    drogue_deploy = Event("drogue_deploy", lambda t, y: y[ALT] - inputs.drogue_deploy_alt, -1, deploy_drogue, active=False)
+    drogue_deployed = Event("drogue_deployed", lambda t, y: 1.0 - y[DROGUE], -1, drogue_full, active=False)
+    chute_deploy = Event("main_deploy", lambda t, y: y[ALT] - inputs.chute_deploy_alt, -1, deploy_chute, active=False)
+    chute_deployed = Event("main_deployed", lambda t, y: 1.0 - y[CHUTE], -1, chute_full, active=False)
+    ground = Event("impact", lambda t, y: y[ALT] - alt_init, -1, impact)
+
+    events = [burnout, shutdown, shutdown_command, max_Q_event, apogee,
+              drogue_deploy, drogue_deployed, chute_deploy, chute_deployed, ground]
+
+    # keep the last step size around as a starting guess for the predictor
+    def on_step(t, y, f):
+        step = t - channels.last("time")[0]
+        if step > 0:
+            last_h[0] = step
+        record(t, y, f)
+
+    y = [alt_init, 0.0, inputs.mass_init, 0.0, 0.0]
+    record(0.0, y, model.deriv(0.0, y))
+
+    # a command at liftoff has no sign change to detect, the fixed-step
+    # loop gives it on its first step
+    if shutdown_command.active and inputs.shutdown_command_time == 0.0:
+        shutdown_command.active = False
+        command_shutdown(0.0, y)
+
+    integrate(model.deriv, 0.0, y, inputs.time_increment, events, rtol, atol, max_step, on_step)
+
+    channels.finish()
+
+    if profiling:
+        steps = len(channels)
+        profiler.wall_time = perf_counter() - run_start
+        profiler.add("physics", profiler.wall_time - phase_times[0] - phase_times[1], steps)
+        profiler.add("apogee prediction", phase_times[0], predictions[0])
+        if step_callback is not None:
+            profiler.add("step callback", phase_times[1], steps)
+        profiler.count("steps", steps)
+        profiler.count("apogee predictions", predictions[0])
+        result.profile = profiler
+
+    return result
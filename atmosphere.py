@@ -0,0 +1,285 @@
+#   ATMOSPHERE MODEL
+
+# density, pressure, temperature, speed of sound and gravity lookups
+# shared by the simulator, the apogee predictor and the experimental
+# GNC code
+
+# the atmosphere is tabulated once, at a fixed altitude resolution,
+# from the density file and the pressure/temperature formulas. Every
+# lookup is then one table index and a linear interpolation, and
+# lookup() serves all four quantities for the price of one. The
+# tables are cached as .npy files, so later starts just load them.
+
+# the interpolation is not exact: at the default 10 m the pressure,
+# and with it the thrust, is a little off the formula between rows.
+# That moves the demo results by up to 5e-8 relative (the apogee of
+# simple.txt, which flies without drag) against evaluating the
+# formulas on every step, about 1e-10 with resolution=1.0.
+
+# usage: atmosphere = Atmosphere(resolution=5.0)
+#        density, pressure, temperature, speed_of_sound = atmosphere.lookup(altitude)
+
+import hashlib
+import json
+import math
+import os
+
+import numpy as np
+
+# atmospheric density lookup file has values in kg/m^3, with steps of 100 meters
+# retrieved from https://www.digitaldutch.com/atmoscalc/table.htm
+default_model_filename = os.path.join(os.path.dirname(os.path.abspath(__file__)), "data", "atm_density_model.txt")
+
+# tables built from the default density file are cached here
+default_cache_dir = os.path.join(os.path.dirname(os.path.abspath(__file__)), "data", "cache")
+
+# rows of Atmosphere.tables
+table_columns = ("density", "pressure", "temperature", "speed_of_sound")
+DENSITY, PRESSURE, TEMPERATURE, SPEED_OF_SOUND = range(len(table_columns))
+
+# bumped when the way the tables are built changes, so stale cache files aren't used
+table_format = 1
+
+# - - - - - - - - - - - - - - - - - - - - - - - - - - - -
+#                 MODEL FORMULAS
+# - - - - - - - - - - - - - - - - - - - - - - - - - - - -
+
+# these build the tables, the simulator never calls them per step
+
+# https://www.grc.nasa.gov/www/k-12/airplane/atmosmet.html
+def formula_pressure(altitudes):
+    """Typical atmospheric pressure (Pa) at given altitudes (m), NumPy arrays."""
+
+    altitudes = np.asarray(altitudes, dtype=np.float64)
+    temp = -131.21 + 0.00299 * altitudes
+
+    # clamp the base of the power so the unused branch doesn't warn
+    troposphere = 101330 * np.maximum(1-((0.0065 * altitudes)/(288.15)), 0.0)**((9.807)/(286.9 * 0.0065))
+    lower_stratosphere = (22.65 * np.exp(1.73 - 0.000157 * altitudes)) * 1000
+    upper_stratosphere = (2.488 * (np.maximum(temp + 273.1, 1e-9)/(216.6))**(-11.388)) * 1000
+
+    return np.where(altitudes < 11000, troposphere,
+                    np.where(altitudes < 25000, lower_stratosphere, upper_stratosphere))
+
+def formula_temperature(altitudes):
+    """Typical air temperature (K) at given altitudes (m), same model as formula_pressure()."""
+
+    altitudes = np.asarray(altitudes, dtype=np.float64)
+    celsius = np.where(altitudes < 11000, 15.04 - 0.00649 * altitudes,
+                       np.where(altitudes < 25000, -56.46, -131.21 + 0.00299 * altitudes))
+    return celsius + 273.15
+
+def formula_speed_of_sound(temperatures):
+    """Speed of sound (m/s) in dry air at given temperatures (K)."""
+    return np.sqrt(1.4 * 287.05 * np.asarray(temperatures, dtype=np.float64))
+
+def file_density(density_table, altitudes, step=100.0):
+    """Density (kg/m^3) at given altitudes (m) from a table with rows every step meters.
+
+       Interpolated linearly inside the table. Above it the density
+       falls off exponentially, with the scale height of the last two
+       rows, instead of dropping to zero."""
+
+    altitudes = np.asarray(altitudes, dtype=np.float64)
+    data_top = (len(density_table) - 1) * step
+    inside = np.interp(altitudes, np.arange(len(density_table)) * step, density_table)
+
+    scale_height = step/math.log(density_table[-2]/density_table[-1])
+    above = density_table[-1] * np.exp(-(np.maximum(altitudes, data_top) - data_top)/scale_height)
+
+    return np.where(altitudes > data_top, above, inside)
+
+# - - - - - - - - - - - - - - - - - - - - - - - - - - - -
+#                   ATMOSPHERE
+# - - - - - - - - - - - - - - - - - - - - - - - - - - - -
+
+class Atmosphere:
+    """Earth atmosphere and gravity model.
+
+       Density, pressure, temperature and speed of sound are
+       tabulated every resolution meters from sea level up to top,
+       below and above that the first and last rows are used.
+       Scalar lookups are meant for the timestep loops, the *_array
+       variants evaluate whole NumPy arrays of altitudes at once.
+       Gravity is a plain formula, it is cheaper than a lookup.
+
+       If cache_dir is given (None turns caching off), the tables
+       are saved there on the first use of a model and resolution
+       and loaded from there afterwards."""
+
+    # spacing of the density file rows (m)
+    step = 100.0
+
+    def __init__(self, model_filename=default_model_filename, resolution=10.0, top=200000.0, cache_dir=default_cache_dir):
+
+        # file extension check for user convenience
+        if not model_filename.endswith(".txt"):
+            model_filename += ".txt"
+
+        if not resolution > 0:
+            raise ValueError("Atmosphere table resolution must be positive.")
+
+        self.model_filename = model_filename
+        self.resolution = float(resolution)
+        self.top = float(top)
+
+        with open(model_filename, "rb") as model_file:
+            model_bytes = model_file.read()
+        self.density_table = np.ascontiguousarray(np.loadtxt(model_filename, dtype=np.float64))
+
+        # identifies the tables, for the cache file name and the result cache
+        self.digest = hashlib.sha256(model_bytes + json.dumps([table_format, self.resolution, self.top]).encode()).hexdigest()
+
+        self.tables = None
+        cache_path = None
+        if cache_dir is not None:
+            cache_path = os.path.join(cache_dir, "atmosphere-" + self.digest[:16] + ".npy")
+            self.tables = self._load_tables(cache_path)
+
+        if self.tables is None:
+            self.tables = self._build_tables()
+            if cache_path is not None:
+                self._save_tables(cache_path)
+
+        # the scalar lookups index a list of rows, that is much faster
+        # than indexing a NumPy array in scalar code. Each row holds
+        # the values and their differences to the next row, so an
+        # interpolation is a single multiply-add per quantity.
+        values = self.tables.tolist()
+        differences = np.diff(self.tables, axis=1, append=self.tables[:, -1:]).tolist()
+        self._rows = list(zip(values[0], differences[0], values[1], differences[1],
+                              values[2], differences[2], values[3], differences[3]))
+        self._last = len(self._rows) - 1
+
+    def _build_tables(self):
+
+        altitudes = np.arange(int(round(self.top/self.resolution)) + 1) * self.resolution
+        temperature = formula_temperature(altitudes)
+
+        return np.ascontiguousarray(np.stack([file_density(self.density_table, altitudes, self.step),
+                                              formula_pressure(altitudes),
+                                              temperature,
+                                              formula_speed_of_sound(temperature)]))
+
+    def _load_tables(self, path):
+
+        try:
+            tables = np.load(path)
+        except (OSError, ValueError):
+            return None
+
+        if tables.shape != (len(table_columns), int(round(self.top/self.resolution)) + 1) or tables.dtype != np.float64:
+            return None
+        return tables
+
+    def _save_tables(self, path):
+
+        # the cache only saves time, a read-only directory is no error
+        try:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+
+            # written under a temporary name first, so another process
+            # never loads a half-written file
+            temporary = path + "." + str(os.getpid()) + ".tmp"
+            with open(temporary, "wb") as cache_file:
+                np.save(cache_file, self.tables)
+            os.replace(temporary, path)
+        except OSError:
+            pass
+
+    # - - - SCALAR LOOKUPS - - -
+
+    def lookup(self, altitude):
+        """Returns (density (kg/m^3), pressure (Pa), temperature (K), speed of sound (m/s)) at given altitude (m)."""
+
+        position = altitude/self.resolution
+        if position <= 0:
+            row = self._rows[0]
+            return row[0], row[2], row[4], row[6]
+
+        index = int(position)
+        if index >= self._last:
+            row = self._rows[self._last]
+            return row[0], row[2], row[4], row[6]
+
+        density, density_step, pressure, pressure_step, temperature, temperature_step, sound, sound_step = self._rows[index]
+        fraction = position - index
+        return (density + density_step * fraction, pressure + pressure_step * fraction,
+                temperature + temperature_step * fraction, sound + sound_step * fraction)
+
+    def density(self, altitude):
+        """Returns atmospheric density (kg/m^3) at given altitude (m)."""
+
+        position = altitude/self.resolution
+        if position <= 0:
+            return self._rows[0][0]
+
+        index = int(position)
+        if index >= self._last:
+            return self._rows[self._last][0]
+
+        row = self._rows[index]
+        return row[0] + row[1] * (position - index)
+
+    def pressure(self, altitude):
+        """Returns typical atmospheric pressure (Pa) at given altitude (m)."""
+
+        position = altitude/self.resolution
+        if position <= 0:
+            return self._rows[0][2]
+
+        index = int(position)
+        if index >= self._last:
+            return self._rows[self._last][2]
+
+        row = self._rows[index]
+        return row[2] + row[3] * (position - index)
+
+    def temperature(self, altitude):
+        """Returns typical air temperature (K) at given altitude (m)."""
+        return self.lookup(altitude)[TEMPERATURE]
+
+    def speed_of_sound(self, altitude):
+        """Returns the speed of sound (m/s) at given altitude (m)."""
+        return self.lookup(altitude)[SPEED_OF_SOUND]
+
+    def gravity(self, altitude):
+        """Returns gravitational acceleration (m/s^2) at given altitude (m)."""
+        return 9.80665 * (6369000/(6369000+altitude))**2
+
+    # - - - ARRAY LOOKUPS - - -
+
+    def _interpolate_array(self, altitudes, rows):
+
+        position = np.clip(np.asarray(altitudes, dtype=np.float64)/self.resolution, 0.0, self._last)
+        index = np.minimum(position.astype(np.intp), self._last - 1)
+
+        low = self.tables[rows, index]
+        high = self.tables[rows, index + 1]
+        return low + (high - low) * (position - index)
+
+    def lookup_array(self, altitudes):
+        """Vectorized lookup(), returns an array with a row per table_columns entry."""
+        return self._interpolate_array(altitudes, slice(None))
+
+    def density_array(self, altitudes):
+        """Vectorized density(), takes and returns NumPy arrays."""
+        return self._interpolate_array(altitudes, DENSITY)
+
+    def pressure_array(self, altitudes):
+        """Vectorized pressure(), takes and returns NumPy arrays."""
+        return self._interpolate_array(altitudes, PRESSURE)
+
+    def temperature_array(self, altitudes):
+        """Vectorized temperature(), takes and returns NumPy arrays."""
+        return self._interpolate_array(altitudes, TEMPERATURE)
+
+    def speed_of_sound_array(self, altitudes):
+        """Vectorized speed_of_sound(), takes and returns NumPy arrays."""
+        return self._interpolate_array(altitudes, SPEED_OF_SOUND)
+
+    def gravity_array(self, altitudes):
+        """Vectorized gravity(), takes and returns NumPy arrays."""
+
+        altitudes = np.asarray(altitudes, dtype=np.float64)
+        return 9.80665 * (6369000/(6369000+altitudes))**2
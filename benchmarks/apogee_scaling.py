@@ -0,0 +1,71 @@
+#   APOGEE TARGET SCALING BENCHMARK
+
+# compares the cost of an apogee-targeted run when the predictor is
+# polled on every boost timestep (the old behaviour) with the default
+# bounded polling, for a range of time increments
+
+# usage: python benchmarks/apogee_scaling.py [--exhaustive-limit 0.005]
+
+import argparse
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+import trajectory_core
+from trajectory_core import SimInputs, simulate
+
+# same vehicle as demo_saves/apogee_target.txt
+def demo_inputs(time_increment):
+    return SimInputs(eev=2250.0, mdot=4.0, mass_init=200.0, mass_propellant=100.0, alt_init=900.0,
+                     exit_pressure=90000.0, exit_area=0.0055, time_increment=time_increment,
+                     drag_enabled=True, cross_sec=0.1, drag_coeff=0.5,
+                     target_apogee_enabled=True, target_apogee=10000.0, engine_shutdown_delay=1.2,
+                     drogue_enabled=True, drogue_deploy_alt=15000.0, drogue_deploy_time=5.0,
+                     drogue_area=0.25, drogue_coeff=1.0, drogue_mass=10.0,
+                     chute_enabled=True, chute_deploy_alt=1750.0, chute_deploy_time=5.0,
+                     chute_area=2.0, chute_coeff=2.0)
+
+# runs one simulation, returns (result, wall time, number of apogee predictions)
+def timed_run(inputs, exhaustive):
+
+    predictor = trajectory_core.predictApogeeDelayed
+    calls = [0]
+
+    def counting_predictor(*args):
+        calls[0] += 1
+        return predictor(*args)
+
+    trajectory_core.predictApogeeDelayed = counting_predictor
+    try:
+        start = time.perf_counter()
+        result = simulate(inputs, exhaustive_apogee_check=exhaustive)
+        wall = time.perf_counter() - start
+    finally:
+        trajectory_core.predictApogeeDelayed = predictor
+
+    return result, wall, calls[0]
+
+def main():
+
+    parser = argparse.ArgumentParser(description="Apogee prediction cost versus time increment.")
+    parser.add_argument("--increments", type=float, nargs="+", default=[0.05, 0.02, 0.01, 0.005, 0.002, 0.001])
+    parser.add_argument("--exhaustive-limit", type=float, default=0.005,
+                        help="smallest time increment to also run the O(n^2) every-step polling for")
+    args = parser.parse_args()
+
+    print("%-8s %10s %10s %10s %12s %12s %10s" % ("dt (s)", "steps", "checks", "old checks", "time (s)", "old time (s)", "same"))
+
+    for time_increment in args.increments:
+        inputs = demo_inputs(time_increment)
+        result, wall, calls = timed_run(inputs, exhaustive=False)
+
+        if time_increment >= args.exhaustive_limit:
+            old_result, old_wall, old_calls = timed_run(inputs, exhaustive=True)
+            same = (old_result.cutoff_time == result.cutoff_time and old_result.alt_max == result.alt_max)
+            print("%-8g %10d %10d %10d %12.3f %12.3f %10s" % (time_increment, len(result.channels), calls, old_calls, wall, old_wall, same))
+        else:
+            print("%-8g %10d %10d %10s %12.3f %12s %10s" % (time_increment, len(result.channels), calls, "-", wall, "-", "-"))
+
+if __name__ == "__main__":
+    main()
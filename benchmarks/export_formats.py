@@ -0,0 +1,52 @@
+#   EXPORT FORMAT BENCHMARK
+
+# times every exporter on the same run, including the one sheet per
+# quantity .xlsx layout the GUI has always written
+
+# usage: python benchmarks/export_formats.py [--time-increment 0.001] [--skip-xlsx]
+
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from trajectory_core import simulate
+from exporters import export_result, export_extensions, ExportError
+from apogee_scaling import demo_inputs
+
+def main():
+
+    parser = argparse.ArgumentParser(description="Export time per file format.")
+    parser.add_argument("--time-increment", type=float, default=0.01)
+    parser.add_argument("--skip-xlsx", action="store_true", help="leave out the (slow) xlsx export")
+    args = parser.parse_args()
+
+    result = simulate(demo_inputs(args.time_increment))
+    print("%d rows, %d columns in memory: %.1f MB" % (len(result.channels), len(result.channels.channels),
+                                                     result.channels.nbytes/1e6))
+
+    # xlsx first, it is the reference
+    extensions = [e for e in export_extensions if e not in (".xlsx", ".hdf5")]
+    if not args.skip_xlsx:
+        extensions.insert(0, ".xlsx")
+    timings = {}
+
+    print("%-10s %12s %12s %10s" % ("format", "time (s)", "size (MB)", "vs xlsx"))
+    with tempfile.TemporaryDirectory() as directory:
+        for extension in extensions:
+            filepath = os.path.join(directory, "export" + extension)
+            try:
+                start = time.perf_counter()
+                export_result(result, filepath)
+                timings[extension] = time.perf_counter() - start
+            except ExportError as e:
+                print("%-10s %s" % (extension, e))
+                continue
+
+            speedup = "%9.1fx" % (timings[".xlsx"]/timings[extension]) if ".xlsx" in timings else "-"
+            print("%-10s %12.3f %12.2f %10s" % (extension, timings[extension], os.path.getsize(filepath)/1e6, speedup))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,107 @@
+#   GNC PREDICTOR LATENCY CHECK
+
+# replays the boost of a simulated flight through the experimental
+# GNC predictors at a fixed cycle rate: check_shutdown() (integrates
+# to apoapsis every cycle) against ApoapsisPredictor (hard budget per
+# cycle, warm-started). Reports the latency per cycle, how far the
+# budgeted predictions are from the full ones, and the cycle each
+# would command the shutdown on
+
+# usage: python benchmarks/gnc_predictor.py [save] [--rate 50] [--budget 0.005]
+
+import argparse
+import math
+import os
+import sys
+import time
+from dataclasses import replace
+
+root = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+sys.path.insert(0, root)
+sys.path.insert(0, os.path.join(root, "experiment"))
+import numpy as np
+
+import GNC_vx1
+from savefile import read_save_file
+from trajectory_core import simulate, standard_atmosphere
+
+def boost_states(inputs, rate):
+    """(alt, vel, mass) every 1/rate seconds of the boost, flown without apogee targeting."""
+
+    inputs = replace(inputs, target_apogee_enabled=False, time_increment=0.001)
+    channels = simulate(inputs).channels
+    stride = int(round(1/(rate * inputs.time_increment)))
+
+    boost = np.flatnonzero(channels["thrust"] > 0)
+    rows = range(int(boost[0]), int(boost[-1]) + 1, stride)
+    return [(float(channels["alt"][i]), float(channels["vel"][i]), float(channels["mass"][i])) for i in rows]
+
+def percentile(values, share):
+    return float(np.percentile(values, share)) if values else math.nan
+
+def main():
+
+    parser = argparse.ArgumentParser(description="Latency and accuracy of the budgeted GNC apoapsis predictor.")
+    parser.add_argument("save", nargs="?", default=os.path.join(root, "demo_saves", "apogee_target.txt"))
+    parser.add_argument("--rate", type=float, default=50.0, help="GNC cycles per second")
+    parser.add_argument("--budget", type=float, default=None, help="predictor budget per cycle (s), default a quarter cycle")
+    args = parser.parse_args()
+
+    inputs = read_save_file(args.save)[0]
+    budget = args.budget if args.budget is not None else 0.25/args.rate
+
+    mdot = inputs.mdot
+    m_final = inputs.mass_init - inputs.mass_propellant
+    F_exp = inputs.mdot * inputs.eev
+    # the GNC always applies drag
+    c_drag = inputs.drag_coeff if inputs.drag_enabled else 0.0
+    vehicle = (inputs.cross_sec, c_drag, inputs.engine_shutdown_delay, F_exp, standard_atmosphere)
+
+    predictor = GNC_vx1.ApoapsisPredictor(mdot, m_final, inputs.cross_sec, c_drag, inputs.engine_shutdown_delay,
+                                          F_exp, standard_atmosphere, budget=budget)
+
+    full_times = []
+    times = []
+    errors = []
+    bound_misses = 0
+    full_shutdown = None
+    shutdown = None
+
+    states = boost_states(inputs, args.rate)
+    for cycle, (a, v, m) in enumerate(states):
+
+        start = time.perf_counter()
+        full_command, full_apoapsis = GNC_vx1.check_shutdown(a, v, m, mdot, m_final, inputs.target_apogee, *vehicle)
+        full_times.append(time.perf_counter() - start)
+
+        start = time.perf_counter()
+        command, apoapsis, confident = GNC_vx1.check_shutdown_budgeted(predictor, a, v, m, inputs.target_apogee)
+        times.append(time.perf_counter() - start)
+
+        if confident:
+            errors.append(apoapsis - full_apoapsis)
+        elif apoapsis < full_apoapsis:
+            bound_misses += 1
+
+        if full_command and full_shutdown is None:
+            full_shutdown = cycle
+        if command and shutdown is None:
+            shutdown = cycle
+
+    cycle_time = 1/args.rate
+    print("%s, %d boost cycles at %g Hz, budget %.2f ms\n" % (os.path.basename(args.save), len(states), args.rate, budget * 1e3))
+    print("%-22s %10s %10s %10s %10s %10s" % ("latency (ms)", "mean", "p50", "p99", "max", "overruns"))
+    for name, values in (("check_shutdown", full_times), ("ApoapsisPredictor", times)):
+        print("%-22s %10.3f %10.3f %10.3f %10.3f %10d" % (name, 1e3 * float(np.mean(values)), 1e3 * percentile(values, 50),
+                                                        1e3 * percentile(values, 99), 1e3 * max(values),
+                                                        sum(value > cycle_time for value in values)))
+
+    print("\npredictions: %d full, %d spliced, %d upper bounds (%d below the full prediction)"
+          % (predictor.full_predictions, predictor.spliced_predictions, predictor.bounds, bound_misses))
+    if errors:
+        print("confident prediction - full prediction: mean %+.3f m, p99 %.3f m, worst %+.3f m"
+              % (float(np.mean(errors)), percentile([abs(error) for error in errors], 99), max(errors, key=abs)))
+    print("shutdown commanded on cycle %s (check_shutdown: %s)" % (shutdown, full_shutdown))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,124 @@
+#   COMPILED KERNEL PARITY AND SPEED CHECK
+
+# flies the demo saves with trajectory_core.simulate() and with the
+# Numba kernel of jit_kernel.py, checks that every channel and summary
+# value agrees within a relative tolerance and reports the speedups,
+# both for the whole run and for the physics alone (the kernel's
+# counting flight, which records nothing)
+
+# usage: python benchmarks/jit_parity.py [--increments 0.01 0.001] [--rtol 1e-9]
+
+import argparse
+import glob
+import math
+import os
+import random
+import sys
+import time
+from dataclasses import replace
+
+import numpy as np
+
+root = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+sys.path.insert(0, root)
+import jit_kernel
+from jit_kernel import simulate_jit, predict_apogee_delayed
+from results import flight_channels
+from savefile import read_save_file
+from trajectory_core import simulate, predictApogeeDelayed
+
+def relative_error(expected, actual):
+
+    expected = np.asarray(expected, dtype=np.float64)
+    actual = np.asarray(actual, dtype=np.float64)
+    return float(np.max(np.abs(actual - expected)/np.maximum(np.abs(expected), 1e-12), initial=0.0))
+
+def best_time(function, repeat):
+
+    best = math.inf
+    for i in range(repeat):
+        start = time.perf_counter()
+        function()
+        best = min(best, time.perf_counter() - start)
+    return best
+
+def physics_time(inputs, repeat):
+    """Time of the kernel's counting flight (no table), the physics-only path."""
+
+    arguments = jit_kernel.kernel_arguments(inputs)
+    return best_time(lambda: jit_kernel._fly(*arguments, np.empty((len(flight_channels), 0))), repeat)
+
+def check_run(inputs, rtol, repeat):
+    """Returns (worst relative error, Python time, kernel time, physics-only time)."""
+
+    expected = simulate(inputs)
+    actual = simulate_jit(inputs)
+
+    if len(expected.channels) != len(actual.channels):
+        return math.inf, 0.0, 0.0, 0.0
+
+    errors = [relative_error(expected.channels[name], actual.channels[name]) for name in flight_channels]
+    for name in jit_kernel.kernel_outputs:
+        value, kernel_value = getattr(expected, name), getattr(actual, name)
+        if (value is None) != (kernel_value is None):
+            return math.inf, 0.0, 0.0, 0.0
+        if value is not None:
+            errors.append(relative_error(value, kernel_value))
+
+    python_time = best_time(lambda: simulate(inputs), 1)
+    kernel_time = best_time(lambda: simulate_jit(inputs), repeat)
+    return max(errors), python_time, kernel_time, physics_time(inputs, repeat)
+
+def check_predictor(base, samples, seed=1):
+    """Worst relative error of the compiled apogee predictor over random boost states."""
+
+    rng = random.Random(seed)
+    worst = 0.0
+    for i in range(samples):
+        # the acceleration changes by a fraction of a m/s^2 per step in a real boost
+        accel = rng.uniform(0.0, 40.0)
+        arguments = (rng.uniform(0.0, 30000.0), rng.uniform(0.0, 1500.0), rng.uniform(base.mass_init - base.mass_propellant, base.mass_init),
+                     rng.random() < 0.8, 0.1, 0.5, base.time_increment, [accel, accel + rng.uniform(-0.05, 0.05)],
+                     rng.choice([0.0, 1.2, 3.0]), base.mdot)
+        worst = max(worst, relative_error(predictApogeeDelayed(*arguments), predict_apogee_delayed(*arguments)))
+    return worst
+
+def main():
+
+    parser = argparse.ArgumentParser(description="Parity and speed of the compiled step kernel against the Python loop.")
+    parser.add_argument("saves", nargs="*", default=sorted(glob.glob(os.path.join(root, "demo_saves", "*.txt"))))
+    parser.add_argument("--increments", type=float, nargs="+", default=[0.01, 0.001])
+    parser.add_argument("--rtol", type=float, default=1e-9, help="largest relative difference accepted")
+    parser.add_argument("--repeat", type=int, default=3, help="kernel runs per case, the fastest is reported")
+    args = parser.parse_args()
+
+    if not jit_kernel.jit_available:
+        print("Numba is not installed, simulate_jit() falls back to trajectory_core.simulate().")
+        return
+
+    # compile (or load the cached machine code) before timing anything
+    start = time.perf_counter()
+    simulate_jit(read_save_file(args.saves[0])[0])
+    print("kernel ready in %.2f s\n" % (time.perf_counter() - start))
+
+    print("%-20s %-8s %10s %10s %10s %11s %9s %9s" % ("save", "dt (s)", "rel. err", "python (s)", "kernel (s)", "physics (s)", "speedup", "physics"))
+
+    failed = False
+    for path in args.saves:
+        base = read_save_file(path)[0]
+        for time_increment in args.increments:
+            inputs = replace(base, time_increment=time_increment)
+            error, python_time, kernel_time, physics = check_run(inputs, args.rtol, args.repeat)
+            failed = failed or not error <= args.rtol
+            print("%-20s %-8g %10.1e %10.3f %10.4f %11.4f %8.0fx %8.0fx" % (os.path.basename(path), time_increment, error, python_time,
+                                                                      kernel_time, physics, python_time/kernel_time, python_time/physics))
+
+    error = check_predictor(base, 200)
+    failed = failed or not error <= args.rtol
+    print("\napogee predictor, 200 random states: rel. err %.1e" % error)
+
+    print("\nPARITY " + ("FAILED" if failed else "OK") + " (rtol %g)" % args.rtol)
+    sys.exit(1 if failed else 0)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,132 @@
+#   NATIVE PREDICTOR PARITY AND SPEED CHECK
+
+# runs the apogee predictor (predictApogeeDelayed) and the GNC apoapsis
+# check (GNC_vx1.check_shutdown) on states along a simulated boost, in
+# Python and on the native library in double and in float. Reports how
+# far each native result is from Python (double should agree to the
+# last few bits, float shows the divergence of the flight computer
+# precision), how often the shutdown decision flips, and the time per
+# call. Exits with 1 if a double result is off by more than --rtol or
+# flips a shutdown decision. Without the library it checks that the
+# Python fallback gives the Python results.
+
+# usage: python native_predictor.py --build  (once, from the repo root)
+#        python benchmarks/native_predictor.py [save] [--states 200] [--rtol 1e-9] [--fallback]
+
+import argparse
+import os
+import sys
+import time
+from dataclasses import replace
+
+root = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+sys.path.insert(0, root)
+sys.path.insert(0, os.path.join(root, "experiment"))
+import numpy as np
+
+import GNC_vx1
+import native_predictor
+from savefile import read_save_file
+from trajectory_core import simulate, predictApogeeDelayed, standard_atmosphere
+
+def boost_states(inputs, count):
+    """count (alt, vel, mass, prev_accel, accel) spread over the boost, flown without apogee targeting."""
+
+    channels = simulate(replace(inputs, target_apogee_enabled=False)).channels
+    boost = np.flatnonzero(channels["thrust"] > 0)
+    # the simulator starts checking on the third step, before that the
+    # acceleration trend is the jump from the pad
+    rows = np.unique(np.linspace(max(int(boost[0]), 3), int(boost[-1]), count).astype(int))
+    return [(float(channels["alt"][i]), float(channels["vel"][i]), float(channels["mass"][i]),
+             float(channels["accel"][i - 1]), float(channels["accel"][i])) for i in rows.tolist()]
+
+def timed(function, calls):
+    """(results, seconds per call) of the given argument-less calls."""
+
+    results = []
+    start = time.perf_counter()
+    for call in calls:
+        results.append(function(call))
+    return results, (time.perf_counter() - start)/len(calls)
+
+def compare(name, reference, results, decisions_reference, decisions, seconds, reference_seconds):
+    """Prints a table row, returns (worst relative difference, decision flips)."""
+
+    reference = np.array(reference, dtype=np.float64)
+    differences = np.abs(np.array(results, dtype=np.float64) - reference)
+    identical = int((differences == 0).sum())
+    relative = float(np.max(differences/np.maximum(np.abs(reference), 1e-12), initial=0.0))
+    flips = sum(a != b for a, b in zip(decisions_reference, decisions))
+    print("%-26s %10d %12.3g %12.3g %10.1e %8d %10.1f %8.1fx" % (name, identical, differences.max(), differences.mean(), relative,
+                                                               flips, 1e6 * seconds, reference_seconds/seconds))
+    return relative, flips
+
+def main():
+
+    parser = argparse.ArgumentParser(description="Parity and speed of the native apogee predictors against Python.")
+    parser.add_argument("save", nargs="?", default=os.path.join(root, "demo_saves", "apogee_target.txt"))
+    parser.add_argument("--states", type=int, default=200, help="boost states to predict from")
+    parser.add_argument("--rtol", type=float, default=1e-9, help="largest relative difference accepted in double")
+    parser.add_argument("--fallback", action="store_true", help="check the Python fallback even if the library is built")
+    args = parser.parse_args()
+
+    if args.fallback:
+        native_predictor.native_available = False
+    if native_predictor.native_available:
+        precisions = [("native double", "double"), ("native single", "single")]
+    else:
+        print("The native predictor is not built (python native_predictor.py --build), checking the Python fallback.\n")
+        precisions = [("Python fallback", "double")]
+
+    inputs = read_save_file(args.save)[0]
+    states = boost_states(inputs, args.states)
+    target = inputs.target_apogee if inputs.target_apogee_enabled else float(np.median([state[0] for state in states]))
+    atmosphere = standard_atmosphere
+
+    print("%s, %d boost states, target %.1f m\n" % (os.path.basename(args.save), len(states), target))
+    header = "%-26s %10s %12s %12s %10s %8s %10s %9s" % ("", "identical", "max diff (m)", "mean diff", "rel. diff", "flips",
+                                                         "us/call", "speedup")
+
+    # float is only reported, double has to match Python
+    failed = False
+    def check(precision, relative, flips):
+        return precision == "double" and not (relative <= args.rtol and flips == 0)
+
+    # - - - apogee predictor - - -
+
+    vehicle = (inputs.drag_enabled, inputs.cross_sec, inputs.drag_coeff, inputs.time_increment)
+    tail = (inputs.engine_shutdown_delay, inputs.mdot, atmosphere)
+
+    reference, python_seconds = timed(lambda s: predictApogeeDelayed(s[0], s[1], s[2], *vehicle, [s[3], s[4]], *tail), states)
+    print("predictApogeeDelayed: Python %.1f us/call" % (1e6 * python_seconds))
+    print(header)
+    for name, precision in precisions:
+        results, seconds = timed(lambda s: native_predictor.predict_apogee_delayed(s[0], s[1], s[2], *vehicle, [s[3], s[4]], *tail,
+                                                                                  precision=precision), states)
+        relative, flips = compare(name, reference, results, [value >= target for value in reference],
+                                  [value >= target for value in results], seconds, python_seconds)
+        failed = check(precision, relative, flips) or failed
+
+    # - - - GNC apoapsis check - - -
+
+    # the GNC always applies drag
+    c_drag = inputs.drag_coeff if inputs.drag_enabled else 0.0
+    gnc_vehicle = (inputs.mdot, inputs.mass_init - inputs.mass_propellant, target, inputs.cross_sec, c_drag,
+                   inputs.engine_shutdown_delay, inputs.mdot * inputs.eev, atmosphere)
+
+    reference, python_seconds = timed(lambda s: GNC_vx1.check_shutdown(s[0], s[1], s[2], *gnc_vehicle), states)
+    print("\nGNC_vx1.check_shutdown: Python %.1f us/call" % (1e6 * python_seconds))
+    print(header)
+    for name, precision in precisions:
+        results, seconds = timed(lambda s: native_predictor.check_shutdown(s[0], s[1], s[2], *gnc_vehicle, precision=precision),
+                                 states)
+        relative, flips = compare(name, [apoapsis for shutdown, apoapsis in reference], [apoapsis for shutdown, apoapsis in results],
+                                  [shutdown for shutdown, apoapsis in reference], [shutdown for shutdown, apoapsis in results],
+                                  seconds, python_seconds)
+        failed = check(precision, relative, flips) or failed
+
+    print("\nPARITY " + ("FAILED" if failed else "OK") + " (double, rtol %g, no flips)" % args.rtol)
+    sys.exit(1 if failed else 0)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,63 @@
+#   OPTIMIZER CONSTRAINT BOUNDARY CHECK
+
+# runs the example search of optimizer.py (least propellant of
+# simple.txt that still reaches 60 km) with several seeds and checks
+# that every one lands within one step of the constraint boundary.
+# The boundary itself is found by bisection on direct simulate() runs,
+# the apogee only grows with the propellant. Exits with 1 if a seed
+# misses it or stops on an infeasible design.
+
+# usage: python benchmarks/optimizer_boundary.py [--seeds 1 2 3 4 5] [--step 0.1]
+
+import argparse
+import os
+import sys
+from dataclasses import replace
+
+root = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+sys.path.insert(0, root)
+from optimizer import Constraint, Variable, optimize
+from savefile import read_save_file
+from trajectory_core import simulate
+
+def boundary(base, low, high, apogee, tolerance=1e-4):
+    """Least mass_propellant between low and high whose apogee reaches the given one."""
+
+    while high - low > tolerance:
+        middle = 0.5 * (low + high)
+        if simulate(replace(base, mass_propellant=middle)).alt_max >= apogee:
+            high = middle
+        else:
+            low = middle
+    return high
+
+def main():
+
+    parser = argparse.ArgumentParser(description="Checks that the optimizer finds the constraint boundary of its example search.")
+    parser.add_argument("save", nargs="?", default=os.path.join(root, "demo_saves", "simple.txt"))
+    parser.add_argument("--seeds", type=int, nargs="+", default=[1, 2, 3, 4, 5])
+    parser.add_argument("--step", type=float, default=0.1, help="propellant step of the search (kg)")
+    parser.add_argument("--apogee", type=float, default=60000.0, help="least apogee (m)")
+    args = parser.parse_args()
+
+    base = read_save_file(args.save)[0]
+    low, high = 40.0, 100.0
+    exact = boundary(base, low, high, args.apogee)
+    print("%s: least propellant for %.0f m is %.4f kg\n" % (os.path.basename(args.save), args.apogee, exact))
+    print("%6s %14s %12s %9s %12s %9s" % ("seed", "found (kg)", "error (kg)", "feasible", "generations", "flown"))
+
+    failed = False
+    for seed in args.seeds:
+        result = optimize(base, {"mass_propellant": Variable(low, high, args.step)}, "mass_propellant",
+                          [Constraint("alt_max", lower=args.apogee)], seed=seed)
+        found = result.best["mass_propellant"]
+        missed = not result.feasible or abs(found - exact) > args.step
+        failed = failed or missed
+        print("%6d %14.4f %+12.4f %9s %12d %9d%s" % (seed, found, found - exact, result.feasible, len(result.log),
+                                                    result.evaluations, "  MISSED" if missed else ""))
+
+    print("\nBOUNDARY " + ("MISSED" if failed else "OK") + " (within %g kg)" % args.step)
+    sys.exit(1 if failed else 0)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,297 @@
+#   BENCHMARK SUITE
+
+# times the hot paths of the simulator the same way every time and
+# saves the numbers as JSON, so two versions (or two machines) can be
+# compared: full headless runs of the demo saves, the atmosphere
+# lookups, the apogee predictor, the experimental GNC predictor and
+# the export of a large run
+
+# every benchmark is called in a loop long enough to time reliably
+# (at least --min-time seconds), that loop is repeated and the
+# fastest repeat counts, the others only show the spread
+
+# usage: python benchmarks/suite.py --output before.json
+#        python benchmarks/suite.py --output after.json --compare before.json
+#        python benchmarks/suite.py --filter run/ --quick
+
+import argparse
+import functools
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from dataclasses import replace
+
+root = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+sys.path.insert(0, root)
+sys.path.insert(0, os.path.join(root, "experiment"))
+import numpy as np
+
+import trajectory_core
+from trajectory_core import simulate, calcApogeeDelayed, standard_atmosphere
+from savefile import read_save_file
+from exporters import export_result, ExportError
+
+suite_format = "trajectorysim-benchmarks"
+
+# bumped when the JSON layout changes
+suite_format_version = 1
+
+# a result this much slower (or faster) than the baseline is flagged
+default_threshold = 1.10
+
+demo_saves = ["simple", "apogee_target"]
+run_increments = [0.01, 0.005, 0.001]
+
+# - - - - - - - - - - - - - - - - - - - - - - - - - - - -
+#                 BENCHMARKS
+# - - - - - - - - - - - - - - - - - - - - - - - - - - - -
+
+# every benchmark is (name, setup), setup does the untimed preparation
+# and returns the function to time, which takes no arguments
+
+def demo_inputs(name, time_increment=None):
+
+    inputs = read_save_file(os.path.join(root, "demo_saves", name + ".txt"))[0]
+    if time_increment is not None:
+        inputs = replace(inputs, time_increment=time_increment)
+    return inputs
+
+def setup_run(name, time_increment):
+
+    inputs = demo_inputs(name, time_increment)
+    return lambda: simulate(inputs)
+
+def setup_lookup(lookup):
+
+    # every 10 m from below the pad to above the density file data
+    altitudes = np.arange(-500.0, 90000.0, 10.0).tolist()
+
+    def run():
+        for altitude in altitudes:
+            lookup(altitude)
+    return run
+
+def setup_jit_run(name, time_increment):
+
+    import jit_kernel
+    if not jit_kernel.jit_available:
+        raise ImportError("Numba is not installed")
+
+    inputs = demo_inputs(name, time_increment)
+    # the first call compiles, or loads the cached machine code
+    jit_kernel.simulate_jit(inputs)
+    return lambda: jit_kernel.simulate_jit(inputs)
+
+@functools.lru_cache()
+def boost_state():
+    """(alt, vel, mass, [accel before, accel], inputs) of the apogee target demo, 5 s into the boost."""
+
+    inputs = demo_inputs("apogee_target")
+    channels = simulate(inputs).channels
+    i = int(round(5.0/inputs.time_increment))
+    return (float(channels["alt"][i]), float(channels["vel"][i]), float(channels["mass"][i]),
+            [float(channels["accel"][i - 1]), float(channels["accel"][i])], inputs)
+
+def setup_predictor():
+
+    alt, vel, mass, last_accel, inputs = boost_state()
+    return lambda: calcApogeeDelayed(alt, vel, mass, inputs.target_apogee, inputs.drag_enabled, inputs.cross_sec, inputs.drag_coeff,
+                                     inputs.time_increment, last_accel, inputs.engine_shutdown_delay, inputs.mdot)
+
+def setup_gnc_check_shutdown():
+
+    import GNC_vx1
+
+    alt, vel, mass, last_accel, inputs = boost_state()
+    thrust = inputs.mdot * inputs.eev
+    return lambda: GNC_vx1.check_shutdown(alt, vel, mass, inputs.mdot, inputs.mass_init - inputs.mass_propellant, inputs.target_apogee,
+                                          inputs.cross_sec, inputs.drag_coeff, inputs.engine_shutdown_delay, thrust, standard_atmosphere)
+
+@functools.lru_cache()
+def large_run():
+    return simulate(demo_inputs("apogee_target", 0.001))
+
+def setup_export(extension, directory):
+
+    result = large_run()
+    filepath = os.path.join(directory, "export" + extension)
+
+    # fails here, outside the timing, if the optional package is missing
+    export_result(result, filepath)
+    return lambda: export_result(result, filepath)
+
+def benchmarks(directory):
+    """The suite, as a list of (name, setup). Exports are written to directory."""
+
+    suite = []
+    for name in demo_saves:
+        for time_increment in run_increments:
+            suite.append(("run/%s/dt=%g" % (name, time_increment), lambda name=name, dt=time_increment: setup_run(name, dt)))
+        suite.append(("run_jit/%s/dt=0.001" % name, lambda name=name: setup_jit_run(name, 0.001)))
+
+    suite += [("atmosphere/alt2dens", lambda: setup_lookup(standard_atmosphere.density)),
+              ("atmosphere/alt2press", lambda: setup_lookup(standard_atmosphere.pressure)),
+              ("atmosphere/lookup", lambda: setup_lookup(standard_atmosphere.lookup)),
+              ("atmosphere/gravity", lambda: setup_lookup(standard_atmosphere.gravity)),
+              ("predictor/calcApogeeDelayed", setup_predictor),
+              ("gnc/check_shutdown", setup_gnc_check_shutdown)]
+
+    for extension in (".npz", ".csv", ".parquet", ".feather", ".h5"):
+        suite.append(("export/dt=0.001" + extension, lambda extension=extension: setup_export(extension, directory)))
+
+    return suite
+
+# - - - - - - - - - - - - - - - - - - - - - - - - - - - -
+#                 TIMING
+# - - - - - - - - - - - - - - - - - - - - - - - - - - - -
+
+def calibrate(function, min_time):
+    """Number of calls per repeat that take at least min_time seconds."""
+
+    number = 1
+    while True:
+        start = time.perf_counter()
+        for i in range(number):
+            function()
+        elapsed = time.perf_counter() - start
+        if elapsed >= min_time:
+            return number
+        # aim a little past min_time, so the next try is usually the last
+        number = max(number * 2, int(number * 1.2 * min_time/max(elapsed, 1e-9)))
+
+def measure(function, repeat, min_time):
+    """Times function, returns a dict of per-call statistics in seconds."""
+
+    number = calibrate(function, min_time)
+    times = []
+    for i in range(repeat):
+        start = time.perf_counter()
+        for j in range(number):
+            function()
+        times.append((time.perf_counter() - start)/number)
+
+    return {"min": min(times), "median": statistics.median(times), "mean": statistics.fmean(times),
+            "stdev": statistics.stdev(times) if len(times) > 1 else 0.0,
+            "repeat": repeat, "number": number}
+
+def git_commit():
+
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=root, capture_output=True,
+                              text=True, timeout=10).stdout.strip() or None
+    except (OSError, subprocess.SubprocessError):
+        return None
+
+def machine_info():
+
+    return {"python": platform.python_version(), "implementation": platform.python_implementation(),
+            "numpy": np.__version__, "platform": platform.platform(), "processor": platform.processor(),
+            "cpu_count": os.cpu_count()}
+
+# - - - - - - - - - - - - - - - - - - - - - - - - - - - -
+#                 REPORTS
+# - - - - - - - - - - - - - - - - - - - - - - - - - - - -
+
+def format_time(seconds):
+
+    for unit, scale in (("s", 1.0), ("ms", 1e-3), ("us", 1e-6)):
+        if seconds >= scale:
+            return "%.3f %s" % (seconds/scale, unit)
+    return "%.1f ns" % (seconds/1e-9)
+
+def load_results(filepath):
+
+    with open(filepath, "r") as results_file:
+        data = json.load(results_file)
+    if data.get("format") != suite_format:
+        raise ValueError(filepath + " is not a benchmark result file.")
+    return data
+
+def compare(baseline, results, threshold):
+    """Prints new versus baseline times, returns the names that got slower."""
+
+    slower = []
+    print("\n%-32s %12s %12s %9s" % ("vs " + str(baseline.get("software_version")) + " (" + str(baseline.get("commit")) + ")",
+                                     "baseline", "now", "ratio"))
+    for name, stats in results["benchmarks"].items():
+        old = baseline["benchmarks"].get(name)
+        if old is None:
+            print("%-32s %12s %12s %9s" % (name, "-", format_time(stats["min"]), "new"))
+            continue
+
+        ratio = stats["min"]/old["min"]
+        flag = ""
+        if ratio > threshold:
+            flag = "  SLOWER"
+            slower.append(name)
+        elif ratio < 1/threshold:
+            flag = "  faster"
+        print("%-32s %12s %12s %8.2fx%s" % (name, format_time(old["min"]), format_time(stats["min"]), ratio, flag))
+    return slower
+
+def main():
+
+    parser = argparse.ArgumentParser(description="Times the simulator's hot paths, saves and compares the results as JSON.")
+    parser.add_argument("--output", help="write the results to this JSON file")
+    parser.add_argument("--compare", metavar="BASELINE", help="compare with the results in this JSON file")
+    parser.add_argument("--threshold", type=float, default=default_threshold,
+                        help="flag benchmarks this many times slower than the baseline (default %(default)s)")
+    parser.add_argument("--filter", action="append", default=[], help="only run benchmarks whose name contains this, repeatable")
+    parser.add_argument("--repeat", type=int, default=5, help="timed repeats per benchmark")
+    parser.add_argument("--min-time", type=float, default=0.2, help="shortest duration of one repeat (s)")
+    parser.add_argument("--quick", action="store_true", help="3 short repeats, for a rough check")
+    args = parser.parse_args()
+
+    if args.quick:
+        args.repeat, args.min_time = 3, 0.05
+
+    baseline = None
+    if args.compare:
+        try:
+            baseline = load_results(args.compare)
+        except (OSError, ValueError) as e:
+            parser.error(str(e))
+
+    results = {"format": suite_format, "version": suite_format_version,
+               "software_version": trajectory_core.version, "commit": git_commit(),
+               "created": time.strftime("%Y-%m-%dT%H:%M:%S"), "machine": machine_info(),
+               "settings": {"repeat": args.repeat, "min_time": args.min_time},
+               "benchmarks": {}, "skipped": {}}
+
+    print("%-32s %12s %12s %8s" % ("benchmark", "best", "median", "stdev"))
+    with tempfile.TemporaryDirectory() as directory:
+        for name, setup in benchmarks(directory):
+            if args.filter and not any(text in name for text in args.filter):
+                continue
+
+            try:
+                function = setup()
+            except (ExportError, ImportError) as e:
+                results["skipped"][name] = str(e)
+                print("%-32s skipped: %s" % (name, e))
+                continue
+
+            stats = measure(function, args.repeat, args.min_time)
+            results["benchmarks"][name] = stats
+            print("%-32s %12s %12s %7.1f%%" % (name, format_time(stats["min"]), format_time(stats["median"]),
+                                               100 * stats["stdev"]/stats["mean"]))
+
+    if args.output:
+        with open(args.output, "w") as results_file:
+            json.dump(results, results_file, indent=2)
+            results_file.write("\n")
+        print("\nResults saved in " + args.output)
+
+    if baseline is not None:
+        slower = compare(baseline, results, args.threshold)
+        if slower:
+            print("\n%d benchmark(s) slower than the baseline by more than %g%%" % (len(slower), 100 * (args.threshold - 1)))
+            sys.exit(1)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,118 @@
+#   PLOT DECIMATION
+
+# screen plots never need more than a few points per pixel column, so
+# long histories are thinned out before they are handed to the GUI.
+# The full resolution data stays in the result store.
+
+import numpy as np
+
+def minmax_decimate(x, y, buckets):
+    """Keeps the lowest and highest point of each of the given number of
+       equal-length buckets, in time order. Peaks are never lost."""
+
+    x = np.asarray(x)
+    y = np.asarray(y)
+    n = len(y)
+    if n <= 2 * buckets:
+        return x, y
+
+    size = n // buckets
+    whole = size * buckets
+    rows = y[:whole].reshape(buckets, size)
+    offsets = np.arange(buckets) * size
+    lows = offsets + rows.argmin(axis=1)
+    highs = offsets + rows.argmax(axis=1)
+
+    # first and last point too, so the plot spans the whole run
+    index = np.unique(np.concatenate(([0], lows, highs, np.arange(whole, n), [n - 1])))
+    return x[index], y[index]
+
+class IncrementalMinMax:
+    """Min/max decimation of a growing series.
+
+       update() takes only the new points. They are packed into
+       buckets of bucket_size points, keeping each bucket's lowest
+       and highest point. When there are more than max_buckets
+       buckets, neighbours are merged and bucket_size doubles, so the
+       output never grows past about 2 * max_buckets points and every
+       update costs time proportional to the new points only."""
+
+    def __init__(self, max_buckets=1000):
+
+        self.max_buckets = max_buckets
+        self.bucket_size = 1
+
+        # per bucket: time and value of its lowest and highest point
+        self._low_x = np.empty(0)
+        self._low_y = np.empty(0)
+        self._high_x = np.empty(0)
+        self._high_y = np.empty(0)
+
+        # points that don't fill a bucket yet
+        self._rest_x = np.empty(0)
+        self._rest_y = np.empty(0)
+
+    def update(self, x, y):
+
+        x = np.concatenate((self._rest_x, x))
+        y = np.concatenate((self._rest_y, y))
+
+        size = self.bucket_size
+        count = len(y) // size
+        whole = count * size
+
+        if count:
+            rows_x = x[:whole].reshape(count, size)
+            rows_y = y[:whole].reshape(count, size)
+            lows = rows_y.argmin(axis=1)
+            highs = rows_y.argmax(axis=1)
+            picked = np.arange(count)
+
+            self._low_x = np.concatenate((self._low_x, rows_x[picked, lows]))
+            self._low_y = np.concatenate((self._low_y, rows_y[picked, lows]))
+            self._high_x = np.concatenate((self._high_x, rows_x[picked, highs]))
+            self._high_y = np.concatenate((self._high_y, rows_y[picked, highs]))
+
+        self._rest_x = x[whole:]
+        self._rest_y = y[whole:]
+
+        while len(self._low_y) > self.max_buckets:
+            self._merge()
+
+    def _merge(self):
+
+        pairs = len(self._low_y) // 2
+        even = slice(0, 2 * pairs, 2)
+        odd = slice(1, 2 * pairs, 2)
+
+        low_from_odd = self._low_y[odd] < self._low_y[even]
+        high_from_odd = self._high_y[odd] > self._high_y[even]
+
+        merged = [np.where(low_from_odd, self._low_x[odd], self._low_x[even]),
+                  np.where(low_from_odd, self._low_y[odd], self._low_y[even]),
+                  np.where(high_from_odd, self._high_x[odd], self._high_x[even]),
+                  np.where(high_from_odd, self._high_y[odd], self._high_y[even])]
+
+        # an odd bucket out stays as it is
+        leftover = slice(2 * pairs, None)
+        self._low_x = np.concatenate((merged[0], self._low_x[leftover]))
+        self._low_y = np.concatenate((merged[1], self._low_y[leftover]))
+        self._high_x = np.concatenate((merged[2], self._high_x[leftover]))
+        self._high_y = np.concatenate((merged[3], self._high_y[leftover]))
+
+        self.bucket_size = self.bucket_size * 2
+
+    def points(self):
+        """Returns the decimated (x, y) so far, in time order."""
+
+        low_first = self._low_x <= self._high_x
+        first_x = np.where(low_first, self._low_x, self._high_x)
+        first_y = np.where(low_first, self._low_y, self._high_y)
+        second_x = np.where(low_first, self._high_x, self._low_x)
+        second_y = np.where(low_first, self._high_y, self._low_y)
+
+        # a bucket whose lowest point is also its highest is sent once
+        keep = np.column_stack((np.ones(len(first_x), dtype=bool), first_x != second_x)).ravel()
+        x = np.column_stack((first_x, second_x)).ravel()[keep]
+        y = np.column_stack((first_y, second_y)).ravel()[keep]
+        return np.concatenate((x, self._rest_x)), np.concatenate((y, self._rest_y))
@@ -10,20 +10,21 @@
 # MAIN ENGINE SHUTDOWN.
 # = = = = = = = = = = = = = = = = = = = = = = = = = = = = = =
 
+import math
+import os
+import sys
 import time
 
+# the atmosphere model is shared with the simulator one directory up
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from atmosphere import Atmosphere
+
 def init_atmo_model(model_filename):
     """Reads atmospheric density profile from file and saves
        it into memory."""
 
-    # file extension check for user convenience
-    if not model_filename.endswith(".txt"):
-        model_filename += ".txt"
-        
-    model_file = open(model_filename, "r")
-    model_lines = model_file.readlines()
-    model_file.close()
-    return model_lines
+    # file extension check is done by Atmosphere
+    return Atmosphere(model_filename)
 
 def init_state(a_init, v_init, m_init, mdot_init, m_final, a_target,
                A_cSec, c_drag_init, t_shutDelay, F_exp):
@@ -63,23 +64,11 @@ def update_state(a, v, m, mdot, m_final, accel, t, dt):
 
     return a, v, m, mdot, t
 
-def alt2dens(altitude, model_lines):
+def alt2dens(altitude, atmosphere):
     """Returns atmospheric density at given altitude by
        reading atmospheric model data from memory."""
-    
-    if altitude > 85000:
-        return 0.0
-    else:
-        alt_low = int(altitude/100)
-        alt_high = alt_low + 1
-
-        lookup_line_low = float(model_lines[alt_low])
-        lookup_line_high = float(model_lines[alt_high])
 
-        # do linear interpolation so you don't get "staircase" values
-        interpolated_density = lookup_line_low + ((lookup_line_high - lookup_line_low)/100) * ((altitude - (alt_low * 100)))
-
-        return float(interpolated_density)
+    return atmosphere.density(altitude)
 
 def calc_grav(altitude):
     """Predicts gravitational acceleration at given altitude above Earth."""
@@ -149,6 +138,277 @@ def check_shutdown(a, v, m, mdot, m_final, a_target, A_cSec, c_drag,
     else:
         return False, a
 
+# - - - - - - - - - - - - - - - - - - - - - - - - - - - -
+#          DEADLINE-AWARE APOAPSIS PREDICTION
+# - - - - - - - - - - - - - - - - - - - - - - - - - - - -
+
+# check_shutdown() integrates all the way to apoapsis on every cycle,
+# so its run time grows with the coast still ahead, and is largest
+# right when the vehicle is fastest. ApoapsisPredictor does the same
+# prediction under a hard compute budget per cycle:
+#
+# - warm start: the coast predicted on the last cycle is kept. The
+#   next prediction is only integrated until it is as slow as the
+#   start of that coast, the rest is the old coast shifted to the
+#   new altitude. Higher up the air is thinner, so the apoapsis rises
+#   faster than the shift: the gain between the two is learned from
+#   the full predictions, which refresh the kept coast every few
+#   cycles. One that doesn't fit the budget is carried on over the
+#   next cycles.
+# - once drag is negligible the rest of the coast is solved in one
+#   step, by energy conservation in inverse-square gravity.
+# - if the budget runs out, the result is an upper bound of the
+#   apoapsis (no drag, full thrust at the lowest mass for the whole
+#   shutdown delay) and is flagged as not confident.
+
+earth_radius = 6369000
+earth_mu = 9.80665 * earth_radius**2
+
+def calc_vacuum_apoapsis(a, v):
+    """Apoapsis reached from altitude a and upward velocity v without
+       drag, with gravity falling off as in calc_grav()."""
+
+    # v^2/2 - mu/r is conserved, and v = 0 at apoapsis
+    energy = v**2/2 - earth_mu/(earth_radius + a)
+    if energy >= 0:
+        return math.inf
+    return -earth_mu/energy - earth_radius
+
+def calc_apoapsis_bound(a, v, m, mdot, m_final, t_shutDelay, F_exp, dt):
+    """Apoapsis the vehicle can not exceed if shutdown is commanded
+       now, whatever the drag. dt is the step of the full prediction,
+       whose discretization error the bound also covers."""
+
+    # thrust acceleration can't exceed F_exp at the lowest mass, and
+    # gravity can't be weaker than at the highest altitude reachable
+    accel_max = F_exp/max(m - mdot * t_shutDelay, m_final)
+    a_high = a + max(v, 0) * t_shutDelay + 0.5 * accel_max * t_shutDelay**2
+    accel_max -= calc_grav(a_high)
+
+    v_shutdown = v + accel_max * t_shutDelay
+    if v_shutdown <= 0:
+        return a_high + max(v, 0) * dt
+
+    a_shutdown = a + v * t_shutDelay + 0.5 * accel_max * t_shutDelay**2
+    return calc_vacuum_apoapsis(a_shutdown, v_shutdown) + v_shutdown * dt
+
+class ApoapsisPredictor:
+    """check_shutdown() prediction with a hard compute budget.
+
+       predict() returns (apoapsis, confident) within about budget
+       seconds. confident is False if the budget ran out, apoapsis
+       is then the upper bound of calc_apoapsis_bound(). Keeps the
+       last predicted coast between calls, so use one predictor per
+       flight."""
+
+    # the clock is read every this many integration steps
+    clock_interval = 32
+
+    def __init__(self, mdot, m_final, A_cSec, c_drag, t_shutDelay, F_exp, arr_atmDensity,
+                 budget=0.005, dt=0.02, drag_negligible=1e-4, refresh_cycles=5, stale_cycles=25):
+
+        self.mdot = mdot
+        self.m_final = m_final
+        self.A_cSec = A_cSec
+        self.c_drag = c_drag
+        self.t_shutDelay = t_shutDelay
+        self.F_exp = F_exp
+        self.arr_atmDensity = arr_atmDensity
+
+        # compute time allowed per prediction (s)
+        self.budget = budget
+        self.dt = dt
+
+        # drag below this fraction of gravity is treated as no drag
+        self.drag_negligible = drag_negligible
+
+        # the kept coast is refreshed by a full prediction when it is
+        # refresh_cycles old, and not trusted when stale_cycles old
+        self.refresh_cycles = refresh_cycles
+        self.stale_cycles = stale_cycles
+
+        # coast of the last prediction: falling velocities and their
+        # altitudes, the apoapsis of the full prediction it came from,
+        # the altitude shifts since, and predictions since
+        self.trail_v = None
+        self.trail_a = None
+        self.trail_apoapsis = None
+        self.trail_shift = 0.0
+        self.trail_age = 0
+
+        # apoapsis change per meter of shift, learned from the full predictions
+        self.gain = 1.0
+
+        # state of a full prediction cut off by the deadline
+        self.pending = None
+
+        self.predictions = 0
+        self.full_predictions = 0
+        self.spliced_predictions = 0
+        self.bounds = 0
+
+    def predict(self, a, v, m):
+        """Predicts the apoapsis if shutdown is commanded now."""
+
+        deadline = time.perf_counter() + self.budget
+        self.predictions += 1
+
+        apoapsis = None
+        if self.trail_v is not None:
+            apoapsis = self._splice(a, v, m, deadline)
+            age = self.trail_age
+
+        if self.pending is not None:
+            # a full prediction cut off by the deadline of an earlier
+            # cycle, once finished its coast is the one to join
+            if self._full(self.pending, deadline) is not None and apoapsis is None:
+                apoapsis = self._splice(a, v, m, deadline)
+                age = self.trail_age
+
+        elif apoapsis is None or self.trail_age >= self.refresh_cycles:
+            # what the splice of this cycle was made of, to learn the gain from
+            splice = (self.trail_apoapsis, self.trail_shift) if apoapsis is not None else None
+
+            full_apoapsis = self._full((a, v, m, 0.0, [], [], self.predictions, splice), deadline)
+            if full_apoapsis is not None:
+                self.full_predictions += 1
+                return full_apoapsis, True
+
+        if apoapsis is not None and age < self.stale_cycles:
+            self.spliced_predictions += 1
+            return apoapsis, True
+
+        self.bounds += 1
+        return calc_apoapsis_bound(a, v, m, self.mdot, self.m_final, self.t_shutDelay, self.F_exp, self.dt), False
+
+    def _integrate(self, a, v, m, t, v_stop, deadline, trail_v, trail_a):
+        """check_shutdown() steps from time t of the prediction until
+           v <= v_stop after shutdown, or apoapsis. Coast steps are appended to the trail lists.
+           Returns (a, v, m, t, apoapsis, finished), apoapsis is set
+           if drag became negligible, finished is False if the
+           deadline passed first."""
+
+        dt = self.dt
+        mdot = self.mdot
+        m_final = self.m_final
+        A_cSec = self.A_cSec
+        c_drag = self.c_drag
+        t_shutDelay = self.t_shutDelay
+        F_exp = self.F_exp
+        arr_atmDensity = self.arr_atmDensity
+        drag_negligible = self.drag_negligible
+        clock = time.perf_counter
+        steps = 0
+
+        while v > 0 and (v > v_stop or t < t_shutDelay):
+            accel_gravity = calc_grav(a)
+            F_drag = calc_drag(v, a, c_drag, A_cSec, arr_atmDensity)
+
+            if t < t_shutDelay:
+                if m > m_final:
+                    m -= mdot * dt
+                    if m < m_final:
+                        m = m_final
+
+                accel = (F_exp - F_drag)/m - accel_gravity
+            else:
+                # only drag and gravity from here on, solve the rest at once
+                if v_stop <= 0 and F_drag < drag_negligible * m * accel_gravity:
+                    return a, v, m, t, calc_vacuum_apoapsis(a, v), True
+
+                accel = -F_drag/m - accel_gravity
+
+            v += accel * dt
+            a += v * dt
+            t += dt
+
+            if t >= t_shutDelay:
+                trail_v.append(v)
+                trail_a.append(a)
+
+            steps += 1
+            if steps % self.clock_interval == 0 and clock() > deadline:
+                return a, v, m, t, None, False
+
+        return a, v, m, t, None, True
+
+    def _full(self, start, deadline):
+        """Full prediction to apoapsis from start = (a, v, m, t, trail_v,
+           trail_a, cycle, splice). Keeps its coast as the new trail.
+           Returns the apoapsis, or None if it is left pending for the
+           next cycle."""
+
+        a, v, m, t, trail_v, trail_a, cycle, splice = start
+        a, v, m, t, apoapsis, finished = self._integrate(a, v, m, t, 0.0, deadline, trail_v, trail_a)
+        if not finished:
+            self.pending = (a, v, m, t, trail_v, trail_a, cycle, splice)
+            return None
+
+        self.pending = None
+        if apoapsis is None:
+            apoapsis = a
+
+        # the splice from the same state, with the gain that would have made it exact
+        if splice is not None and abs(splice[1]) > 1e-3:
+            self.gain = (apoapsis - splice[0])/splice[1]
+
+        self._keep(trail_v, trail_a, apoapsis, self.predictions - cycle)
+        return apoapsis
+
+    def _splice(self, a, v, m, deadline):
+        """Prediction that joins the kept coast, None if it can't."""
+
+        old_v = self.trail_v
+        old_a = self.trail_a
+
+        trail_v = []
+        trail_a = []
+        a, v, m, t, apoapsis, finished = self._integrate(a, v, m, 0.0, old_v[0], deadline, trail_v, trail_a)
+
+        # ran out of time, reached apoapsis first, or joined before shutdown
+        if not finished or apoapsis is not None or v <= 0 or t < self.t_shutDelay:
+            return None
+
+        # first kept step slower than the vehicle now
+        j = 1
+        while j < len(old_v) and old_v[j] > v:
+            j += 1
+        if j == len(old_v):
+            return None
+
+        fraction = (old_v[j - 1] - v)/(old_v[j - 1] - old_v[j])
+        shift = a - (old_a[j - 1] + (old_a[j] - old_a[j - 1]) * fraction)
+
+        trail_v.extend(old_v[j:])
+        trail_a.extend([old + shift for old in old_a[j:]])
+        self._keep(trail_v, trail_a, self.trail_apoapsis, self.trail_age + 1, self.trail_shift + shift)
+
+        return self.trail_apoapsis + self.gain * self.trail_shift
+
+    def _keep(self, trail_v, trail_a, apoapsis, age, shift=0.0):
+
+        # a trail needs two steps to interpolate in
+        if len(trail_v) < 2:
+            self.trail_v = None
+            return
+
+        self.trail_v = trail_v
+        self.trail_a = trail_a
+        self.trail_apoapsis = apoapsis
+        self.trail_shift = shift
+        self.trail_age = age
+
+def check_shutdown_budgeted(predictor, a, v, m, a_target):
+    """check_shutdown() on an ApoapsisPredictor. Returns (shutdown,
+       apoapsis, confident). Only a confident prediction can command
+       the shutdown: a cycle whose budget ran out always defers the
+       decision to the next one, even when its upper bound is past
+       the target. Every deferred cycle near the target adds to the
+       overshoot, so the budget has to leave most cycles confident."""
+
+    a_predict, confident = predictor.predict(a, v, m)
+    return confident and a_predict >= a_target, a_predict, confident
+
 def get_IMU_accel():
     # dummy function
     pass
@@ -160,43 +420,27 @@ def shutdown_engine():
 def main():
     """Main GNC function."""
 
+    # the scheduler imports this module
+    import asyncio
+    from gnc_scheduler import GNCScheduler
+
     # initialize data
     arr_atmDensity = init_atmo_model("atm_density_model")
     a, v, m, mdot, m_final, a_target, A_cSec, c_drag,\
        t_shutDelay, F_exp, t, dt_init, state = init_state(900, 0, 10, 0.5, 2, 912.5, 0.096, 0.7, 0, 7900)
 
-    dt = dt_init
-
-    cmd_launch = False
-    cmd_shutdown = False
-
-    while state == "PRELAUNCH":
-        # cmd_launch = check_launch_signal()
-        if cmd_launch:
-            state = "BOOST"
-        else:
-            pass
-
-    while state == "BOOST":
-        t_cycleStart = time.perf_counter()
-
-        accel = get_IMU_accel()
-        a, v, m, mdot, t = update_state(a, v, m, mdot, m_final, accel, t, dt)
-        cmd_shutdown, a_predict = check_shutdown(a, v, m, mdot, m_final, a_target, A_cSec, c_drag, t_shutDelay, F_exp, arr_atmDensity)
-
-        if cmd_shutdown:
-            shutdown_engine()
-            print("SHUTDOWN!")
-            print("ALT, VEL, MASS, TIME, ALT_PREDICT")
-            print(a, v, m, t, a_predict)
+    # PRELAUNCH waits for scheduler.launch() without using the CPU,
+    # BOOST and COAST propagate the state every dt on fixed deadlines
+    # and check the apoapsis at a lower rate
+    scheduler = GNCScheduler(lambda t: get_IMU_accel(), a, v, m, mdot, m_final, a_target, A_cSec, c_drag,
+                             t_shutDelay, F_exp, arr_atmDensity, propagation_rate=1/dt_init, check_rate=0.5/dt_init)
 
-        # halt computation to match defined dt
-        dt_actual = time.perf_counter() - t_cycleStart
+    # the launch signal handler calls scheduler.launch() (check_launch_signal() to come)
+    asyncio.run(scheduler.run())
 
-        if dt > dt_actual:
-            dt = dt_init
-            time.sleep(dt - dt_actual)
-        else:
-            dt = dt_actual
+    print("SHUTDOWN AT", scheduler.shutdown_time, "ALT_PREDICT", scheduler.a_predict)
+    print(scheduler.propagation.report())
+    print(scheduler.check.report())
 
-main()
+if __name__ == "__main__":
+    main()
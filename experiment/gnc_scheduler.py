@@ -0,0 +1,276 @@
+#   GNC SCHEDULER
+
+# runs the GNC_vx1 state machine (PRELAUNCH, BOOST, COAST) on asyncio:
+# PRELAUNCH waits on an event for the launch signal without using the
+# CPU, BOOST and COAST run state propagation and the apoapsis check
+# as separate fixed-rate tasks. Every task keeps to absolute
+# deadlines (start + n periods), so late cycles don't shift the ones
+# after them, and counts its jitter, overruns and skipped cycles.
+
+# state propagation integrates a fixed dt per cycle, so it never
+# skips a cycle: after an overrun it runs the missed ones back to back
+# until it is on time again. The apoapsis check only needs the latest
+# state, it skips the cycles it missed instead. It uses the budgeted
+# ApoapsisPredictor, so its run time stays well inside a cycle.
+
+# usage: python experiment/gnc_scheduler.py demo_saves/apogee_target.txt --launch-after 1 --speed 4
+#        scheduler = GNCScheduler(imu, *vehicle);  asyncio.run(scheduler.run())
+#        loop.call_soon_threadsafe(scheduler.launch)  # from the launch signal handler
+
+import argparse
+import asyncio
+import multiprocessing
+import time
+
+import numpy as np
+
+import GNC_vx1
+
+class RateTask:
+    """Calls step() rate times per second until running() is false.
+
+       speed > 1 shortens the periods, to run a flight faster than
+       real time with the same dt. Counters: runs, overruns (runs
+       that ended past the next deadline), skipped (cycles dropped
+       after overruns, only without catch_up), and the start jitter
+       and compute time of the runs (s). The event loop wakes up to
+       about a millisecond late on Linux (its timers have millisecond
+       resolution), that is the floor of the jitter."""
+
+    def __init__(self, name, rate, step, catch_up=False, speed=1.0):
+
+        self.name = name
+        self.rate = rate
+        self.period = 1/(rate * speed)
+        self.step = step
+        self.catch_up = catch_up
+
+        self.runs = 0
+        self.overruns = 0
+        self.skipped = 0
+        self.jitter_total = 0.0
+        self.jitter_max = 0.0
+        self.compute_total = 0.0
+        self.compute_max = 0.0
+        self.start_time = None
+        self.end_time = None
+
+    async def run(self, start, running):
+        """Runs the task from loop time start on."""
+
+        loop = asyncio.get_running_loop()
+        deadline = start
+        self.start_time = start
+
+        while running():
+            delay = deadline - loop.time()
+            if delay > 0:
+                await asyncio.sleep(delay)
+            else:
+                # still give the other tasks a turn when catching up
+                await asyncio.sleep(0)
+            if not running():
+                break
+
+            started = loop.time()
+            self.step()
+            finished = loop.time()
+
+            jitter = started - deadline
+            compute = finished - started
+            self.runs += 1
+            self.jitter_total += jitter
+            self.jitter_max = max(self.jitter_max, jitter)
+            self.compute_total += compute
+            self.compute_max = max(self.compute_max, compute)
+
+            deadline += self.period
+            if finished > deadline:
+                self.overruns += 1
+                if not self.catch_up:
+                    missed = int((finished - deadline)/self.period) + 1
+                    self.skipped += missed
+                    deadline += missed * self.period
+
+        self.end_time = loop.time()
+
+    def report(self):
+        """One text line of the counters."""
+
+        runs = max(self.runs, 1)
+        elapsed = (self.end_time or 0.0) - (self.start_time or 0.0)
+        achieved = self.runs/elapsed if elapsed > 0 else 0.0
+        return ("%-12s %7d runs  %8.1f/s  jitter mean %.3f max %.3f ms  compute mean %.3f max %.3f ms  overruns %d  skipped %d"
+                % (self.name, self.runs, achieved, 1e3 * self.jitter_total/runs, 1e3 * self.jitter_max,
+                   1e3 * self.compute_total/runs, 1e3 * self.compute_max, self.overruns, self.skipped))
+
+class GNCScheduler:
+    """GNC_vx1 state machine on fixed-rate asyncio tasks.
+
+       imu(t) returns the acceleration reading at flight time t
+       (a real IMU can ignore t and read the current one).
+       The vehicle arguments are those init_state() returns. run()
+       waits for launch(), which has to be called in the event
+       loop's thread (loop.call_soon_threadsafe from others), flies
+       BOOST until the shutdown command and COAST until apoapsis."""
+
+    def __init__(self, imu, a, v, m, mdot, m_final, a_target, A_cSec, c_drag, t_shutDelay, F_exp, arr_atmDensity,
+                 propagation_rate=100.0, check_rate=25.0, budget=None, speed=1.0):
+
+        self.imu = imu
+        self.a = a
+        self.v = v
+        self.m = m
+        self.mdot = mdot
+        self.m_final = m_final
+        self.a_target = a_target
+        self.t = 0.0
+        self.dt = 1/propagation_rate
+
+        self.state = "PRELAUNCH"
+        self.shutdown_time = None
+        self.a_predict = None
+        self.confident = None
+
+        # the check gets at most a quarter of a propagation cycle by
+        # default, of the real cycle, which speed shortens
+        self.predictor = GNC_vx1.ApoapsisPredictor(mdot, m_final, A_cSec, c_drag, t_shutDelay, F_exp, arr_atmDensity,
+                                                   budget=budget if budget is not None else self.dt/(4 * speed))
+
+        self.propagation = RateTask("propagation", propagation_rate, self._propagate, catch_up=True, speed=speed)
+        self.check = RateTask("apoapsis", check_rate, self._check, speed=speed)
+
+        self._launch = None
+        self.prelaunch_cpu = None
+
+    def launch(self):
+        """Launch signal, ends PRELAUNCH."""
+
+        if self._launch is not None:
+            self._launch.set()
+        else:
+            self.state = "BOOST"
+
+    def stop(self):
+        """Ends the flight loop after the running cycles, in any state."""
+        self.state = "STOPPED"
+
+    async def run(self):
+
+        loop = asyncio.get_running_loop()
+
+        if self.state == "PRELAUNCH":
+            # waits without waking up until launch() sets the event
+            self._launch = asyncio.Event()
+            wall, cpu = time.perf_counter(), time.process_time()
+            await self._launch.wait()
+            wall = time.perf_counter() - wall
+            self.prelaunch_cpu = (time.process_time() - cpu)/wall if wall > 0 else 0.0
+            if self.state == "PRELAUNCH":
+                self.state = "BOOST"
+
+        start = loop.time()
+        await asyncio.gather(self.propagation.run(start, lambda: self.state in ("BOOST", "COAST")),
+                             self.check.run(start, lambda: self.state == "BOOST"))
+
+    def _propagate(self):
+
+        # the reading of a cycle is taken at its end, as the simulator records them
+        accel = self.imu(self.t + self.dt)
+        self.a, self.v, self.m, self.mdot, self.t = GNC_vx1.update_state(self.a, self.v, self.m, self.mdot, self.m_final,
+                                                                         accel, self.t, self.dt)
+        if self.state == "COAST" and self.v <= 0:
+            self.state = "APOAPSIS"
+
+    def _check(self):
+
+        cmd_shutdown, self.a_predict, self.confident = GNC_vx1.check_shutdown_budgeted(self.predictor, self.a, self.v,
+                                                                                       self.m, self.a_target)
+        if cmd_shutdown:
+            GNC_vx1.shutdown_engine()
+            self.shutdown_time = self.t
+            self.state = "COAST"
+
+class TraceIMU:
+    """imu(t) that reads an acceleration trace, e.g. replay_harness.synthetic_trace()."""
+
+    def __init__(self, times, accels):
+        self.times = times
+        self.accels = accels
+
+    def __call__(self, t):
+        return float(np.interp(self.times[0] + t, self.times, self.accels))
+
+def _spin(seconds):
+
+    end = time.perf_counter() + seconds
+    while time.perf_counter() < end:
+        pass
+
+def main():
+
+    from dataclasses import replace
+    from replay_harness import synthetic_trace
+    from savefile import read_save_file
+    from trajectory_core import simulate, standard_atmosphere
+
+    parser = argparse.ArgumentParser(description="Flies a simulated IMU trace through the scheduled GNC in (scaled) real time.")
+    parser.add_argument("save", help="save file of the vehicle and the trace")
+    parser.add_argument("--target", type=float, help="target apogee (m), if not the one of the save file")
+    parser.add_argument("--propagation-rate", type=float, default=100.0)
+    parser.add_argument("--check-rate", type=float, default=25.0)
+    parser.add_argument("--launch-after", type=float, default=1.0, help="seconds in PRELAUNCH before the launch signal")
+    parser.add_argument("--speed", type=float, default=1.0, help="run this many times faster than real time")
+    parser.add_argument("--coast", type=float, default=2.0, help="seconds of COAST flown after the shutdown")
+    parser.add_argument("--load", type=int, default=0, help="processes spinning the CPU during the flight")
+    args = parser.parse_args()
+
+    inputs = read_save_file(args.save)[0]
+    if args.target is not None:
+        inputs = replace(inputs, target_apogee_enabled=True, target_apogee=args.target)
+    if not inputs.target_apogee_enabled:
+        parser.error("the save file has no target apogee, give one with --target")
+
+    times, accels = synthetic_trace(inputs)
+    c_drag = inputs.drag_coeff if inputs.drag_enabled else 0.0
+    vehicle = GNC_vx1.init_state(inputs.alt_init, 0.0, inputs.mass_init, inputs.mdot, inputs.mass_init - inputs.mass_propellant,
+                                 inputs.target_apogee, inputs.cross_sec, c_drag, inputs.engine_shutdown_delay,
+                                 inputs.mdot * inputs.eev)[:10]
+    scheduler = GNCScheduler(TraceIMU(times, accels), *vehicle, standard_atmosphere, propagation_rate=args.propagation_rate,
+                             check_rate=args.check_rate, speed=args.speed)
+
+    hogs = [multiprocessing.Process(target=_spin, args=(3600,), daemon=True) for i in range(args.load)]
+
+    # the trace doesn't follow the shutdown, so the flight is stopped
+    # a little after it instead of coasting on to apoapsis
+    async def fly():
+        loop = asyncio.get_running_loop()
+        loop.call_later(args.launch_after, scheduler.launch)
+        loop.call_later(args.launch_after, lambda: [hog.start() for hog in hogs])
+
+        flight = asyncio.create_task(scheduler.run())
+        while scheduler.shutdown_time is None and not flight.done():
+            await asyncio.sleep(0.1)
+        await asyncio.sleep(args.coast/args.speed)
+        scheduler.stop()
+        await flight
+
+    wall, cpu = time.perf_counter(), time.process_time()
+    asyncio.run(fly())
+    wall, cpu = time.perf_counter() - wall, time.process_time() - cpu
+    for hog in hogs:
+        hog.terminate()
+
+    print("PRELAUNCH CPU use: %.1f%%" % (100 * scheduler.prelaunch_cpu))
+    print("flight CPU use: %.1f%% (%d load processes)\n" % (100 * (cpu - scheduler.prelaunch_cpu * args.launch_after)/(wall - args.launch_after), args.load))
+    print(scheduler.propagation.report())
+    print(scheduler.check.report())
+    if scheduler.shutdown_time is None:
+        print("\nno shutdown commanded")
+        return
+    flown = simulate(replace(inputs, shutdown_command_time=scheduler.shutdown_time))
+    print("\nshutdown at %.2f s, predicted apoapsis %.1f m, flown apogee %.1f m (target %.1f m)"
+          % (scheduler.shutdown_time, scheduler.a_predict, flown.alt_max, inputs.target_apogee))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,275 @@
+#   GNC REPLAY HARNESS
+
+# runs the GNC_vx1 cycle (update_state, then the apoapsis prediction)
+# on an IMU acceleration trace as fast as the CPU allows, instead of
+# in wall-clock time against the dummy get_IMU_accel(). The trace is
+# flown by the simulator (the design in a save file, without apogee
+# targeting) or read from a recorded .csv/.npz file.
+
+# for every run it records the compute latency of each cycle and the
+# cycles that would have missed their deadline at the given rate. The
+# shutdown time the GNC commands is flown by the simulator, which
+# gives the actual apogee to compare the prediction with, and
+# shutdown_solver gives the ideal command time to compare it with.
+
+# usage: python experiment/replay_harness.py demo_saves/apogee_target.txt --rate 50 --predictor budgeted
+#        python experiment/replay_harness.py design.txt --trace flight.csv --noise 0.2 --runs 20
+
+import argparse
+import csv
+import json
+import math
+import time
+from dataclasses import dataclass, field, replace
+
+import numpy as np
+
+import GNC_vx1
+from shutdown_solver import solve_shutdown_time
+from savefile import read_save_file
+from trajectory_core import simulate, standard_atmosphere, SimulationError
+
+# edges of the latency histogram (s), the last bin is open
+latency_bins = [0.0, 25e-6, 50e-6, 100e-6, 250e-6, 500e-6, 1e-3, 2.5e-3, 5e-3, 10e-3, 25e-3, 50e-3]
+
+predictors = ("full", "budgeted")
+
+@dataclass
+class ReplayResult:
+    """Outcome of one replay.
+
+       latencies are the compute times of the cycles (s). The
+       shutdown fields stay None if no shutdown was commanded
+       before the trace ended."""
+
+    rate: float
+    latencies: list = field(default_factory=list)
+    deadline_misses: int = 0
+    unconfident_cycles: int = 0
+    shutdown_time: float = None
+    predicted_apogee: float = None
+    actual_apogee: float = None
+    ideal_shutdown_time: float = None
+
+    @property
+    def apogee_error(self):
+        """Predicted minus actual apogee (m)."""
+        if self.predicted_apogee is None or self.actual_apogee is None:
+            return None
+        return self.predicted_apogee - self.actual_apogee
+
+    @property
+    def shutdown_error(self):
+        """Commanded minus ideal shutdown time (s), positive is late."""
+        if self.shutdown_time is None or self.ideal_shutdown_time is None:
+            return None
+        return self.shutdown_time - self.ideal_shutdown_time
+
+# - - - - - - - - - - - - - - - - - - - - - - - - - - - -
+#                      TRACES
+# - - - - - - - - - - - - - - - - - - - - - - - - - - - -
+
+def synthetic_trace(inputs, time_increment=0.001):
+    """(times, accelerations) of the design flown without apogee targeting, up to apogee."""
+
+    result = simulate(replace(inputs, target_apogee_enabled=False, time_increment=min(time_increment, inputs.time_increment)))
+    end = int(np.searchsorted(result.channels["time"], result.tt_apoapsis, side="right"))
+    return result.channels["time"][:end], result.channels["accel"][:end]
+
+def load_trace(filepath):
+    """(times, accelerations) from a .npz with "time" and "accel" arrays,
+       or a .csv with columns named so, or as the exporters name them."""
+
+    if filepath.endswith(".npz"):
+        with np.load(filepath) as data:
+            return np.asarray(data["time"], dtype=np.float64), np.asarray(data["accel"], dtype=np.float64)
+
+    with open(filepath, "r", newline="") as trace_file:
+        rows = list(csv.reader(trace_file))
+
+    header = rows[0]
+    for time_name, accel_name in (("time", "accel"), ("Time (s)", "Acceleration (m/s^2)")):
+        if time_name in header and accel_name in header:
+            columns = np.array(rows[1:], dtype=np.float64)
+            return columns[:, header.index(time_name)], columns[:, header.index(accel_name)]
+
+    raise SimulationError(filepath + " has no time and acceleration columns.")
+
+# - - - - - - - - - - - - - - - - - - - - - - - - - - - -
+#                      REPLAY
+# - - - - - - - - - - - - - - - - - - - - - - - - - - - -
+
+def replay(inputs, times, accels, rate=50.0, predictor="full", budget=None, noise=0.0, bias=0.0, seed=None, atmosphere=standard_atmosphere):
+    """Runs the GNC cycles of one flight on an acceleration trace.
+
+       The vehicle parameters of the GNC come from inputs, as does
+       the target apogee. Each cycle reads the trace at the end of
+       its interval (the simulator records the acceleration of a
+       step with its end), plus bias and Gaussian noise of the given
+       standard deviation (m/s^2). budget is the compute time of the
+       budgeted predictor per cycle, a quarter cycle by default."""
+
+    dt = 1/rate
+    m_final = inputs.mass_init - inputs.mass_propellant
+    F_exp = inputs.mdot * inputs.eev
+    rng = np.random.default_rng(seed)
+
+    # the GNC always applies drag
+    c_drag = inputs.drag_coeff if inputs.drag_enabled else 0.0
+
+    a, v, m, mdot, m_final, a_target, A_cSec, c_drag, t_shutDelay, F_exp, t, _, state =\
+        GNC_vx1.init_state(inputs.alt_init, 0.0, inputs.mass_init, inputs.mdot, m_final, inputs.target_apogee,
+                           inputs.cross_sec, c_drag, inputs.engine_shutdown_delay, F_exp)
+
+    if predictor == "budgeted":
+        budgeted = GNC_vx1.ApoapsisPredictor(mdot, m_final, A_cSec, c_drag, t_shutDelay, F_exp, atmosphere,
+                                             budget=budget if budget is not None else dt/4)
+
+    # the whole trace is read up front, so the cycles only time the GNC
+    cycles = int((times[-1] - times[0])/dt)
+    readings = np.interp(times[0] + dt * np.arange(1, cycles + 1), times, accels) + bias
+    if noise > 0:
+        readings = readings + rng.normal(0.0, noise, cycles)
+
+    result = ReplayResult(rate)
+    clock = time.perf_counter
+    for accel in readings.tolist():
+
+        start = clock()
+        a, v, m, mdot, t = GNC_vx1.update_state(a, v, m, mdot, m_final, accel, t, dt)
+        if predictor == "budgeted":
+            cmd_shutdown, a_predict, confident = GNC_vx1.check_shutdown_budgeted(budgeted, a, v, m, a_target)
+        else:
+            cmd_shutdown, a_predict = GNC_vx1.check_shutdown(a, v, m, mdot, m_final, a_target, A_cSec, c_drag,
+                                                             t_shutDelay, F_exp, atmosphere)
+            confident = True
+        latency = clock() - start
+
+        result.latencies.append(latency)
+        result.deadline_misses += latency > dt
+        result.unconfident_cycles += not confident
+
+        if cmd_shutdown:
+            result.shutdown_time = t
+            result.predicted_apogee = a_predict
+            break
+
+    return result
+
+def judge(result, inputs, ideal_shutdown_time, atmosphere=standard_atmosphere):
+    """Flies the commanded shutdown to fill in the actual apogee of a ReplayResult."""
+
+    result.ideal_shutdown_time = ideal_shutdown_time
+    if result.shutdown_time is not None:
+        flown = simulate(replace(inputs, shutdown_command_time=result.shutdown_time), atmosphere=atmosphere)
+        result.actual_apogee = flown.alt_max
+    return result
+
+# - - - - - - - - - - - - - - - - - - - - - - - - - - - -
+#                      REPORTS
+# - - - - - - - - - - - - - - - - - - - - - - - - - - - -
+
+def latency_histogram(latencies):
+    """Text lines of a histogram of latencies (s)."""
+
+    counts, _ = np.histogram(latencies, bins=latency_bins + [math.inf])
+    widest = max(counts.max(), 1)
+
+    lines = []
+    for low, high, count in zip(latency_bins, latency_bins[1:] + [math.inf], counts.tolist()):
+        label = ("%g - %g ms" % (low * 1e3, high * 1e3)) if high < math.inf else ("> %g ms" % (low * 1e3))
+        lines.append("%-18s %8d  %s" % (label, count, "#" * int(round(40 * count/widest))))
+    return lines
+
+def summary(results):
+    """Plain dict of the runs, for printing and JSON."""
+
+    latencies = np.concatenate([np.asarray(result.latencies) for result in results])
+    apogee_errors = [result.apogee_error for result in results if result.apogee_error is not None]
+    shutdown_errors = [result.shutdown_error for result in results if result.shutdown_error is not None]
+
+    def stats(values):
+        if not values:
+            return None
+        return {"mean": float(np.mean(values)), "min": float(np.min(values)), "max": float(np.max(values))}
+
+    return {"runs": len(results), "cycles": int(latencies.size),
+            "latency": {"mean": float(latencies.mean()), "p50": float(np.percentile(latencies, 50)),
+                        "p99": float(np.percentile(latencies, 99)), "max": float(latencies.max())},
+            "histogram": dict(zip(["%g" % edge for edge in latency_bins],
+                                  np.histogram(latencies, bins=latency_bins + [math.inf])[0].tolist())),
+            "deadline_misses": sum(result.deadline_misses for result in results),
+            "unconfident_cycles": sum(result.unconfident_cycles for result in results),
+            "no_shutdown": sum(result.shutdown_time is None for result in results),
+            "apogee_error": stats(apogee_errors),
+            "shutdown_error": stats(shutdown_errors)}
+
+def main():
+
+    parser = argparse.ArgumentParser(description="Replays IMU traces through the GNC_vx1 cycle faster than real time.")
+    parser.add_argument("save", help="save file of the vehicle (and of the synthetic trace)")
+    parser.add_argument("--trace", help="recorded trace (.csv or .npz with time and accel), instead of a simulated one")
+    parser.add_argument("--target", type=float, help="target apogee (m), if not the one of the save file")
+    parser.add_argument("--rate", type=float, default=50.0, help="GNC cycles per second")
+    parser.add_argument("--predictor", choices=predictors, default="full",
+                        help="check_shutdown (full) or ApoapsisPredictor (budgeted)")
+    parser.add_argument("--budget", type=float, help="compute time of the budgeted predictor per cycle (s)")
+    parser.add_argument("--noise", type=float, default=0.0, help="IMU noise, standard deviation (m/s^2)")
+    parser.add_argument("--bias", type=float, default=0.0, help="IMU bias (m/s^2)")
+    parser.add_argument("--runs", type=int, default=1, help="replays, each with its own noise")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", help="write the summary to this JSON file")
+    args = parser.parse_args()
+
+    inputs = read_save_file(args.save)[0]
+    if args.target is not None:
+        inputs = replace(inputs, target_apogee_enabled=True, target_apogee=args.target)
+    if not inputs.target_apogee_enabled:
+        parser.error("the save file has no target apogee, give one with --target")
+
+    if args.trace:
+        times, accels = load_trace(args.trace)
+    else:
+        times, accels = synthetic_trace(inputs)
+
+    ideal_shutdown_time = solve_shutdown_time(inputs).command_time
+
+    start = time.perf_counter()
+    results = []
+    for run in range(args.runs):
+        result = replay(inputs, times, accels, args.rate, args.predictor, args.budget, args.noise, args.bias, args.seed + run)
+        results.append(judge(result, inputs, ideal_shutdown_time))
+    elapsed = time.perf_counter() - start
+
+    report = summary(results)
+    flight_time = sum(len(result.latencies) for result in results)/args.rate
+    print("%d run(s), %d cycles at %g Hz (%.1f s of flight) replayed in %.2f s\n"
+          % (report["runs"], report["cycles"], args.rate, flight_time, elapsed))
+
+    print("cycle latency (ms): mean %.3f, p50 %.3f, p99 %.3f, max %.3f"
+          % tuple(1e3 * report["latency"][name] for name in ("mean", "p50", "p99", "max")))
+    for line in latency_histogram(np.concatenate([result.latencies for result in results])):
+        print("  " + line)
+    print("deadline misses: %d, cycles without a confident prediction: %d, runs without shutdown: %d\n"
+          % (report["deadline_misses"], report["unconfident_cycles"], report["no_shutdown"]))
+
+    print("%-5s %12s %12s %12s %12s %12s" % ("run", "shutdown (s)", "ideal (s)", "predicted", "actual", "error (m)"))
+    for run, result in enumerate(results):
+        if result.shutdown_time is None:
+            print("%-5d %12s" % (run, "none"))
+            continue
+        print("%-5d %12.3f %12.3f %12.1f %12.1f %+12.2f" % (run, result.shutdown_time, result.ideal_shutdown_time,
+                                                           result.predicted_apogee, result.actual_apogee, result.apogee_error))
+
+    for name, unit in (("apogee_error", "m"), ("shutdown_error", "s")):
+        if report[name] is not None:
+            print("%s: mean %+.3f %s, range %+.3f to %+.3f %s" % (name.replace("_", " "), report[name]["mean"], unit,
+                                                                 report[name]["min"], report[name]["max"], unit))
+
+    if args.output:
+        with open(args.output, "w") as output_file:
+            json.dump(report, output_file, indent=2)
+            output_file.write("\n")
+
+if __name__ == "__main__":
+    main()
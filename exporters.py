@@ -0,0 +1,121 @@
+#   RESULT EXPORTERS
+
+# writes the time histories of a run to disk, the format is picked by
+# the file extension. Every format except .xlsx is written as one wide
+# table (a single time column) in a single pass.
+
+# pandas is only imported by the writers that need it, .npz only needs
+# numpy. Parquet and Feather need pyarrow, HDF5 needs PyTables.
+
+import os
+
+import numpy as np
+
+class ExportError(Exception):
+    """Raised when a result can not be written."""
+
+# (column title, channel) pairs of the exported table
+base_columns = [("Time (s)", "time"),
+                ("Altitude (m)", "alt"),
+                ("Velocity (m/s)", "vel"),
+                ("Acceleration (m/s^2)", "accel"),
+                ("Thrust (N)", "thrust"),
+                ("Ext. Pressure (Pa)", "external_pressure"),
+                ("Gravity (m/s^2)", "gravity"),
+                ("Specific Impulse (s)", "isp"),
+                ("Mass (kg)", "mass")]
+drag_columns = [("Drag (N)", "drag"),
+                ("Dynamic Pressure (Pa)", "dyn_press")]
+drogue_columns = [("Drogue Deployment", "drogue_deployment")]
+chute_columns = [("Main Chute Deployment", "chute_deployment")]
+
+def export_columns(inputs):
+    """Columns worth exporting for a run with the given SimInputs."""
+
+    columns = list(base_columns)
+    if inputs.drag_enabled:
+        columns += drag_columns
+    if inputs.drogue_enabled:
+        columns += drogue_columns
+    if inputs.chute_enabled:
+        columns += chute_columns
+    return columns
+
+def result_table(result):
+    """Returns {column title: channel array} for a SimResult, without copying."""
+
+    return {title: result.channels[channel] for title, channel in export_columns(result.inputs)}
+
+def _dataframe(result):
+    import pandas as pd
+    return pd.DataFrame(result_table(result), copy=False)
+
+# - - - - - - - - - - - - - - - - - - - - - - - - - - - -
+#                       WRITERS
+# - - - - - - - - - - - - - - - - - - - - - - - - - - - -
+
+def write_csv(result, filepath, progress=None):
+    _dataframe(result).to_csv(filepath, index=False)
+
+def write_parquet(result, filepath, progress=None):
+    _dataframe(result).to_parquet(filepath, index=False)
+
+def write_feather(result, filepath, progress=None):
+    _dataframe(result).to_feather(filepath)
+
+def write_hdf5(result, filepath, progress=None):
+    _dataframe(result).to_hdf(filepath, key="trajectory", mode="w")
+
+def write_npz(result, filepath, progress=None):
+    # channel names as keys, np.load(filepath)["alt"]
+    np.savez(filepath, **{channel: result.channels[channel] for title, channel in export_columns(result.inputs)})
+
+# one sheet per quantity, each with its own time column,
+# the layout the GUI has always exported
+xlsx_sheets = [("Altitude", "alt"), ("Velocity", "vel"), ("Acceleration", "accel"), ("Thrust", "thrust"),
+               ("Ext. Press.", "external_pressure"), ("Gravity", "gravity"), ("Isp", "isp"),
+               ("Drag", "drag"), ("Dyn. Press.", "dyn_press"),
+               ("Drogue Deployment", "drogue_deployment"), ("Main Chute Deployment", "chute_deployment")]
+
+def write_xlsx(result, filepath, progress=None):
+    import pandas as pd
+
+    columns = export_columns(result.inputs)
+    titles = {channel: title for title, channel in columns}
+    sheets = [(sheet, channel) for sheet, channel in xlsx_sheets if channel in titles]
+    time = result.channels["time"]
+
+    with pd.ExcelWriter(filepath) as writer:
+        for i, (sheet, channel) in enumerate(sheets):
+            if progress:
+                progress(i/len(sheets), "Writing " + sheet.lower() + "...")
+            frame = pd.DataFrame({"Time (s)": time, titles[channel]: result.channels[channel]}, copy=False)
+            frame.to_excel(writer, sheet_name=sheet)
+
+        if progress:
+            progress(1.0, "Finishing xlsx export...")
+
+writers = {".csv": write_csv,
+           ".parquet": write_parquet,
+           ".feather": write_feather,
+           ".h5": write_hdf5,
+           ".hdf5": write_hdf5,
+           ".npz": write_npz,
+           ".xlsx": write_xlsx}
+
+export_extensions = tuple(writers)
+
+def export_result(result, filepath, progress=None):
+    """Writes a SimResult to filepath, in the format of its extension.
+
+       progress, if given, is called with (fraction, text) by the
+       writers that take long enough to need it."""
+
+    extension = os.path.splitext(filepath)[1].lower()
+    if extension not in writers:
+        raise ExportError("Unknown export format '" + extension + "', use one of " + ", ".join(export_extensions))
+
+    try:
+        writers[extension](result, filepath, progress)
+    except ImportError as e:
+        raise ExportError("Writing " + extension + " files needs an optional package: " + str(e))
@@ -0,0 +1,233 @@
+#   FLIGHT CONTROLLER PLUGINS
+
+# flight computer code that simulate() flies in the loop. Instead of
+# the simulator's own apogee check on every physics step, a controller
+# is called at its own rate, independent of the time increment, with
+# the state the flight computer would see, and commands the engine
+# shutdown. The simulator times every call, so the compute time of the
+# flight code can be held against its cycle time.
+
+# a plugin is a FlightController subclass in the controllers dict:
+# start() gets the design before the flight, update() is called every
+# cycle of the boost and returns True to command the engine shutdown.
+
+# usage: python flight_controllers.py demo_saves/apogee_target.txt --rate 50
+#        result = simulate(inputs, controller=create_controller("GNC_vx1", rate=50))
+
+import argparse
+import math
+import os
+import sys
+
+import numpy as np
+
+from trajectory_core import SimulationError, apogeeCheckHoldoff, predictApogeeDelayed, simulate
+
+# the experimental flight code is not a package
+experiment_dir = os.path.join(os.path.dirname(os.path.abspath(__file__)), "experiment")
+
+class FlightController:
+    """Base of the flight computer plugins.
+
+       rate is the number of update() calls per simulated second.
+       update() gets a trajectory_core.FlightState of the sample
+       (time, alt, alt_g, vel, accel, mass) and returns True to
+       command the engine shutdown. predicted_apogee is the last
+       apogee the controller predicted, for reports."""
+
+    name = "controller"
+
+    def __init__(self, rate=50.0):
+
+        if not rate > 0:
+            raise SimulationError("Flight controller rate must be positive.")
+
+        self.rate = float(rate)
+        self.predicted_apogee = None
+
+    def start(self, inputs, atmosphere):
+        """Called by simulate() before the flight, with its inputs and atmosphere."""
+        self.predicted_apogee = None
+
+    def update(self, state):
+        raise NotImplementedError
+
+class PredictorController(FlightController):
+    """The simulator's own apogee predictor at the controller rate.
+
+       Reads the true state of the vehicle. The acceleration trend
+       the predictor extrapolates over the shutdown delay is taken
+       between the last two calls and scaled to the time increment.
+       Like the built-in check, it skips the predictions while the
+       target is out of reach (see apogeeCheckHoldoff)."""
+
+    name = "simulator predictor"
+
+    def start(self, inputs, atmosphere):
+
+        super().start(inputs, atmosphere)
+        self.inputs = inputs
+        self.atmosphere = atmosphere
+        self.last_sample = None
+        self.holdoff_until = 0.0
+        self.accel_max = (inputs.mdot * inputs.eev + inputs.exit_area * max(inputs.exit_pressure, 0.0))/(inputs.mass_init - inputs.mass_propellant)
+        self.gravity_min = atmosphere.gravity(max(inputs.target_apogee, inputs.alt_init))
+
+    def update(self, state):
+
+        inputs = self.inputs
+        prev_accel = state.accel
+        if self.last_sample is not None and state.time > self.last_sample[0]:
+            last_time, last_accel = self.last_sample
+            prev_accel = state.accel - (state.accel - last_accel) * inputs.time_increment/(state.time - last_time)
+        self.last_sample = (state.time, state.accel)
+
+        if state.time < self.holdoff_until:
+            return False
+
+        self.predicted_apogee = predictApogeeDelayed(state.alt, state.vel, state.mass, inputs.drag_enabled, inputs.cross_sec,
+                                                     inputs.drag_coeff, inputs.time_increment, [prev_accel, state.accel],
+                                                     inputs.engine_shutdown_delay, inputs.mdot, self.atmosphere)
+        if self.predicted_apogee >= inputs.target_apogee:
+            return True
+
+        self.holdoff_until = state.time + apogeeCheckHoldoff(self.predicted_apogee, inputs.target_apogee, state.vel, self.accel_max,
+                                                             self.gravity_min, inputs.engine_shutdown_delay)
+        return False
+
+class GNCController(FlightController):
+    """The experimental flight code, experiment/GNC_vx1.py.
+
+       Like on the vehicle, it only reads the acceleration and
+       integrates its own state with dt = 1/rate. With a budget (s)
+       it runs the budgeted ApoapsisPredictor instead of integrating
+       to apoapsis on every call. native runs check_shutdown on the
+       native library (see native_predictor.py), if it is built."""
+
+    name = "GNC_vx1"
+
+    def __init__(self, rate=50.0, budget=None, native=False):
+
+        super().__init__(rate)
+        self.budget = budget
+
+        if experiment_dir not in sys.path:
+            sys.path.insert(0, experiment_dir)
+        import GNC_vx1
+        self.gnc = GNC_vx1
+
+        self.check_shutdown = GNC_vx1.check_shutdown
+        if native:
+            import native_predictor
+            self.check_shutdown = native_predictor.check_shutdown
+
+    def start(self, inputs, atmosphere):
+
+        super().start(inputs, atmosphere)
+        gnc = self.gnc
+
+        # the GNC always applies drag
+        c_drag = inputs.drag_coeff if inputs.drag_enabled else 0.0
+        (self.a, self.v, self.m, self.mdot, self.m_final, self.a_target, self.A_cSec, self.c_drag,
+         self.t_shutDelay, self.F_exp, self.t, _, _) = gnc.init_state(inputs.alt_init, 0.0, inputs.mass_init, inputs.mdot,
+                                                                      inputs.mass_init - inputs.mass_propellant,
+                                                                      inputs.target_apogee, inputs.cross_sec, c_drag,
+                                                                      inputs.engine_shutdown_delay, inputs.mdot * inputs.eev)
+        self.dt = 1/self.rate
+        self.atmosphere = atmosphere
+
+        self.predictor = None
+        if self.budget is not None:
+            self.predictor = gnc.ApoapsisPredictor(self.mdot, self.m_final, self.A_cSec, self.c_drag, self.t_shutDelay,
+                                                   self.F_exp, atmosphere, budget=self.budget)
+
+    def update(self, state):
+
+        gnc = self.gnc
+        self.a, self.v, self.m, self.mdot, self.t = gnc.update_state(self.a, self.v, self.m, self.mdot, self.m_final,
+                                                                     state.accel, self.t, self.dt)
+        if self.predictor is not None:
+            cmd_shutdown, self.predicted_apogee, confident = gnc.check_shutdown_budgeted(self.predictor, self.a, self.v,
+                                                                                         self.m, self.a_target)
+        else:
+            cmd_shutdown, self.predicted_apogee = self.check_shutdown(self.a, self.v, self.m, self.mdot, self.m_final,
+                                                                      self.a_target, self.A_cSec, self.c_drag,
+                                                                      self.t_shutDelay, self.F_exp, self.atmosphere)
+        return cmd_shutdown
+
+def _budgeted_gnc(rate=50.0):
+    # a quarter of the cycle, as in the replay harness
+    controller = GNCController(rate, budget=0.25/rate)
+    controller.name = "GNC_vx1 budgeted"
+    return controller
+
+def _native_gnc(rate=50.0):
+    controller = GNCController(rate, native=True)
+    controller.name = "GNC_vx1 native"
+    return controller
+
+# plugins by name, each takes the rate as its first argument
+controllers = {PredictorController.name: PredictorController,
+               GNCController.name: GNCController,
+               "GNC_vx1 budgeted": _budgeted_gnc,
+               "GNC_vx1 native": _native_gnc}
+
+def create_controller(name, rate=50.0):
+    """Returns a new controller of the named plugin."""
+
+    if name not in controllers:
+        raise SimulationError("Unknown flight controller " + repr(name) + ", choose from " + ", ".join(controllers) + ".")
+    return controllers[name](rate)
+
+def timing_report(result, controller):
+    """Text lines of the controller compute times of a run against its cycle time."""
+
+    if not result.controller_calls:
+        return [controller.name + ": no calls"]
+
+    times = np.array([call_time for sample_time, call_time in result.controller_calls])
+    cycle_time = 1/controller.rate
+    return [controller.name + " at " + ("%g" % controller.rate) + " Hz: " + str(times.size) + " calls, "
+            + ("%.3f" % (1e3 * times.sum())) + " ms in total",
+            "compute time per call: mean %.3f, p99 %.3f, max %.3f ms (cycle %.1f ms, %.1f%% used on average)"
+            % (1e3 * times.mean(), 1e3 * float(np.percentile(times, 99)), 1e3 * times.max(), 1e3 * cycle_time,
+               100 * times.mean()/cycle_time),
+            "calls over the cycle time: " + str(int((times > cycle_time).sum()))]
+
+def main():
+
+    from profiling import PhaseProfiler
+    from savefile import read_save_file
+
+    parser = argparse.ArgumentParser(description="Flies a design with each flight controller plugin in the loop.")
+    parser.add_argument("save", help="save file with an apogee target")
+    parser.add_argument("--rate", type=float, default=50.0, help="controller calls per simulated second")
+    parser.add_argument("--controller", action="append", choices=list(controllers),
+                        help="plugins to fly, all by default (repeatable)")
+    args = parser.parse_args()
+
+    inputs = read_save_file(args.save)[0]
+    if not inputs.target_apogee_enabled:
+        parser.error("the save file has no apogee target")
+
+    profiler = PhaseProfiler()
+    result = simulate(inputs, profiler=profiler)
+    print("%-22s %8s %8s %10s %12s %10s" % ("apogee check", "rate", "calls", "time (ms)", "apogee (m)", "error (m)"))
+    print("%-22s %8g %8d %10.2f %12.1f %+10.2f" % ("built in, every step", 1/inputs.time_increment,
+                                                  profiler.calls["apogee prediction"], 1e3 * profiler.times["apogee prediction"],
+                                                  result.alt_max, result.alt_max - inputs.target_apogee))
+
+    reports = []
+    for name in args.controller or list(controllers):
+        controller = create_controller(name, args.rate)
+        result = simulate(inputs, controller=controller)
+        times = [call_time for sample_time, call_time in result.controller_calls]
+        print("%-22s %8g %8d %10.2f %12.1f %+10.2f" % (name, controller.rate, len(times), 1e3 * math.fsum(times),
+                                                      result.alt_max, result.alt_max - inputs.target_apogee))
+        reports.append(timing_report(result, controller))
+
+    for lines in reports:
+        print("\n" + "\n".join(lines))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,398 @@
+#   COMPILED STEP KERNEL
+
+# the fixed-step loop of trajectory_core.simulate() (boost, coast, drogue
+# and main chute phases, with the apogee predictor) written as plain
+# scalar functions on floats and NumPy arrays, so Numba can compile it
+# to machine code. The operations are the same, in the same order, as
+# in the Python loop, so the results match it to the last few bits.
+
+# Numba is optional. Without it simulate_jit() and predict_apogee_delayed()
+# simply call their pure Python counterparts in trajectory_core.
+
+# usage: from jit_kernel import simulate_jit
+#        result = simulate_jit(inputs)
+
+import math
+from time import perf_counter
+
+import numpy as np
+
+from atmosphere import Atmosphere
+from results import ResultStore, flight_channels
+from trajectory_core import (SimResult, InsufficientThrustError, ChuteOrderError,
+                             simulate, predictApogeeDelayed, standard_atmosphere)
+
+try:
+    import numba
+except ImportError:
+    numba = None
+
+jit_available = numba is not None
+
+if jit_available:
+    # cache=True keeps the machine code in __pycache__, so only the
+    # first run after an edit pays the few seconds of compiling
+    njit = numba.njit(cache=True)
+else:
+    def njit(function):
+        return function
+
+# SimResult fields filled in by the kernel, in the order of its output array
+kernel_outputs = ("alt_max", "tt_apoapsis", "max_Q", "vel_max", "tt_max_vel", "accel_max",
+                  "isp_min", "isp_max", "cutoff_time", "flight_time", "impact_vel")
+
+ALT_MAX, TT_APOAPSIS, MAX_Q, VEL_MAX, TT_MAX_VEL, ACCEL_MAX, ISP_MIN, ISP_MAX, CUTOFF_TIME, FLIGHT_TIME, IMPACT_VEL = range(len(kernel_outputs))
+
+# - - - - - - - - - - - - - - - - - - - - - - - - - - - -
+#                 ATMOSPHERE (see atmosphere.py)
+# - - - - - - - - - - - - - - - - - - - - - - - - - - - -
+
+# same interpolation as Atmosphere.lookup(), on the rows of Atmosphere.tables
+
+@njit
+def _density(tables, resolution, altitude):
+
+    last = tables.shape[1] - 1
+    position = altitude/resolution
+    if position <= 0:
+        return tables[0, 0]
+
+    index = int(position)
+    if index >= last:
+        return tables[0, last]
+
+    return tables[0, index] + (tables[0, index + 1] - tables[0, index]) * (position - index)
+
+@njit
+def _density_pressure(tables, resolution, altitude):
+
+    last = tables.shape[1] - 1
+    position = altitude/resolution
+    if position <= 0:
+        return tables[0, 0], tables[1, 0]
+
+    index = int(position)
+    if index >= last:
+        return tables[0, last], tables[1, last]
+
+    fraction = position - index
+    return (tables[0, index] + (tables[0, index + 1] - tables[0, index]) * fraction,
+            tables[1, index] + (tables[1, index + 1] - tables[1, index]) * fraction)
+
+@njit
+def _gravity(altitude):
+    return 9.80665 * (6369000/(6369000+altitude))**2
+
+# - - - - - - - - - - - - - - - - - - - - - - - - - - - -
+#                 APOGEE PREDICTION
+# - - - - - - - - - - - - - - - - - - - - - - - - - - - -
+
+@njit
+def _predict_apogee(alt, vel, mass, drag_enabled, cross_sec, drag_coeff, time_increment,
+                    accel_prev, accel_last, shutdown_delay, mdot, tables, resolution):
+
+    time = 0.0
+    accel = accel_last
+
+    while True:
+
+        time = time + time_increment
+
+        if time < shutdown_delay:
+            vel = vel + accel * time_increment
+            accel = accel + (accel_last - accel_prev)
+            mass = mass - mdot * time_increment
+        else:
+            gravity = -_gravity(alt)
+            if drag_enabled:
+                drag = (0.5 * _density(tables, resolution, alt) * vel**2 * drag_coeff * cross_sec) * -(1.0 if vel >= 0 else -1.0)
+            else:
+                drag = 0.0
+            vel = vel + gravity * time_increment + drag/mass * time_increment
+
+        alt = alt + vel * time_increment
+
+        if vel <= 0:
+            return alt
+
+@njit
+def _apogee_check_skip(predicted_apogee, target_apogee, vel, accel_bound, gravity_min, shutdown_delay, time_increment):
+
+    gap = 0.5 * (target_apogee - predicted_apogee)
+    if gap <= 0:
+        skip_time = 0.0
+    else:
+        vel = max(vel, 0.0) + accel_bound * max(shutdown_delay, 0.0)
+        skip_time = (math.sqrt(vel**2 + 2 * gravity_min * gap) - vel)/accel_bound
+
+    return max(int(skip_time/time_increment) - 1, 0)
+
+# - - - - - - - - - - - - - - - - - - - - - - - - - - - -
+#                     SIMULATION
+# - - - - - - - - - - - - - - - - - - - - - - - - - - - -
+
+@njit
+def _fly(eev, mdot, mass_init, mass_propellant, alt_init, exit_pressure, exit_area, time_increment,
+         drag_enabled, cross_sec, drag_coeff,
+         target_apogee_enabled, target_apogee, engine_shutdown_delay, shutdown_command_time,
+         drogue_enabled, drogue_deploy_alt, drogue_deploy_time, drogue_area, drogue_coeff, drogue_mass,
+         chute_enabled, chute_deploy_alt, chute_deploy_time, chute_area, chute_coeff,
+         exhaustive_apogee_check, tables, resolution, rows):
+
+    # rows past the end of the table are flown but not recorded
+    capacity = rows.shape[1]
+    length = 0
+    outputs = np.full(len(kernel_outputs), np.nan)
+
+    alt = alt_init
+    density, air_pressure = _density_pressure(tables, resolution, alt_init)
+    thrust = mdot * eev + exit_area * (exit_pressure - air_pressure)
+    mass = mass_init
+    vel = 0.0
+    accel = 0.0
+    external_pressure = air_pressure
+    isp = (thrust)/(mdot * 9.80665)
+    outputs[ISP_MIN] = isp
+    drag = 0.0
+    dyn_press = 0.0
+    gravity = -_gravity(alt_init)
+    time = 0.0
+
+    prev_accel = accel
+
+    is_going_up = True
+    is_accelerating_up = True
+
+    engine_shutdown = False
+    engine_shutdown_command = False
+    time_since_shutdown_command = 0.0
+    command_time = math.inf
+
+    drogue_deployment = 0.0
+    chute_deployment = 0.0
+
+    drogue_released = False
+
+    # maxima of the recorded channels, what channels.max() gives in simulate()
+    dyn_press_max = -np.inf
+    vel_max = -np.inf
+    accel_max = -np.inf
+    isp_max = -np.inf
+
+    apogee_check_countdown = 0
+    accel_bound = 0.0
+    gravity_min = 0.0
+    if target_apogee_enabled:
+        accel_bound = (mdot * eev + exit_area * max(exit_pressure, 0.0))/(mass_init - mass_propellant)
+        gravity_min = _gravity(max(target_apogee, alt_init))
+
+    while True:
+
+        # see results.flight_channels for the order
+        if length < capacity:
+            rows[0, length] = time
+            rows[1, length] = alt
+            rows[2, length] = vel
+            rows[3, length] = accel
+            rows[4, length] = thrust
+            rows[5, length] = external_pressure
+            rows[6, length] = -gravity
+            rows[7, length] = isp
+            rows[8, length] = drag
+            rows[9, length] = dyn_press
+            rows[10, length] = drogue_deployment if not drogue_released else 0.0
+            rows[11, length] = chute_deployment
+            rows[12, length] = mass
+        length = length + 1
+
+        dyn_press_max = max(dyn_press_max, dyn_press)
+        vel_max = max(vel_max, vel)
+        accel_max = max(accel_max, accel)
+        isp_max = max(isp_max, isp)
+
+        time = time + time_increment
+
+        if target_apogee_enabled and not engine_shutdown_command and shutdown_command_time >= 0.0:
+            engine_shutdown_command = time >= shutdown_command_time
+        elif target_apogee_enabled and not engine_shutdown_command and time > time_increment * 2:
+            if apogee_check_countdown > 0:
+                apogee_check_countdown = apogee_check_countdown - 1
+            else:
+                predicted_apogee = _predict_apogee(alt, vel, mass, drag_enabled, cross_sec, drag_coeff, time_increment,
+                                                   prev_accel, accel, engine_shutdown_delay, mdot, tables, resolution)
+                engine_shutdown_command = predicted_apogee >= target_apogee
+                if engine_shutdown_command:
+                    time_since_shutdown_command = 0.0
+                    command_time = time
+                elif not exhaustive_apogee_check:
+                    apogee_check_countdown = _apogee_check_skip(predicted_apogee, target_apogee, vel, accel_bound,
+                                                                gravity_min, engine_shutdown_delay, time_increment)
+
+        if engine_shutdown_command and time_since_shutdown_command < engine_shutdown_delay:
+            time_since_shutdown_command = time_since_shutdown_command + time_increment
+        elif engine_shutdown_command and time_since_shutdown_command >= engine_shutdown_delay and not engine_shutdown:
+            engine_shutdown = True
+
+        gravity = -_gravity(alt)
+        external_pressure = air_pressure
+
+        if mass > (mass_init - mass_propellant) and ((target_apogee_enabled and not engine_shutdown) or not target_apogee_enabled):
+            vel = vel + ((thrust/mass) * time_increment) + (gravity * time_increment) + (drag/mass * time_increment)
+            mass = mass - mdot * time_increment
+            thrust = mdot * eev + exit_area * (exit_pressure - external_pressure)
+        else:
+            thrust = 0.0
+            vel = vel + gravity * time_increment + drag/mass * time_increment
+
+        if drogue_enabled and not is_going_up and alt <= drogue_deploy_alt:
+            if drogue_deployment < 1.0:
+                drogue_deployment = drogue_deployment + time_increment/drogue_deploy_time
+
+        if chute_enabled and not is_going_up and alt <= chute_deploy_alt:
+            if drogue_enabled and not drogue_released:
+                drogue_released = True
+                mass = mass - drogue_mass
+
+            if chute_deployment < 1.0:
+                chute_deployment = chute_deployment + time_increment/chute_deploy_time
+
+        alt = alt + vel * time_increment
+        prev_accel = accel
+        accel = thrust/mass + gravity + drag/mass
+        isp = (thrust)/(mdot * 9.80665)
+        density, air_pressure = _density_pressure(tables, resolution, alt)
+
+        if drag_enabled:
+            direction = -(1.0 if vel >= 0 else -1.0)
+
+            if drogue_deployment > 0.0 and not drogue_released:
+                airflow_area = cross_sec + (drogue_area - cross_sec) * drogue_deployment
+                drag = (0.5 * density * vel**2 * drogue_coeff * airflow_area) * direction
+
+            elif chute_deployment > 0.0:
+                airflow_area = cross_sec + (chute_area - cross_sec) * chute_deployment
+                drag = (0.5 * density * vel**2 * chute_coeff * airflow_area) * direction
+
+            else:
+                drag = (0.5 * density * vel**2 * drag_coeff * cross_sec) * direction
+
+            dyn_press = 0.5 * density * vel**2
+
+        if is_going_up and vel <= 0:
+            is_going_up = False
+            outputs[TT_APOAPSIS] = time
+            outputs[ALT_MAX] = alt
+            outputs[MAX_Q] = dyn_press_max
+
+        if is_accelerating_up and (not mass > (mass_init - mass_propellant) or (target_apogee_enabled and engine_shutdown)):
+            is_accelerating_up = False
+            outputs[TT_MAX_VEL] = time
+            outputs[VEL_MAX] = vel_max
+            outputs[ACCEL_MAX] = accel_max
+            outputs[ISP_MAX] = isp_max
+            outputs[CUTOFF_TIME] = time
+
+        # vehicle reached ground!
+        if alt <= alt_init:
+            outputs[FLIGHT_TIME] = time
+            outputs[IMPACT_VEL] = vel
+            break
+
+    return length, outputs, command_time
+
+# - - - - - - - - - - - - - - - - - - - - - - - - - - - -
+#                 PUBLIC INTERFACE
+# - - - - - - - - - - - - - - - - - - - - - - - - - - - -
+
+def kernel_supports(atmosphere):
+    """True if the kernel can stand in for the given atmosphere.
+
+       The kernel does the lookups of atmosphere.Atmosphere itself,
+       on its tables, subclasses with their own lookups need the
+       Python loop."""
+
+    return jit_available and type(atmosphere) is Atmosphere
+
+def kernel_arguments(inputs, atmosphere=standard_atmosphere, exhaustive_apogee_check=False):
+    """Arguments of _fly() for a run, all but the table to fill."""
+
+    return [float(inputs.eev), float(inputs.mdot), float(inputs.mass_init), float(inputs.mass_propellant),
+            float(inputs.alt_init), float(inputs.exit_pressure), float(inputs.exit_area), float(inputs.time_increment),
+            bool(inputs.drag_enabled), float(inputs.cross_sec), float(inputs.drag_coeff),
+            bool(inputs.target_apogee_enabled), float(inputs.target_apogee),
+            float(inputs.engine_shutdown_delay), float(inputs.shutdown_command_time),
+            bool(inputs.drogue_enabled), float(inputs.drogue_deploy_alt), float(inputs.drogue_deploy_time),
+            float(inputs.drogue_area), float(inputs.drogue_coeff), float(inputs.drogue_mass),
+            bool(inputs.chute_enabled), float(inputs.chute_deploy_alt), float(inputs.chute_deploy_time),
+            float(inputs.chute_area), float(inputs.chute_coeff),
+            bool(exhaustive_apogee_check), atmosphere.tables, atmosphere.resolution]
+
+def simulate_jit(inputs, step_callback=None, atmosphere=standard_atmosphere, exhaustive_apogee_check=False, store=None, profiler=None):
+    """Same as trajectory_core.simulate(), on the compiled kernel.
+
+       The kernel runs the whole flight without coming back to
+       Python, so runs with a step_callback or a store, and runs
+       without Numba, are handed to trajectory_core.simulate().
+       A profiler only gets the time of the two kernel flights,
+       the phases inside them can't be told apart."""
+
+    if step_callback is not None or store is not None or not kernel_supports(atmosphere):
+        return simulate(inputs, step_callback, atmosphere, exhaustive_apogee_check, store, profiler)
+
+    run_start = perf_counter()
+    inputs.validate()
+
+    # same checks, in the same order, as simulate()
+    thrust = inputs.mdot * inputs.eev + inputs.exit_area * (inputs.exit_pressure - atmosphere.pressure(inputs.alt_init))
+    if thrust < (atmosphere.gravity(inputs.alt_init) * inputs.mass_init):
+        raise InsufficientThrustError("Not enough thrust - vehicle won't lift off.")
+    if inputs.drogue_enabled and inputs.chute_enabled and inputs.drogue_deploy_alt <= inputs.chute_deploy_alt:
+        raise ChuteOrderError("Attempt to deploy main chute before drogue!")
+
+    arguments = kernel_arguments(inputs, atmosphere, exhaustive_apogee_check)
+
+    # the number of steps is only known after the flight, so the kernel
+    # flies once to count them and again to fill a table of the exact
+    # size. Flying is cheaper than growing the table: every reallocation
+    # touches fresh memory, and the page faults cost more than the physics.
+    length, outputs, command_time = _fly(*arguments, np.empty((len(flight_channels), 0)))
+
+    # the second flight sends the shutdown command at the time the
+    # predictor chose in the first, instead of polling it again
+    if inputs.target_apogee_enabled and inputs.shutdown_command_time < 0.0:
+        arguments[14] = command_time
+
+    rows = np.empty((len(flight_channels), length))
+    length, outputs, command_time = _fly(*arguments, rows)
+
+    result = SimResult(inputs, channels=ResultStore.from_table(rows, flight_channels))
+    result.ground_level = inputs.alt_init
+    for name, value in zip(kernel_outputs, outputs.tolist()):
+        # outputs never reached stay None, as in simulate()
+        setattr(result, name, None if math.isnan(value) else value)
+
+    if profiler is not None:
+        profiler.wall_time = perf_counter() - run_start
+        profiler.add("compiled kernel", profiler.wall_time, 2)
+        profiler.count("steps", length)
+        result.profile = profiler
+    return result
+
+def predict_apogee_delayed(param_a, param_v, param_m, drag_model, param_cross_sec, param_drag_coeff, param_time_incr,
+                           param_last_accel, param_delay, param_mdot, atmosphere=standard_atmosphere):
+    """trajectory_core.predictApogeeDelayed() on the compiled kernel, same arguments."""
+
+    if not kernel_supports(atmosphere):
+        return predictApogeeDelayed(param_a, param_v, param_m, drag_model, param_cross_sec, param_drag_coeff, param_time_incr,
+                                    param_last_accel, param_delay, param_mdot, atmosphere)
+
+    return _predict_apogee(float(param_a), float(param_v), float(param_m), bool(drag_model), float(param_cross_sec),
+                           float(param_drag_coeff), float(param_time_incr), float(param_last_accel[0]), float(param_last_accel[1]),
+                           float(param_delay), float(param_mdot), atmosphere.tables, atmosphere.resolution)
+
+def calc_apogee_delayed(param_a, param_v, param_m, target_apogee, drag_model, param_cross_sec, param_drag_coeff, param_time_incr,
+                        param_last_accel, param_delay, param_mdot, atmosphere=standard_atmosphere):
+    """trajectory_core.calcApogeeDelayed() on the compiled kernel, same arguments."""
+
+    return predict_apogee_delayed(param_a, param_v, param_m, drag_model, param_cross_sec, param_drag_coeff, param_time_incr,
+                                  param_last_accel, param_delay, param_mdot, atmosphere) >= target_apogee
@@ -0,0 +1,307 @@
+#   MONTE CARLO DISPERSION ENGINE
+
+# propagates input uncertainties by flying many trajectories at once:
+# every sample is a lane in a set of NumPy arrays, and all lanes are
+# advanced through the same fixed-step loop as trajectory_core.simulate(),
+# with per-lane masks for the boost, coast, drogue and main phases
+
+from dataclasses import dataclass, fields
+
+import numpy as np
+
+from trajectory_core import SimInputs, standard_atmosphere
+
+# inputs that can be dispersed (everything numeric except the time step)
+dispersible_inputs = [f.name for f in fields(SimInputs) if f.type in (float, "float") and f.name != "time_increment"]
+
+# lanes still in the air after this many simulated seconds are given up
+max_flight_time = 3600.0
+
+# radius of the inverse-square gravity model of atmosphere.py (m)
+earth_radius = 6369000.0
+
+@dataclass
+class Normal:
+    """Normally distributed input, centered on the base value."""
+    sigma: float
+
+    def sample(self, rng, base, n):
+        return rng.normal(base, self.sigma, n)
+
+@dataclass
+class Uniform:
+    """Uniformly distributed input between low and high."""
+    low: float
+    high: float
+
+    def sample(self, rng, base, n):
+        return rng.uniform(self.low, self.high, n)
+
+class DispersionResult:
+    """Per-sample outputs of a dispersion run, as NumPy arrays.
+
+       Samples that could not be flown (not enough thrust, main chute
+       above the drogue, propellant heavier than the vehicle), whose
+       state stopped being finite or that did not land within
+       max_flight_time are flagged in failed and hold NaN outputs."""
+
+    outputs = ["alt_max", "tt_apoapsis", "max_Q", "vel_max", "tt_max_vel", "accel_max",
+               "cutoff_time", "flight_time", "impact_vel"]
+
+    def __init__(self, samples, n):
+        self.samples = samples
+        self.n = n
+        self.failed = np.zeros(n, dtype=bool)
+        for name in self.outputs:
+            setattr(self, name, np.full(n, np.nan))
+
+    def percentiles(self, q=(1, 5, 50, 95, 99)):
+        """Returns {output: {percentile: value}} over the flown samples."""
+
+        summary = {}
+        for name in self.outputs:
+            values = getattr(self, name)[~self.failed]
+            if len(values) == 0:
+                summary[name] = {p: float("nan") for p in q}
+            else:
+                summary[name] = dict(zip(q, np.percentile(values, q).tolist()))
+        return summary
+
+    def summary(self, q=(1, 5, 50, 95, 99)):
+        """Percentile table as printable text."""
+
+        lines = ["%-12s" % "output" + "".join("%14s" % ("P" + str(p)) for p in q)]
+        for name, values in self.percentiles(q).items():
+            lines.append("%-12s" % name + "".join("%14.4f" % values[p] for p in q))
+        lines.append("%d samples, %d failed" % (self.n, int(self.failed.sum())))
+        return "\n".join(lines)
+
+def sample_inputs(base, dispersions, n, seed=None):
+    """Draws n values for each dispersed input.
+
+       dispersions maps input names to a Normal, a Uniform or an array
+       of n values. Returns a dict of float64 arrays, one per input
+       that differs between samples."""
+
+    rng = np.random.default_rng(seed)
+    samples = {}
+
+    for name, spec in dispersions.items():
+        if name not in dispersible_inputs:
+            raise ValueError("Input '" + name + "' can not be dispersed.")
+        if hasattr(spec, "sample"):
+            samples[name] = np.asarray(spec.sample(rng, getattr(base, name), n), dtype=np.float64)
+        else:
+            samples[name] = np.asarray(spec, dtype=np.float64)
+            if samples[name].shape != (n,):
+                raise ValueError("Samples of '" + name + "' must be an array of length " + str(n) + ".")
+
+    return samples
+
+def run_dispersion(base, dispersions, n, seed=None, atmosphere=standard_atmosphere, chunk_size=65536,
+                   time_limit=max_flight_time):
+    """Samples the dispersions around base (a SimInputs) and flies them all.
+
+       Returns a DispersionResult."""
+
+    samples = sample_inputs(base, dispersions, n, seed)
+    return simulate_batch(base, samples, n, atmosphere, chunk_size, time_limit)
+
+def simulate_batch(base, samples, n, atmosphere=standard_atmosphere, chunk_size=65536, time_limit=max_flight_time):
+    """Flies n trajectories in lockstep.
+
+       Every input is taken from base unless samples holds an array
+       for it. Large batches are split into chunks of chunk_size lanes
+       to keep the working set small. Lanes that haven't landed after
+       time_limit simulated seconds are flagged as failed."""
+
+    if base.target_apogee_enabled:
+        raise ValueError("Apogee targeting needs a per-sample prediction and is not supported in dispersion runs.")
+
+    result = DispersionResult(samples, n)
+
+    for start in range(0, n, chunk_size):
+        stop = min(start + chunk_size, n)
+        lanes = slice(start, stop)
+
+        params = {}
+        for name in dispersible_inputs:
+            if name in samples:
+                params[name] = samples[name][lanes]
+            else:
+                params[name] = np.full(stop - start, float(getattr(base, name)))
+
+        _fly_chunk(base, params, stop - start, atmosphere, result, start, time_limit)
+
+    return result
+
+def _fly_chunk(base, p, n, atmosphere, result, offset, time_limit):
+
+    time_increment = base.time_increment
+    drag_enabled = base.drag_enabled
+    drogue_enabled = base.drogue_enabled
+    chute_enabled = base.chute_enabled
+
+    eev = p["eev"]
+    mdot = p["mdot"]
+    mass_init = p["mass_init"]
+    mass_dry = p["mass_init"] - p["mass_propellant"]
+    alt_init = p["alt_init"]
+    exit_pressure = p["exit_pressure"]
+    exit_area = p["exit_area"]
+    cross_sec = p["cross_sec"]
+    drag_coeff = p["drag_coeff"]
+
+    # - - - INITIAL VALUES - - -
+
+    alt = alt_init.copy()
+    external_pressure = atmosphere.pressure_array(alt)
+    thrust = mdot * eev + exit_area * (exit_pressure - external_pressure)
+    mass = mass_init.copy()
+    vel = np.zeros(n)
+    accel = np.zeros(n)
+    isp = (thrust)/(mdot * 9.80665)
+    drag = np.zeros(n)
+    dyn_press = np.zeros(n)
+    gravity = -atmosphere.gravity_array(alt)
+    time = 0
+
+    # lanes that can't be flown, same checks as simulate()
+    failed = (p["mass_propellant"] >= mass_init) | (thrust < (-gravity * mass_init))
+    if drogue_enabled and chute_enabled:
+        failed |= p["drogue_deploy_alt"] <= p["chute_deploy_alt"]
+
+    going_up = np.ones(n, dtype=bool)
+    accelerating_up = np.ones(n, dtype=bool)
+    drogue_deployment = np.zeros(n)
+    chute_deployment = np.zeros(n)
+    drogue_released = np.zeros(n, dtype=bool)
+
+    # running maxima of the recorded histories
+    vel_max = np.full(n, -np.inf)
+    accel_max = np.full(n, -np.inf)
+    max_Q = np.full(n, -np.inf)
+
+    out = {name: np.full(n, np.nan) for name in DispersionResult.outputs}
+
+    # lane -> sample index, lanes are dropped once they have landed
+    index = np.arange(n)
+    landed = failed.copy()
+    lost = False
+
+    # - - - BEGIN TIMESTEPS - - -
+
+    while True:
+
+        # drop finished lanes once enough of them pile up, lost ones right away
+        if landed.any() and (landed.all() or landed.mean() > 0.25 or lost):
+            keep = ~landed
+            if not keep.any():
+                break
+            index = index[keep]
+            (eev, mdot, mass_init, mass_dry, alt_init, exit_pressure, exit_area, cross_sec, drag_coeff,
+             alt, external_pressure, thrust, mass, vel, accel, isp, drag, dyn_press, gravity,
+             going_up, accelerating_up, drogue_deployment, chute_deployment, drogue_released,
+             vel_max, accel_max, max_Q, landed) = [
+                a[keep] for a in (eev, mdot, mass_init, mass_dry, alt_init, exit_pressure, exit_area, cross_sec, drag_coeff,
+                                  alt, external_pressure, thrust, mass, vel, accel, isp, drag, dyn_press, gravity,
+                                  going_up, accelerating_up, drogue_deployment, chute_deployment, drogue_released,
+                                  vel_max, accel_max, max_Q, landed)]
+            p = {name: values[keep] for name, values in p.items()}
+
+        vel_max = np.maximum(vel_max, vel)
+        accel_max = np.maximum(accel_max, accel)
+        max_Q = np.maximum(max_Q, dyn_press)
+
+        time = time + time_increment
+
+        gravity = -atmosphere.gravity_array(alt)
+        external_pressure = atmosphere.pressure_array(alt)
+
+        # boost phase mask
+        burning = mass > mass_dry
+        vel = np.where(burning,
+                       vel + ((thrust/mass) * time_increment) + (gravity * time_increment) + (drag/mass * time_increment),
+                       vel + gravity * time_increment + drag/mass * time_increment)
+        mass = np.where(burning, mass - mdot * time_increment, mass)
+        thrust = np.where(burning, mdot * eev + exit_area * (exit_pressure - external_pressure), 0.0)
+
+        # recovery phase masks
+        if drogue_enabled:
+            deploying = ~going_up & (alt <= p["drogue_deploy_alt"]) & (drogue_deployment < 1.0)
+            drogue_deployment = np.where(deploying, drogue_deployment + time_increment/p["drogue_deploy_time"], drogue_deployment)
+
+        if chute_enabled:
+            below = ~going_up & (alt <= p["chute_deploy_alt"])
+            if drogue_enabled:
+                release = below & ~drogue_released
+                drogue_released = drogue_released | release
+                mass = np.where(release, mass - p["drogue_mass"], mass)
+            deploying = below & (chute_deployment < 1.0)
+            chute_deployment = np.where(deploying, chute_deployment + time_increment/p["chute_deploy_time"], chute_deployment)
+
+        alt = alt + vel * time_increment
+        accel = thrust/mass + gravity + drag/mass
+        isp = (thrust)/(mdot * 9.80665)
+
+        if drag_enabled:
+            density = atmosphere.density_array(alt)
+            coeff = drag_coeff
+            area = cross_sec
+            if chute_enabled:
+                chute_open = chute_deployment > 0.0
+                coeff = np.where(chute_open, p["chute_coeff"], coeff)
+                area = np.where(chute_open, cross_sec + (p["chute_area"] - cross_sec) * chute_deployment, area)
+            if drogue_enabled:
+                drogue_open = (drogue_deployment > 0.0) & ~drogue_released
+                coeff = np.where(drogue_open, p["drogue_coeff"], coeff)
+                area = np.where(drogue_open, cross_sec + (p["drogue_area"] - cross_sec) * drogue_deployment, area)
+            drag = (0.5 * density * vel**2 * coeff * area) * np.where(vel >= 0, -1.0, 1.0)
+            dyn_press = 0.5 * density * vel**2
+
+        # apogee
+        apogee = going_up & (vel <= 0) & ~landed
+        if apogee.any():
+            going_up = going_up & ~apogee
+            lanes = index[apogee]
+            out["alt_max"][lanes] = alt[apogee]
+            out["tt_apoapsis"][lanes] = time
+            out["max_Q"][lanes] = max_Q[apogee]
+
+        # burnout
+        burnout = accelerating_up & ~(mass > mass_dry) & ~landed
+        if burnout.any():
+            accelerating_up = accelerating_up & ~burnout
+            lanes = index[burnout]
+            out["tt_max_vel"][lanes] = time
+            out["vel_max"][lanes] = vel_max[burnout]
+            out["accel_max"][lanes] = accel_max[burnout]
+            out["cutoff_time"][lanes] = time
+
+        # vehicle reached ground!
+        impact = (alt <= alt_init) & ~landed
+        if impact.any():
+            lanes = index[impact]
+            out["flight_time"][lanes] = time
+            out["impact_vel"][lanes] = vel[impact]
+            landed = landed | impact
+
+        # lanes whose state blew up (e.g. burning down to no mass) or
+        # that don't come down (coasting faster than the escape speed)
+        # would keep the loop going forever
+        lost_lanes = ~landed & ~(np.isfinite(alt) & np.isfinite(vel) & np.isfinite(mass))
+        lost_lanes |= ~landed & ~burning & (vel > 0) & (vel**2 >= 2 * -gravity * (earth_radius + alt))
+        if time >= time_limit:
+            lost_lanes |= ~landed
+        lost = lost_lanes.any()
+        if lost:
+            lanes = index[lost_lanes]
+            failed[lanes] = True
+            for name in DispersionResult.outputs:
+                out[name][lanes] = np.nan
+            landed = landed | lost_lanes
+
+    lanes = slice(offset, offset + n)
+    result.failed[lanes] = failed
+    for name in DispersionResult.outputs:
+        getattr(result, name)[lanes] = out[name]
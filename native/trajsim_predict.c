@@ -0,0 +1,31 @@
+/*
+   TRAJSIM PREDICT - see trajsim_predict.h
+
+   build: cc -O2 -shared -fPIC -ffp-contract=off -o libtrajsim_predict.so trajsim_predict.c -lm
+          cl /O2 /fp:precise /LD trajsim_predict.c /Fe:trajsim_predict.dll
+   or simply: python native_predictor.py --build
+
+   -ffp-contract=off keeps the compiler from fusing multiply-adds,
+   which would round differently from Python.
+*/
+
+#include <math.h>
+#include <stddef.h>
+
+#include "trajsim_predict.h"
+
+int trajsim_predict_api_version(void) {
+	return TRAJSIM_PREDICT_API_VERSION;
+}
+
+#define REAL double
+#define NAME(name) name
+#include "trajsim_predict_impl.h"
+#undef REAL
+#undef NAME
+
+#define REAL float
+#define NAME(name) name##_f
+#include "trajsim_predict_impl.h"
+#undef REAL
+#undef NAME
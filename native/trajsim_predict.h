@@ -0,0 +1,71 @@
+/*
+   TRAJSIM PREDICT - APOGEE PREDICTORS AS A C LIBRARY
+
+   the apogee predictor of ApogeePredict.cpp (calcApogee) and the
+   apoapsis check of experiment/GNC.c (checkShutdown) as a portable
+   shared library. Unlike the original programs they keep no global
+   state and read no files: the density table (the density row of
+   atmosphere.Atmosphere.tables) and the vehicle come in as arguments.
+
+   The steps follow trajectory_core.predictApogeeDelayed() and
+   GNC_vx1.check_shutdown() operation by operation, so the double
+   versions match the Python ones to the last few bits (Python's
+   x**2 calls pow(), which now and then rounds differently from
+   x * x). The _f versions are the same code in float, like the
+   flight computer programs.
+
+   The API only ever gains functions, TRAJSIM_PREDICT_API_VERSION
+   goes up when it does. Built and loaded by native_predictor.py.
+*/
+
+#ifndef TRAJSIM_PREDICT_H
+#define TRAJSIM_PREDICT_H
+
+#ifdef _WIN32
+#define TRAJSIM_EXPORT __declspec(dllexport)
+#else
+#define TRAJSIM_EXPORT __attribute__((visibility("default")))
+#endif
+
+#define TRAJSIM_PREDICT_API_VERSION 1
+
+/* a prediction gives up after this many steps and returns NaN */
+#define TRAJSIM_MAX_STEPS 100000000L
+
+#ifdef __cplusplus
+extern "C" {
+#endif
+
+TRAJSIM_EXPORT int trajsim_predict_api_version(void);
+
+/* apogee (m) if the engine shutdown command was sent now, see
+   predictApogeeDelayed(). density has rows entries, resolution meters
+   apart, from sea level up. steps, if not NULL, gets the number of
+   integration steps. */
+TRAJSIM_EXPORT double trajsim_predict_apogee(double alt, double vel, double mass, int drag_enabled,
+                                             double cross_sec, double drag_coeff, double time_increment,
+                                             double accel_prev, double accel_last, double shutdown_delay, double mdot,
+                                             const double *density, long rows, double resolution, long *steps);
+
+TRAJSIM_EXPORT float trajsim_predict_apogee_f(float alt, float vel, float mass, int drag_enabled,
+                                              float cross_sec, float drag_coeff, float time_increment,
+                                              float accel_prev, float accel_last, float shutdown_delay, float mdot,
+                                              const float *density, long rows, float resolution, long *steps);
+
+/* 1 if the predicted apoapsis is at or above a_target, see
+   GNC_vx1.check_shutdown(). The apoapsis (m) goes to *apoapsis. */
+TRAJSIM_EXPORT int trajsim_check_shutdown(double a, double v, double m, double mdot, double m_final, double a_target,
+                                          double A_cSec, double c_drag, double t_shutDelay, double F_exp, double dt,
+                                          const double *density, long rows, double resolution,
+                                          double *apoapsis, long *steps);
+
+TRAJSIM_EXPORT int trajsim_check_shutdown_f(float a, float v, float m, float mdot, float m_final, float a_target,
+                                            float A_cSec, float c_drag, float t_shutDelay, float F_exp, float dt,
+                                            const float *density, long rows, float resolution,
+                                            float *apoapsis, long *steps);
+
+#ifdef __cplusplus
+}
+#endif
+
+#endif
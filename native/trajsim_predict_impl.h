@@ -0,0 +1,131 @@
+/*
+   body of trajsim_predict.c, included once per precision with
+   REAL set to the floating point type and NAME() adding the
+   suffix of the function names
+*/
+
+/* same interpolation as Atmosphere.density() */
+static REAL NAME(density_at)(const REAL *density, long rows, REAL resolution, REAL altitude) {
+
+	REAL position = altitude / resolution;
+	long last = rows - 1;
+	long index;
+
+	if (position <= 0) {
+		return density[0];
+	}
+
+	index = (long)position;
+	if (index >= last) {
+		return density[last];
+	}
+
+	return density[index] + (density[index + 1] - density[index]) * (position - (REAL)index);
+}
+
+static REAL NAME(gravity_at)(REAL altitude) {
+
+	REAL ratio = (REAL)6369000 / ((REAL)6369000 + altitude);
+	return (REAL)9.80665 * (ratio * ratio);
+}
+
+static REAL NAME(sign)(REAL x) {
+	return x >= 0 ? (REAL)1 : (REAL)-1;
+}
+
+/* ApogeePredict.cpp calcApogee(), in the order of predictApogeeDelayed() */
+REAL NAME(trajsim_predict_apogee)(REAL alt, REAL vel, REAL mass, int drag_enabled,
+                                  REAL cross_sec, REAL drag_coeff, REAL time_increment,
+                                  REAL accel_prev, REAL accel_last, REAL shutdown_delay, REAL mdot,
+                                  const REAL *density, long rows, REAL resolution, long *steps) {
+
+	REAL time = 0;
+	REAL accel = accel_last;
+	REAL gravity, drag;
+	long step;
+
+	for (step = 1; step <= TRAJSIM_MAX_STEPS; step++) {
+
+		time = time + time_increment;
+
+		if (time < shutdown_delay) {
+			vel = vel + accel * time_increment;
+			accel = accel + (accel_last - accel_prev);
+			mass = mass - mdot * time_increment;
+		}
+		else {
+			gravity = -NAME(gravity_at)(alt);
+			if (drag_enabled) {
+				drag = ((REAL)0.5 * NAME(density_at)(density, rows, resolution, alt) * (vel * vel) * drag_coeff * cross_sec) * -NAME(sign)(vel);
+			}
+			else {
+				drag = 0;
+			}
+			vel = vel + gravity * time_increment + drag / mass * time_increment;
+		}
+
+		alt = alt + vel * time_increment;
+
+		if (vel <= 0) {
+			if (steps != NULL) {
+				*steps = step;
+			}
+			return alt;
+		}
+	}
+
+	if (steps != NULL) {
+		*steps = TRAJSIM_MAX_STEPS;
+	}
+	return (REAL)NAN;
+}
+
+/* experiment/GNC.c checkShutdown(), in the order of GNC_vx1.check_shutdown() */
+int NAME(trajsim_check_shutdown)(REAL a, REAL v, REAL m, REAL mdot, REAL m_final, REAL a_target,
+                                 REAL A_cSec, REAL c_drag, REAL t_shutDelay, REAL F_exp, REAL dt,
+                                 const REAL *density, long rows, REAL resolution,
+                                 REAL *apoapsis, long *steps) {
+
+	REAL t = 0;
+	REAL accel, accel_gravity, F_drag;
+	long step = 0;
+
+	while (v > 0) {
+
+		if (++step > TRAJSIM_MAX_STEPS) {
+			a = (REAL)NAN;
+			break;
+		}
+
+		accel_gravity = NAME(gravity_at)(a);
+		F_drag = (REAL)0.5 * NAME(density_at)(density, rows, resolution, a) * (v * v) * c_drag * A_cSec;
+
+		if (t < t_shutDelay) {
+
+			if (m > m_final) {
+				m -= mdot * dt;
+				if (m < m_final) {
+					m = m_final;
+				}
+			}
+
+			accel = (F_exp - F_drag) / m;
+		}
+		else {
+			accel = -F_drag / m;
+		}
+		accel -= accel_gravity;
+
+		v += accel * dt;
+		a += v * dt;
+		t += dt;
+	}
+
+	if (apoapsis != NULL) {
+		*apoapsis = a;
+	}
+	if (steps != NULL) {
+		*steps = step;
+	}
+	return a >= a_target;
+}
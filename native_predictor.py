@@ -0,0 +1,216 @@
+#   NATIVE APOGEE PREDICTOR
+
+# the apogee predictor (trajectory_core.predictApogeeDelayed) and the
+# GNC apoapsis check (GNC_vx1.check_shutdown) from the C library in
+# native/, loaded with ctypes. The C code takes the same steps in the
+# same order, so the double versions match Python to the last few
+# bits. precision="single" runs the float versions instead, the
+# precision of the flight computer programs.
+
+# the library is optional: until it is built (python native_predictor.py
+# --build, needs a C compiler) or when it can't be loaded, every
+# function here simply calls its pure Python counterpart.
+
+# usage: python native_predictor.py --build
+#        from native_predictor import predict_apogee_delayed
+#        apogee = predict_apogee_delayed(alt, vel, mass, ...)  # same arguments as predictApogeeDelayed()
+
+import argparse
+import ctypes
+import os
+import subprocess
+import sys
+
+import numpy as np
+
+from atmosphere import Atmosphere, DENSITY
+from trajectory_core import SimulationError, predictApogeeDelayed, standard_atmosphere
+
+native_dir = os.path.join(os.path.dirname(os.path.abspath(__file__)), "native")
+source_path = os.path.join(native_dir, "trajsim_predict.c")
+
+if sys.platform == "win32":
+    library_path = os.path.join(native_dir, "trajsim_predict.dll")
+elif sys.platform == "darwin":
+    library_path = os.path.join(native_dir, "libtrajsim_predict.dylib")
+else:
+    library_path = os.path.join(native_dir, "libtrajsim_predict.so")
+
+# the trajsim_predict.h API version this module was written for
+api_version = 1
+
+class NativeBuildError(SimulationError):
+    """Raised when the native library can not be compiled."""
+
+# - - - - - - - - - - - - - - - - - - - - - - - - - - - -
+#                 BUILDING AND LOADING
+# - - - - - - - - - - - - - - - - - - - - - - - - - - - -
+
+def build(compiler=None):
+    """Compiles the library next to its source, returns its path.
+
+       compiler defaults to $CC, or cc (cl with MSVC on Windows).
+       Raises NativeBuildError if the compiler fails or is missing."""
+
+    compiler = compiler or os.environ.get("CC") or ("cl" if sys.platform == "win32" else "cc")
+
+    if os.path.basename(compiler).lower() in ("cl", "cl.exe"):
+        command = [compiler, "/nologo", "/O2", "/fp:precise", "/LD", source_path, "/Fe:" + library_path]
+    else:
+        command = [compiler, "-O2", "-shared", "-fPIC", "-ffp-contract=off", "-o", library_path, source_path, "-lm"]
+
+    try:
+        process = subprocess.run(command, cwd=native_dir, capture_output=True, text=True)
+    except OSError as e:
+        raise NativeBuildError("Can not run the C compiler " + compiler + ": " + str(e))
+    if process.returncode != 0:
+        raise NativeBuildError("Building the native predictor failed:\n" + process.stdout + process.stderr)
+
+    load(reload=True)
+    return library_path
+
+_library = None
+
+def load(reload=False):
+    """Returns the loaded library, or None if it isn't built or doesn't load."""
+
+    global _library, native_available
+
+    if _library is not None and not reload:
+        return _library
+
+    _library = None
+    native_available = False
+    try:
+        library = ctypes.CDLL(library_path)
+    except OSError:
+        return None
+    if library.trajsim_predict_api_version() != api_version:
+        return None
+
+    long_p = ctypes.POINTER(ctypes.c_long)
+    for suffix, real in (("", ctypes.c_double), ("_f", ctypes.c_float)):
+        real_p = ctypes.POINTER(real)
+
+        function = getattr(library, "trajsim_predict_apogee" + suffix)
+        function.restype = real
+        function.argtypes = [real, real, real, ctypes.c_int, real, real, real, real, real, real, real,
+                             real_p, ctypes.c_long, real, long_p]
+
+        function = getattr(library, "trajsim_check_shutdown" + suffix)
+        function.restype = ctypes.c_int
+        function.argtypes = [real, real, real, real, real, real, real, real, real, real, real,
+                             real_p, ctypes.c_long, real, real_p, long_p]
+
+    _library = library
+    native_available = True
+    return _library
+
+native_available = False
+load()
+
+# - - - - - - - - - - - - - - - - - - - - - - - - - - - -
+#                   DENSITY TABLES
+# - - - - - - - - - - - - - - - - - - - - - - - - - - - -
+
+# (atmosphere, precision): (atmosphere, table, pointer), the atmosphere
+# is kept so its id isn't reused while the entry exists
+_tables = {}
+
+def native_supports(atmosphere):
+    """True if the library is loaded and can stand in for the given atmosphere.
+
+       The library interpolates the density table of
+       atmosphere.Atmosphere itself, subclasses with their own
+       lookups need the Python predictors."""
+
+    return native_available and type(atmosphere) is Atmosphere
+
+def _density_table(atmosphere, precision):
+
+    key = (id(atmosphere), precision)
+    entry = _tables.get(key)
+    if entry is None or entry[0] is not atmosphere:
+        if precision == "double":
+            table = np.ascontiguousarray(atmosphere.tables[DENSITY], dtype=np.float64)
+            pointer = table.ctypes.data_as(ctypes.POINTER(ctypes.c_double))
+        elif precision == "single":
+            table = np.ascontiguousarray(atmosphere.tables[DENSITY], dtype=np.float32)
+            pointer = table.ctypes.data_as(ctypes.POINTER(ctypes.c_float))
+        else:
+            raise ValueError("precision must be \"double\" or \"single\".")
+        entry = _tables[key] = (atmosphere, table, pointer)
+    return entry[1], entry[2]
+
+# - - - - - - - - - - - - - - - - - - - - - - - - - - - -
+#                    PREDICTORS
+# - - - - - - - - - - - - - - - - - - - - - - - - - - - -
+
+def predict_apogee_delayed(param_a, param_v, param_m, drag_model, param_cross_sec, param_drag_coeff, param_time_incr,
+                           param_last_accel, param_delay, param_mdot, atmosphere=standard_atmosphere, profiler=None,
+                           precision="double"):
+    """trajectory_core.predictApogeeDelayed() on the native library, same arguments."""
+
+    if not native_supports(atmosphere):
+        return predictApogeeDelayed(param_a, param_v, param_m, drag_model, param_cross_sec, param_drag_coeff, param_time_incr,
+                                    param_last_accel, param_delay, param_mdot, atmosphere, profiler)
+
+    table, pointer = _density_table(atmosphere, precision)
+    function = _library.trajsim_predict_apogee if precision == "double" else _library.trajsim_predict_apogee_f
+    steps = ctypes.c_long(0)
+
+    apogee = function(param_a, param_v, param_m, bool(drag_model), param_cross_sec, param_drag_coeff, param_time_incr,
+                      param_last_accel[0], param_last_accel[1], param_delay, param_mdot,
+                      pointer, table.size, atmosphere.resolution, ctypes.byref(steps))
+
+    if profiler is not None:
+        profiler.count("predictor iterations", steps.value)
+    return apogee
+
+def calc_apogee_delayed(param_a, param_v, param_m, target_apogee, drag_model, param_cross_sec, param_drag_coeff, param_time_incr,
+                        param_last_accel, param_delay, param_mdot, atmosphere=standard_atmosphere, precision="double"):
+    """trajectory_core.calcApogeeDelayed() on the native library, same arguments."""
+
+    return predict_apogee_delayed(param_a, param_v, param_m, drag_model, param_cross_sec, param_drag_coeff, param_time_incr,
+                                  param_last_accel, param_delay, param_mdot, atmosphere, precision=precision) >= target_apogee
+
+def check_shutdown(a, v, m, mdot, m_final, a_target, A_cSec, c_drag, t_shutDelay, F_exp, arr_atmDensity,
+                   dt=0.02, precision="double"):
+    """GNC_vx1.check_shutdown() on the native library, same arguments and (shutdown, apoapsis) result.
+
+       dt is the prediction step, fixed at 0.02 in GNC_vx1."""
+
+    if not native_supports(arr_atmDensity):
+        experiment_dir = os.path.join(os.path.dirname(os.path.abspath(__file__)), "experiment")
+        if experiment_dir not in sys.path:
+            sys.path.insert(0, experiment_dir)
+        import GNC_vx1
+        return GNC_vx1.check_shutdown(a, v, m, mdot, m_final, a_target, A_cSec, c_drag, t_shutDelay, F_exp, arr_atmDensity)
+
+    table, pointer = _density_table(arr_atmDensity, precision)
+    if precision == "double":
+        function, apoapsis = _library.trajsim_check_shutdown, ctypes.c_double(0.0)
+    else:
+        function, apoapsis = _library.trajsim_check_shutdown_f, ctypes.c_float(0.0)
+
+    shutdown = function(a, v, m, mdot, m_final, a_target, A_cSec, c_drag, t_shutDelay, F_exp, dt,
+                        pointer, table.size, arr_atmDensity.resolution, ctypes.byref(apoapsis), None)
+    return bool(shutdown), apoapsis.value
+
+def main():
+
+    parser = argparse.ArgumentParser(description="Builds the native apogee predictor library.")
+    parser.add_argument("--build", action="store_true", help="compile native/trajsim_predict.c")
+    parser.add_argument("--compiler", help="C compiler, $CC or cc by default")
+    args = parser.parse_args()
+
+    if args.build:
+        try:
+            print("built", build(args.compiler))
+        except NativeBuildError as e:
+            sys.exit(str(e))
+
+    print("native predictor", "loaded from " + library_path if native_available else "not available, the Python predictors are used")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,378 @@
+#   DESIGN OPTIMIZER
+
+# searches vehicle inputs for the best design under constraints, e.g.
+# the least propellant that still reaches an apogee without going over
+# a max. Q limit, or the smallest main chute that keeps the landing
+# speed down. Candidates are flown in parallel batches and every
+# flown design is remembered, so a candidate that comes up again costs
+# nothing.
+
+# the search is a cross-entropy method: each generation samples a
+# batch of candidates from a normal distribution per variable, then
+# moves the distribution part of the way towards the best quarter of
+# the batch (which always holds the best design found so far) and
+# narrows it, until it has shrunk below the tolerance. Moving only
+# part of the way keeps the spread from collapsing before the search
+# has reached a constraint boundary.
+
+# usage: python optimizer.py demo_saves/simple.txt --vary mass_propellant=40:100 --minimize mass_propellant
+#                            --constraint "alt_max>=60000" --constraint "max_Q<=150000"
+
+import argparse
+import os
+import time as t
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass, field, replace
+
+import numpy as np
+
+from trajectory_core import SimulationError, standard_atmosphere
+from monte_carlo import DispersionResult, dispersible_inputs, simulate_batch
+from result_cache import result_key
+from sweep import run_sweep, summary_fields
+
+@dataclass
+class Variable:
+    """Range of an input the optimizer may change.
+
+       step, if given, rounds candidates to multiples of it (e.g.
+       0.1 kg of propellant). Rounded candidates repeat often near
+       the end of a search, and repeats come from the cache."""
+
+    low: float
+    high: float
+    step: float = None
+
+@dataclass
+class Constraint:
+    """Limit on an output (see sweep.summary_fields), e.g.
+       Constraint("impact_vel", lower=-8.0) for a landing at 8 m/s."""
+
+    output: str
+    lower: float = None
+    upper: float = None
+
+    def violation(self, value):
+        """How far value is outside the limit, relative to the limit, 0 if inside."""
+
+        if value is None or np.isnan(value):
+            return float("inf")
+        if self.lower is not None and value < self.lower:
+            return (self.lower - value)/max(abs(self.lower), 1.0)
+        if self.upper is not None and value > self.upper:
+            return (value - self.upper)/max(abs(self.upper), 1.0)
+        return 0.0
+
+@dataclass
+class Generation:
+    """One line of the convergence log.
+
+       best_objective is the best objective so far, or its total
+       constraint violation while feasible is False."""
+
+    number: int
+    candidates: int
+    flown: int
+    cache_hits: int
+    best_objective: float
+    feasible: bool
+    spread: float
+    wall_time: float
+
+@dataclass
+class OptimizationResult:
+    """Best design found, with the convergence log.
+
+       best maps the variables to their values, inputs is the base
+       design with them applied. feasible is False if no candidate
+       met every constraint, best is then the least violating one."""
+
+    best: dict
+    inputs: object
+    summary: dict
+    objective: float
+    feasible: bool
+    log: list = field(default_factory=list)
+    evaluations: int = 0
+    cache_hits: int = 0
+    wall_time: float = 0.0
+    flight_time: float = 0.0
+
+    def report(self):
+        """Convergence log and timing as printable text."""
+
+        lines = ["%4s %6s %6s %6s %16s %9s %8s %9s" % ("gen", "cands", "flown", "cached", "best", "feasible", "spread", "time (s)")]
+        for g in self.log:
+            lines.append("%4d %6d %6d %6d %16.6g %9s %8.4f %9.3f" % (g.number, g.candidates, g.flown, g.cache_hits,
+                                                                  g.best_objective, g.feasible, g.spread, g.wall_time))
+        lines.append("")
+        lines.append("best: " + ", ".join("%s=%.6g" % item for item in self.best.items())
+                     + " -> objective %.6g%s" % (self.objective, "" if self.feasible else " (constraints NOT met)"))
+        lines.append("%d designs flown, %d from cache, %.2f s total, %.2f s flying (%.1f designs/s)"
+                     % (self.evaluations, self.cache_hits, self.wall_time, self.flight_time,
+                        self.evaluations/self.flight_time if self.flight_time > 0 else float("nan")))
+        return "\n".join(lines)
+
+# - - - - - - - - - - - - - - - - - - - - - - - - - - - -
+#                 CANDIDATE EVALUATION
+# - - - - - - - - - - - - - - - - - - - - - - - - - - - -
+
+def _fly_vectorized(base, candidates, atmosphere, executor):
+
+    names = list(candidates[0])
+    samples = {name: np.array([candidate[name] for candidate in candidates]) for name in names}
+    batch = simulate_batch(base, samples, len(candidates), atmosphere)
+
+    summaries = []
+    for i in range(len(candidates)):
+        if batch.failed[i]:
+            summaries.append(None)
+        else:
+            summaries.append({name: float(getattr(batch, name)[i]) for name in DispersionResult.outputs})
+    return summaries
+
+def _fly_processes(base, candidates, atmosphere, executor):
+
+    summaries = [None] * len(candidates)
+    chunksize = max(1, len(candidates)//(4 * (os.cpu_count() or 1)))
+    for result in run_sweep(base, candidates, chunksize=chunksize, executor=executor):
+        summaries[result.index] = result.summary
+    return summaries
+
+# engine name -> function(base, candidates, atmosphere, executor) returning
+# one summary dict (None if the design can't fly) per candidate
+engines = {"vectorized": _fly_vectorized, "processes": _fly_processes}
+
+# a lockstep step costs about as much for 1 lane as for a few hundred,
+# so smaller batches of new designs go to the process pool in "auto"
+vectorized_batch = 256
+
+def optimize(base, variables, objective, constraints=(), minimize=True, batch_size=32, generations=40,
+             elite_fraction=0.25, smoothing=0.7, tolerance=1e-3, settled_generations=2, seed=None, engine="auto",
+             workers=None, atmosphere=standard_atmosphere, cache=None, progress=None):
+    """Searches the variables of base (a SimInputs) for the best objective.
+
+       variables maps input names to Variables. objective is an
+       output or input name, or a function (inputs, summary) ->
+       float. Each generation moves the sampling distribution by
+       the smoothing fraction (0 to 1) of the way to its elite. The
+       search stops after the given generations, or once every
+       variable's spread is below tolerance times its range (or its
+       step) and settled_generations generations in a row bring no
+       better design.
+
+       engine "vectorized" flies each batch in lockstep with
+       monte_carlo.simulate_batch (no apogee targeting, no Isp
+       outputs), "processes" spreads it over worker processes with
+       sweep.run_sweep, "auto" picks vectorized for batches of at
+       least vectorized_batch new designs if it can. Both give the
+       same outputs. cache is a dict of design key -> summary, pass
+       the same one to several searches to share it.
+       progress, if given, is called with each Generation."""
+
+    start = t.perf_counter()
+
+    for name in variables:
+        if name not in dispersible_inputs:
+            raise ValueError("Input '" + name + "' can not be optimized.")
+    if engine not in engines and engine != "auto":
+        raise ValueError("Unknown engine: " + engine)
+
+    needed = [constraint.output for constraint in constraints]
+    if not callable(objective) and not hasattr(base, objective):
+        needed.append(objective)
+    for name in needed:
+        if name not in summary_fields:
+            raise ValueError("Unknown output: " + name)
+
+    vectorizable = not base.target_apogee_enabled and all(name in DispersionResult.outputs for name in needed)
+    if engine == "vectorized" and not vectorizable:
+        raise ValueError("The vectorized engine can't fly apogee targets or report Isp.")
+    if atmosphere is not standard_atmosphere:
+        # worker processes always fly the standard atmosphere
+        if engine == "processes" or not vectorizable:
+            raise ValueError("Only the vectorized engine flies other atmospheres.")
+        engine = "vectorized"
+    if cache is None:
+        cache = {}
+
+    names = list(variables)
+    low = np.array([variables[name].low for name in names], dtype=float)
+    high = np.array([variables[name].high for name in names], dtype=float)
+    span = np.maximum(high - low, 1e-12)
+    # a stepped variable keeps sampling its neighbouring steps, its
+    # elite often holds a single value that would end its spread
+    # before the search has tried the next step over
+    floor = np.array([variables[name].step if variables[name].step else 0.0 for name in names])
+    settled = np.maximum(tolerance * span, floor)
+
+    def objective_value(inputs, summary):
+        if callable(objective):
+            value = objective(inputs, summary)
+        elif objective in summary:
+            value = summary[objective]
+        else:
+            value = getattr(inputs, objective)
+        return value if minimize else -value
+
+    # (constraints violated?, objective or total violation): lower is better
+    def rank(inputs, summary):
+        if summary is None:
+            return (1, float("inf"))
+        violation = sum(constraint.violation(summary.get(constraint.output)) for constraint in constraints)
+        if violation > 0:
+            return (1, violation)
+        return (0, objective_value(inputs, summary))
+
+    rng = np.random.default_rng(seed)
+    sigma = span/4
+    # a base value on (or near) a bound would pile the first samples
+    # up on it, so the search starts at least a spread inside the range
+    mean = np.clip(np.array([getattr(base, name) for name in names], dtype=float), low + sigma, high - sigma)
+    elite_count = max(2, int(round(batch_size * elite_fraction)))
+
+    best = None
+    unimproved = 0
+    evaluations = 0
+    cache_hits = 0
+    flight_time = 0.0
+    log = []
+
+    executor = None
+    try:
+        for number in range(1, generations + 1):
+            generation_start = t.perf_counter()
+
+            points = np.clip(rng.normal(mean, sigma, (batch_size, len(names))), low, high)
+            for j, name in enumerate(names):
+                if variables[name].step:
+                    step = variables[name].step
+                    points[:, j] = np.clip(np.round(points[:, j]/step) * step, low[j], high[j])
+
+            candidates = [dict(zip(names, point.tolist())) for point in points]
+            designs = [replace(base, **candidate) for candidate in candidates]
+            keys = [result_key(design, atmosphere) for design in designs]
+
+            # unseen designs only, each once
+            missing = {}
+            for key, candidate in zip(keys, candidates):
+                if key not in cache and key not in missing:
+                    missing[key] = candidate
+            hits = len(candidates) - len(missing)
+
+            if missing:
+                batch_engine = engine
+                if engine == "auto":
+                    batch_engine = "vectorized" if vectorizable and len(missing) >= vectorized_batch else "processes"
+                if batch_engine == "processes" and executor is None:
+                    executor = ProcessPoolExecutor(max_workers=workers)
+
+                flight_start = t.perf_counter()
+                summaries = engines[batch_engine](base, list(missing.values()), atmosphere, executor)
+                flight_time = flight_time + t.perf_counter() - flight_start
+                cache.update(zip(missing, summaries))
+
+            evaluations = evaluations + len(missing)
+            cache_hits = cache_hits + hits
+
+            ranked = sorted(range(batch_size), key=lambda i: rank(designs[i], cache[keys[i]]))
+            top = ranked[0]
+            top_rank = rank(designs[top], cache[keys[top]])
+            improved = best is None or top_rank < best[0]
+            if improved:
+                best = (top_rank, candidates[top], designs[top], cache[keys[top]])
+
+            # the best design so far stays in the elite, in place of
+            # the worst member, if this batch didn't find it again
+            elite = points[ranked[:elite_count]]
+            best_point = np.array([best[1][name] for name in names])
+            if not (elite == best_point).all(axis=1).any():
+                elite[-1] = best_point
+
+            mean = smoothing * elite.mean(axis=0) + (1 - smoothing) * mean
+            sigma = np.maximum(smoothing * elite.std(axis=0) + (1 - smoothing) * sigma, np.maximum(1e-12 * span, floor))
+            # the elite trails the best design on a constraint boundary,
+            # the spread has to reach it until the mean has caught up
+            sigma = np.maximum(sigma, np.abs(best_point - mean))
+
+            spread = float(np.max(sigma/span))
+            feasible = best[0][0] == 0
+            best_objective = best[0][1] if minimize or not feasible else -best[0][1]
+            generation = Generation(number, batch_size, len(missing), hits, best_objective, feasible,
+                                    spread, t.perf_counter() - generation_start)
+            log.append(generation)
+            if progress:
+                progress(generation)
+
+            unimproved = 0 if improved else unimproved + 1
+            if (sigma <= settled).all() and unimproved >= settled_generations:
+                break
+    finally:
+        if executor is not None:
+            executor.shutdown()
+
+    (infeasible, value), candidate, design, summary = best
+    return OptimizationResult(candidate, design, summary, value if minimize or infeasible else -value, not infeasible,
+                              log, evaluations, cache_hits, t.perf_counter() - start, flight_time)
+
+# - - - - - - - - - - - - - - - - - - - - - - - - - - - -
+#                 COMMAND LINE
+# - - - - - - - - - - - - - - - - - - - - - - - - - - - -
+
+def parse_vary(option):
+    """Parses name=low:high or name=low:high:step into (name, Variable)."""
+
+    name, sep, text = option.partition("=")
+    parts = text.split(":")
+    if not sep or len(parts) not in (2, 3):
+        raise argparse.ArgumentTypeError("Expected <input>=<low>:<high>[:<step>], got " + option)
+    return name, Variable(*[float(part) for part in parts])
+
+def parse_constraint(option):
+    """Parses output>=value or output<=value into a Constraint."""
+
+    for operator in (">=", "<="):
+        output, sep, value = option.partition(operator)
+        if sep:
+            if output not in summary_fields:
+                raise argparse.ArgumentTypeError("Unknown output: " + output)
+            if operator == ">=":
+                return Constraint(output, lower=float(value))
+            return Constraint(output, upper=float(value))
+    raise argparse.ArgumentTypeError("Expected <output>>=<value> or <output><=<value>, got " + option)
+
+def main():
+
+    from savefile import read_save_file
+
+    parser = argparse.ArgumentParser(description="Optimize inputs of a save file under output constraints.")
+    parser.add_argument("save_file", help="base design (case file or .txt save file)")
+    parser.add_argument("--vary", action="append", required=True, metavar="INPUT=LOW:HIGH[:STEP]",
+                        help="input the optimizer may change, repeat for more")
+    goal = parser.add_mutually_exclusive_group(required=True)
+    goal.add_argument("--minimize", metavar="NAME", help="input or output to minimize")
+    goal.add_argument("--maximize", metavar="NAME", help="input or output to maximize")
+    parser.add_argument("--constraint", action="append", default=[], metavar="OUTPUT>=VALUE",
+                        help="limit on an output, e.g. alt_max>=60000 or impact_vel>=-8, repeat for more")
+    parser.add_argument("--batch", type=int, default=32, help="candidates per generation")
+    parser.add_argument("--generations", type=int, default=40, help="generation limit")
+    parser.add_argument("--tolerance", type=float, default=1e-3, help="stop when the spread is below this fraction of each range")
+    parser.add_argument("--engine", choices=["auto"] + list(engines), default="auto")
+    parser.add_argument("--workers", type=int, default=None, help="worker processes for the processes engine")
+    parser.add_argument("--seed", type=int, default=None)
+    args = parser.parse_args()
+
+    try:
+        base, file_version = read_save_file(args.save_file)
+        variables = dict(parse_vary(option) for option in args.vary)
+        constraints = [parse_constraint(option) for option in args.constraint]
+        result = optimize(base, variables, args.minimize or args.maximize, constraints, minimize=args.minimize is not None,
+                          batch_size=args.batch, generations=args.generations, tolerance=args.tolerance,
+                          seed=args.seed, engine=args.engine, workers=args.workers)
+    except (argparse.ArgumentTypeError, ValueError, SimulationError) as e:
+        parser.error(str(e))
+
+    print(result.report())
+
+if __name__ == "__main__":
+    main()
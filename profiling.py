@@ -0,0 +1,117 @@
+#   PHASE PROFILER
+
+# adds up the wall time spent in each phase of a run (physics, apogee
+# prediction, step callback, and in the GUI: visualizer, set_value,
+# plotting) and counts steps and predictor iterations, to see what
+# dominates the wall time of a given case.
+
+# the simulators only look at the clock when they are handed a profiler,
+# without one the cost is an "is None" check here and there.
+
+# usage: profiler = PhaseProfiler()
+#        result = simulate(inputs, profiler=profiler)
+#        print(result.profile.report())
+
+import threading
+import time as t
+from contextlib import nullcontext
+
+# a phase named "parent/child" is part of "parent", it is listed under
+# it in the report and not added to the total again
+phase_separator = "/"
+
+class _Phase:
+
+    __slots__ = ("profiler", "name", "start")
+
+    def __init__(self, profiler, name):
+        self.profiler = profiler
+        self.name = name
+
+    def __enter__(self):
+        self.start = t.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.profiler.add(self.name, t.perf_counter() - self.start)
+        return False
+
+class PhaseProfiler:
+    """Wall time per phase and named event counters of one run.
+
+       The simulators call add() once per phase at the end of the
+       run, with times summed up in local variables, so profiling
+       doesn't slow the step loop down much either. Code outside
+       the loops can time a block with phase(). Safe to use from
+       the simulation thread and the GUI thread at once."""
+
+    def __init__(self):
+
+        self.times = {}
+        self.calls = {}
+        self.counts = {}
+
+        # wall time of the whole run, set by the simulator
+        self.wall_time = None
+
+        self._lock = threading.Lock()
+
+    def add(self, phase, seconds, calls=1):
+        """Adds seconds (spent in calls calls) to a phase."""
+
+        with self._lock:
+            self.times[phase] = self.times.get(phase, 0.0) + seconds
+            self.calls[phase] = self.calls.get(phase, 0) + calls
+
+    def count(self, name, number=1):
+        """Adds number to a counter."""
+
+        with self._lock:
+            self.counts[name] = self.counts.get(name, 0) + number
+
+    def phase(self, name):
+        """Context manager that adds the time spent in its block to a phase."""
+        return _Phase(self, name)
+
+    def as_dict(self):
+        """Plain dict copy of the measurements, e.g. for JSON."""
+
+        with self._lock:
+            return {"wall_time": self.wall_time, "times": dict(self.times),
+                    "calls": dict(self.calls), "counts": dict(self.counts)}
+
+    def report(self):
+        """Returns the measurements as text lines, slowest phase first."""
+
+        data = self.as_dict()
+        times = data["times"]
+        top = sorted((name for name in times if phase_separator not in name), key=times.get, reverse=True)
+        total = data["wall_time"] or sum(times[name] for name in top)
+
+        lines = []
+        if data["wall_time"] is not None:
+            lines.append("Wall time: %.4f s" % data["wall_time"])
+
+        def line(name, label):
+            share = (" %5.1f%%" % (100 * times[name]/total)) if total else ""
+            lines.append("%-28s %10.4f s%s  (%d calls)" % (label, times[name], share, data["calls"][name]))
+
+        for name in top:
+            line(name, name)
+            for sub in sorted((sub for sub in times if sub.startswith(name + phase_separator)), key=times.get, reverse=True):
+                line(sub, "  " + sub[len(name) + 1:])
+
+        # sub-phases whose parent was never timed itself
+        for name in sorted(name for name in times if phase_separator in name and name.split(phase_separator)[0] not in times):
+            line(name, name)
+
+        for name, number in data["counts"].items():
+            lines.append("%-28s %10d" % (name, number))
+        return lines
+
+def phase(profiler, name):
+    """profiler.phase(name), or a do-nothing context manager if profiler is None."""
+
+    if profiler is None:
+        return nullcontext()
+    return profiler.phase(name)
@@ -0,0 +1,249 @@
+#   RESULT CACHE
+
+# re-running a design that has been flown before (re-importing a save
+# file, clicking Simulate again with unchanged fields, switching back
+# to an earlier design) returns the stored result instead of flying it
+# again. Results are found by a hash of everything that affects them:
+# the inputs, the atmosphere tables and the simulator source code.
+
+# usage: cache = ResultCache(directory="result_cache")
+#        result = cache.simulate(inputs)
+
+import hashlib
+import json
+import os
+import threading
+import zipfile
+from collections import OrderedDict
+from dataclasses import asdict, fields
+
+import numpy as np
+
+import adaptive_integrator
+import atmosphere
+import results
+import trajectory_core
+from trajectory_core import SimInputs, SimResult, simulate, standard_atmosphere
+from adaptive_integrator import simulate_adaptive
+from results import ResultStore
+from savefile import subsystem_fields
+
+# bumped when the disk file layout changes
+cache_format = 1
+
+# scalar SimResult fields stored next to the channels
+summary_fields = [f.name for f in fields(SimResult) if f.name not in ("inputs", "channels", "events", "profile", "controller_calls")]
+
+# simulator arguments that don't change the physics but tie the run to
+# its caller: they are handed on, but never part of a key. Runs with a
+# step callback, a store or a flight controller are always flown and
+# never stored, as in sim_worker.SimWorker, profiled runs are flown
+# (to be measured) and stored.
+run_options = ("step_callback", "store", "profiler", "controller")
+
+_code_digest = None
+
+def code_digest():
+    """Hash of the source of the physics modules.
+
+       Part of every key, so results of an edited simulator are
+       never served, even if the version number wasn't bumped."""
+
+    global _code_digest
+    if _code_digest is None:
+        digest = hashlib.sha256(trajectory_core.version.encode())
+        for module in (trajectory_core, adaptive_integrator, atmosphere, results):
+            with open(module.__file__, "rb") as source:
+                digest.update(source.read())
+        _code_digest = digest.hexdigest()
+    return _code_digest
+
+def normalized_inputs(inputs):
+    """Returns the inputs as a dict, with the fields of disabled
+       subsystems reset to their placeholders.
+
+       Those fields are never read by the simulator, so designs
+       that only differ in them share a cache entry."""
+
+    values = asdict(inputs)
+    defaults = {f.name: f.default for f in fields(SimInputs)}
+    for switch, names in subsystem_fields.items():
+        if not values[switch]:
+            for name in names:
+                values[name] = defaults[name]
+
+    # 5 and 5.0 are the same input
+    return {name: value if isinstance(value, bool) else float(value) for name, value in values.items()}
+
+def result_key(inputs, atmosphere=standard_atmosphere, adaptive=False, **options):
+    """Returns the cache key (a hex string) of a run.
+
+       options are the keyword arguments handed on to the
+       simulator, e.g. rtol for the adaptive integrator."""
+
+    digest = hashlib.sha256()
+    description = {"format": cache_format,
+                   "code": code_digest(),
+                   "inputs": normalized_inputs(inputs),
+                   "adaptive": bool(adaptive),
+                   "options": options,
+                   "atmosphere": [type(atmosphere).__name__, atmosphere.digest]}
+    digest.update(json.dumps(description, sort_keys=True).encode())
+    return digest.hexdigest()
+
+class ResultCache:
+    """Least recently used cache of SimResults.
+
+       Holds up to max_bytes of time histories in memory. If a
+       directory is given, every result is also written there as a
+       compressed .npz file, which outlives the process. Results
+       handed out are shared, don't modify them."""
+
+    def __init__(self, max_bytes=256 * 1024 * 1024, directory=None):
+
+        self.max_bytes = max_bytes
+        self.directory = directory
+        self.hits = 0
+        self.misses = 0
+
+        self._results = OrderedDict()
+        self._nbytes = 0
+        self._lock = threading.Lock()
+
+        if directory is not None:
+            os.makedirs(directory, exist_ok=True)
+
+    def __len__(self):
+        return len(self._results)
+
+    def __contains__(self, key):
+        return key in self._results or (self.directory is not None and os.path.exists(self._path(key)))
+
+    @property
+    def nbytes(self):
+        """Bytes of time histories held in memory."""
+        return self._nbytes
+
+    def _path(self, key):
+        return os.path.join(self.directory, key + ".npz")
+
+    def get(self, key):
+        """Returns the cached SimResult, or None."""
+
+        with self._lock:
+            result = self._results.get(key)
+            if result is not None:
+                self._results.move_to_end(key)
+                self.hits += 1
+                return result
+
+        result = None
+        if self.directory is not None:
+            result = self._load(key)
+
+        with self._lock:
+            if result is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+        self._remember(key, result)
+        return result
+
+    def put(self, key, result):
+        """Stores a finished SimResult.
+
+           Results of streamed runs (see streaming.py) only hold
+           a thinned-out copy of the data and are not stored."""
+
+        if not isinstance(result.channels, ResultStore):
+            return
+
+        self._remember(key, result)
+        if self.directory is not None:
+            self._save(key, result)
+
+    def simulate(self, inputs, adaptive=False, atmosphere=standard_atmosphere, **options):
+        """Returns the cached result of a run, flying it first if needed.
+
+           options go to trajectory_core.simulate() or, if adaptive,
+           adaptive_integrator.simulate_adaptive(). See run_options
+           for the ones that bypass the cache."""
+
+        handed_on = {name: options.pop(name) for name in run_options if name in options}
+        uncached = any(handed_on.get(name) is not None for name in ("step_callback", "store", "controller"))
+
+        key = result_key(inputs, atmosphere, adaptive, **options)
+        result = None
+        if not uncached and handed_on.get("profiler") is None:
+            result = self.get(key)
+        if result is None:
+            if adaptive:
+                result = simulate_adaptive(inputs, atmosphere=atmosphere, **options, **handed_on)
+            else:
+                result = simulate(inputs, atmosphere=atmosphere, **options, **handed_on)
+            if not uncached:
+                self.put(key, result)
+        return result
+
+    def clear(self):
+        """Empties the memory cache, the disk files are kept."""
+
+        with self._lock:
+            self._results.clear()
+            self._nbytes = 0
+
+    def _remember(self, key, result):
+
+        with self._lock:
+            if key in self._results:
+                self._results.move_to_end(key)
+                return
+
+            self._results[key] = result
+            self._nbytes = self._nbytes + result.channels.nbytes
+
+            # the newest result stays, even if it is larger than max_bytes
+            while self._nbytes > self.max_bytes and len(self._results) > 1:
+                old_key, old = self._results.popitem(last=False)
+                self._nbytes = self._nbytes - old.channels.nbytes
+
+    # - - - DISK FILES - - -
+
+    def _save(self, key, result):
+
+        summary = {name: getattr(result, name) for name in summary_fields}
+        info = json.dumps({"inputs": asdict(result.inputs), "summary": summary, "events": result.events,
+                           "channels": list(result.channels.channels)})
+
+        # written under a temporary name first, so a crash never
+        # leaves a half-written file behind the real name
+        path = self._path(key)
+        temporary = path + ".tmp.npz"
+        np.savez_compressed(temporary, table=result.channels.table(), info=np.array(info))
+        os.replace(temporary, path)
+
+    def _load(self, key):
+
+        path = self._path(key)
+        if not os.path.exists(path):
+            return None
+
+        try:
+            with np.load(path) as data:
+                info = json.loads(str(data["info"]))
+                table = data["table"]
+
+            result = SimResult(SimInputs(**info["inputs"]), channels=ResultStore.from_table(table, info["channels"]))
+            for name, value in info["summary"].items():
+                setattr(result, name, value)
+            result.events = [tuple(event) for event in info["events"]]
+        except (OSError, EOFError, KeyError, TypeError, ValueError, zipfile.BadZipFile):
+            # damaged, truncated or of an older layout: the file is
+            # removed and the run simply flown again
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+            return None
+
+        return result
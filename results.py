@@ -0,0 +1,118 @@
+#   RESULT STORAGE
+
+# columnar storage for the time histories of a run: one contiguous
+# float64 row per channel, grown in chunks, instead of a Python list
+# (and a Python float object) per value
+
+import numpy as np
+
+# channels recorded by the simulators, in row order
+flight_channels = ("time", "alt", "vel", "accel", "thrust", "external_pressure", "gravity",
+                   "isp", "drag", "dyn_press", "drogue_deployment", "chute_deployment", "mass")
+
+class ResultStore:
+    """Growable table of named float64 channels.
+
+       Rows are appended as tuples in channel order. They are
+       collected in a small Python list and copied into the NumPy
+       table chunk_size rows at a time, which keeps append() about
+       as cheap as a list append. Reading a channel returns a view
+       of the table, not a copy; the view is only valid until the
+       next append."""
+
+    def __init__(self, channels=flight_channels, chunk_size=4096, capacity=16384):
+
+        self.channels = tuple(channels)
+        self.chunk_size = chunk_size
+        self._index = {name: i for i, name in enumerate(self.channels)}
+        self._data = np.empty((len(self.channels), max(capacity, chunk_size)))
+        self._length = 0
+        self._pending = []
+
+    @classmethod
+    def from_table(cls, table, channels=flight_channels):
+        """Makes a finished store holding a 2D array, one row per channel.
+
+           A C-contiguous float64 array is taken over as it is, not
+           copied, so don't modify it afterwards."""
+
+        store = cls(channels, capacity=0)
+        store._data = np.ascontiguousarray(table, dtype=np.float64)
+        store._length = store._data.shape[1]
+        return store
+
+    def __len__(self):
+        return self._length + len(self._pending)
+
+    def __contains__(self, name):
+        return name in self._index
+
+    def __getitem__(self, name):
+        """Returns the named channel as a 1D array view."""
+
+        self.flush()
+        return self._data[self._index[name], :self._length]
+
+    def append(self, row):
+        """Adds one row, a tuple with a value for every channel."""
+
+        pending = self._pending
+        pending.append(row)
+        if len(pending) >= self.chunk_size:
+            self.flush()
+
+    def flush(self):
+        """Copies the pending rows into the table."""
+
+        pending = self._pending
+        if not pending:
+            return
+
+        count = len(pending)
+        needed = self._length + count
+        if needed > self._data.shape[1]:
+            grown = np.empty((len(self.channels), max(needed, 2 * self._data.shape[1])))
+            grown[:, :self._length] = self._data[:, :self._length]
+            self._data = grown
+
+        self._data[:, self._length:needed] = np.array(pending, dtype=np.float64).T
+        self._length = needed
+        pending.clear()
+
+    def last(self, name, count=1):
+        """Returns the last count values of a channel as a list (oldest first)."""
+
+        if len(self._pending) >= count:
+            i = self._index[name]
+            return [row[i] for row in self._pending[-count:]]
+        return self[name][-count:].tolist()
+
+    def max(self, name):
+        """Largest value of a channel so far, as a float."""
+        return float(self[name].max())
+
+    def min(self, name):
+        """Smallest value of a channel so far, as a float."""
+        return float(self[name].min())
+
+    def rows_since(self, start):
+        """Returns a copy of the rows from row number start on, one row per channel."""
+
+        self.flush()
+        return self._data[:, start:self._length].copy()
+
+    def table(self):
+        """Returns all channels as a 2D array view, one row per channel."""
+
+        self.flush()
+        return self._data[:, :self._length]
+
+    def finish(self):
+        """Releases the unused capacity, called when the run is done."""
+
+        self.flush()
+        self._data = self._data[:, :self._length].copy()
+
+    @property
+    def nbytes(self):
+        return self._data.nbytes
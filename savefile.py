@@ -0,0 +1,308 @@
+#   SAVE FILES
+
+# reads and writes the inputs of simulation runs, so scripts and batch
+# tools can use them without the GUI.
+
+# case files (.json, or .toml) hold any number of named cases and are
+# what the GUI's export button writes now. The old .txt save files
+# can still be read.
+
+import json
+import os
+from dataclasses import MISSING, asdict, dataclass, fields
+
+from trajectory_core import SimInputs, SimulationError, version
+from exporters import export_extensions
+
+try:
+    import tomllib
+except ImportError:
+    # Python < 3.11, .toml case files can still be written but not read
+    tomllib = None
+
+class SaveFileError(SimulationError):
+    """Raised when a save file can not be read."""
+
+# - - - - - - - - - - - - - - - - - - - - - - - - - - - -
+#                 CASE FILES (.json, .toml)
+# - - - - - - - - - - - - - - - - - - - - - - - - - - - -
+
+# {"format": "trajectorysim-case", "version": 1, "software_version": "1.3.4",
+#  "cases": [{"name": "simple",
+#             "inputs": {"eev": 2250.0, ..., "drag_enabled": false, ...},
+#             "outputs": {"alt_max": 110138.6, ...},      (optional)
+#             "data_file": "simple.xlsx"}]}                (optional)
+
+# inputs are the SimInputs fields. Fields of disabled subsystems and
+# fields with defaults may be left out.
+
+case_format = "trajectorysim-case"
+
+# bumped when the layout changes in a way older readers can't handle
+case_format_version = 1
+
+case_extensions = (".json", ".toml")
+
+input_types = {f.name: f.type for f in fields(SimInputs)}
+required_inputs = [f.name for f in fields(SimInputs) if f.default is MISSING]
+
+# errors listed in a SaveFileError before the rest are only counted
+max_reported_errors = 10
+
+@dataclass
+class Case:
+    """A named set of inputs, with the outputs of the run that wrote it, if any."""
+
+    name: str
+    inputs: SimInputs
+    outputs: dict = None
+    data_file: str = None
+
+def case_inputs(values):
+    """Checks a case's {input: value} dict against SimInputs, returns the SimInputs.
+
+       Raises ValueError naming the first problem."""
+
+    if not isinstance(values, dict):
+        raise ValueError("inputs must be a table of input names and values")
+
+    unknown = [name for name in values if name not in input_types]
+    if unknown:
+        raise ValueError("unknown input(s) " + ", ".join(unknown))
+    missing = [name for name in required_inputs if name not in values]
+    if missing:
+        raise ValueError("missing input(s) " + ", ".join(missing))
+
+    checked = {}
+    for name, value in values.items():
+        if input_types[name] in (bool, "bool"):
+            if not isinstance(value, bool):
+                raise ValueError(name + " must be true or false, not " + repr(value))
+            checked[name] = value
+        else:
+            if isinstance(value, bool) or not isinstance(value, (int, float)):
+                raise ValueError(name + " must be a number, not " + repr(value))
+            checked[name] = float(value)
+
+    inputs = SimInputs(**checked)
+    try:
+        inputs.validate()
+    except SimulationError as e:
+        raise ValueError(str(e))
+    return inputs
+
+def parse_cases(data, filepath):
+    """Validates a loaded case file, returns its list of Cases.
+
+       Every case is checked, the SaveFileError lists all the
+       problems found (the first max_reported_errors of them)."""
+
+    if not isinstance(data, dict) or data.get("format") != case_format:
+        raise SaveFileError("Not a case file: " + filepath)
+    if not isinstance(data.get("version"), int) or data["version"] > case_format_version:
+        raise SaveFileError(filepath + " was written by a newer TrajectorySim (case format version "
+                            + str(data.get("version")) + "), update to read it.")
+    if not isinstance(data.get("cases"), list):
+        raise SaveFileError(filepath + " has no list of cases.")
+
+    cases = []
+    errors = []
+    for i, case in enumerate(data["cases"]):
+        try:
+            if not isinstance(case, dict):
+                raise ValueError("not a table")
+            name = str(case.get("name", "case " + str(i + 1)))
+            cases.append(Case(name, case_inputs(case.get("inputs")), case.get("outputs"), case.get("data_file")))
+        except ValueError as e:
+            errors.append("case " + str(i + 1) + ": " + str(e))
+
+    if errors:
+        shown = errors[:max_reported_errors]
+        if len(errors) > len(shown):
+            shown.append("... and " + str(len(errors) - len(shown)) + " more")
+        raise SaveFileError(str(len(errors)) + " invalid case(s) in " + filepath + ":\n" + "\n".join(shown))
+    return cases
+
+def load_case_file(filepath):
+    """Parses a .json or .toml case file, returns the raw data (not yet validated)."""
+
+    extension = os.path.splitext(filepath)[1].lower()
+    try:
+        if extension == ".toml":
+            if tomllib is None:
+                raise SaveFileError("Reading .toml case files needs Python 3.11 or newer, use .json instead.")
+            with open(filepath, "rb") as case_file:
+                data = tomllib.load(case_file)
+        else:
+            with open(filepath, "r") as case_file:
+                data = json.load(case_file)
+    except OSError as e:
+        raise SaveFileError("Could not open case file: " + str(e))
+    except ValueError as e:
+        # json.JSONDecodeError and tomllib.TOMLDecodeError
+        raise SaveFileError("Malformed case file " + filepath + ": " + str(e))
+    return data
+
+def read_cases(filepath):
+    """Reads every case of a .json, .toml or (single case) .txt save file."""
+
+    if os.path.splitext(filepath)[1].lower() == ".txt":
+        inputs, file_version = read_save_file(filepath)
+        return [Case(os.path.splitext(os.path.basename(filepath))[0], inputs)]
+
+    return parse_cases(load_case_file(filepath), filepath)
+
+def case_dict(case):
+
+    entry = {"name": case.name, "inputs": asdict(case.inputs)}
+    if case.outputs is not None:
+        entry["outputs"] = case.outputs
+    if case.data_file is not None:
+        entry["data_file"] = case.data_file
+    return entry
+
+def toml_value(value):
+
+    if isinstance(value, bool):
+        return "true" if value else "false"
+    if isinstance(value, (int, float)):
+        # repr gives 2250.0, 1e-05, inf and nan, all valid TOML floats
+        return repr(float(value))
+    # a JSON string is a valid TOML basic string
+    return json.dumps(str(value))
+
+def write_cases(filepath, cases):
+    """Writes a list of Cases to a .json or .toml case file."""
+
+    if os.path.splitext(filepath)[1].lower() == ".toml":
+        lines = ["format = " + toml_value(case_format),
+                 "version = " + str(case_format_version),
+                 "software_version = " + toml_value(version)]
+        for case in cases:
+            entry = case_dict(case)
+            lines += ["", "[[cases]]", "name = " + toml_value(entry["name"])]
+            if "data_file" in entry:
+                lines.append("data_file = " + toml_value(entry["data_file"]))
+            for table in ("inputs", "outputs"):
+                if table in entry:
+                    # TOML has no null, unknown outputs are left out
+                    lines += ["", "[cases." + table + "]"]
+                    lines += [name + " = " + toml_value(value) for name, value in entry[table].items() if value is not None]
+        text = "\n".join(lines) + "\n"
+    else:
+        text = json.dumps({"format": case_format, "version": case_format_version, "software_version": version,
+                           "cases": [case_dict(case) for case in cases]}, indent=2) + "\n"
+
+    with open(filepath, "w") as case_file:
+        case_file.write(text)
+
+# - - - - - - - - - - - - - - - - - - - - - - - - - - - -
+#                 LEGACY .TXT SAVE FILES
+# - - - - - - - - - - - - - - - - - - - - - - - - - - - -
+
+# save file label -> SimInputs field
+input_labels = {"Effective exhaust velocity": "eev",
+                "Mass flow": "mdot",
+                "Initial mass": "mass_init",
+                "Propellant mass": "mass_propellant",
+                "Initial altitude": "alt_init",
+                "Nozzle exit pressure": "exit_pressure",
+                "Nozzle exit area": "exit_area",
+                "Time increment": "time_increment",
+                "Vessel cross-section (facing airflow)": "cross_sec",
+                "Drag coefficient (launch configuration)": "drag_coeff",
+                "Drogue chute deployment altitude": "drogue_deploy_alt",
+                "Drogue chute deployment time": "drogue_deploy_time",
+                "Drogue chute area": "drogue_area",
+                "Drogue chute drag coefficient": "drogue_coeff",
+                "Drogue chute mass": "drogue_mass",
+                "Main chute deployment altitude": "chute_deploy_alt",
+                "Main chute deployment time": "chute_deploy_time",
+                "Main chute area": "chute_area",
+                "Main chute drag coefficient": "chute_coeff",
+                "Target apogee": "target_apogee",
+                "Engine shutdown delay": "engine_shutdown_delay"}
+
+# subsystem switch lines
+switch_lines = {"Drag model ENABLED.": "drag_enabled",
+                "Drogue chute ENABLED.": "drogue_enabled",
+                "Main chute ENABLED.": "chute_enabled",
+                "Apogee target SET.": "target_apogee_enabled"}
+
+# fields that are only read when their subsystem is switched on
+subsystem_fields = {"drag_enabled": ["cross_sec", "drag_coeff"],
+                    "drogue_enabled": ["drogue_deploy_alt", "drogue_deploy_time", "drogue_area", "drogue_coeff", "drogue_mass"],
+                    "chute_enabled": ["chute_deploy_alt", "chute_deploy_time", "chute_area", "chute_coeff"],
+                    "target_apogee_enabled": ["target_apogee", "engine_shutdown_delay", "shutdown_command_time"]}
+
+def save_file_path(filepath):
+    """Returns the save file that belongs to filepath.
+
+       Exported data files (.xlsx, .csv, ...) don't contain the
+       inputs, the case file (or, from older versions, the .txt
+       file) next to them does."""
+
+    root, extension = os.path.splitext(filepath)
+    if extension.lower() in (".txt",) + case_extensions:
+        return filepath
+
+    if extension.lower() not in export_extensions:
+        root = filepath
+    for save_extension in case_extensions + (".txt",):
+        if os.path.exists(root + save_extension):
+            return root + save_extension
+    return root + ".txt"
+
+def read_save_file(filepath):
+    """Reads a save file, returns (SimInputs, version of the software that wrote it).
+
+       Case files with several cases give their first case. Only
+       the inputs are read, the outputs of the run that wrote the
+       file are ignored."""
+
+    filepath = save_file_path(filepath)
+    if os.path.splitext(filepath)[1].lower() in case_extensions:
+        data = load_case_file(filepath)
+        cases = parse_cases(data, filepath)
+        if not cases:
+            raise SaveFileError(filepath + " holds no cases.")
+        return cases[0].inputs, data.get("software_version")
+
+    try:
+        with open(filepath, "r") as save_file:
+            lines = [line.rstrip("\n") for line in save_file]
+    except OSError as e:
+        raise SaveFileError("Could not open save file: " + str(e))
+
+    if not lines or not lines[0].startswith("Save file version "):
+        raise SaveFileError("Not a save file: " + filepath)
+    file_version = lines[0][len("Save file version "):]
+
+    values = {}
+    switches = {name: False for name in switch_lines.values()}
+
+    for line in lines[1:]:
+        if line == "OUTPUTS":
+            break
+        if line in switch_lines:
+            switches[switch_lines[line]] = True
+            continue
+
+        label, sep, value = line.partition(": ")
+        if sep and label in input_labels:
+            # value is followed by its unit, if it has one
+            values[input_labels[label]] = value.split(" ")[0]
+
+    # disabled subsystems store placeholder text instead of numbers
+    for switch, names in subsystem_fields.items():
+        if not switches[switch]:
+            for name in names:
+                values.pop(name, None)
+
+    try:
+        numbers = {name: float(value) for name, value in values.items()}
+        inputs = SimInputs(**numbers, **switches)
+    except (ValueError, TypeError) as e:
+        raise SaveFileError("Malformed save file " + filepath + ": " + str(e))
+
+    return inputs, file_version
@@ -0,0 +1,221 @@
+#   ENGINE SHUTDOWN TIME SOLVER
+
+# finds, before flight, the time to send the engine shutdown command so
+# the vehicle reaches its target apogee, instead of polling the apogee
+# predictor every step of the boost. The solved time goes into
+# SimInputs.shutdown_command_time for the final run.
+
+# every candidate time shares the boost up to its command, so the boost
+# is flown once with the engine on and its states are kept as
+# checkpoints. Evaluating a command time then only integrates the
+# shutdown delay and the coast from the matching checkpoint.
+
+# usage: python shutdown_solver.py demo_saves/apogee_target.txt --output solved.json
+
+import argparse
+import time as t
+from dataclasses import dataclass, replace
+
+from trajectory_core import SimulationError, InsufficientThrustError, simulate, standard_atmosphere
+
+@dataclass
+class ShutdownSolution:
+    """Solved shutdown command time of a design.
+
+       apogee is the apogee reached with the command at
+       command_time, error its distance from the target (positive
+       means too high). A target outside what the vehicle can
+       reach is clamped to the earliest or latest command time, so
+       check error. inputs is a copy of the design with
+       shutdown_command_time set, ready for the final run."""
+
+    command_time: float
+    apogee: float
+    target: float
+    evaluations: int
+    inputs: object
+
+    @property
+    def error(self):
+        return self.apogee - self.target
+
+class AscentModel:
+    """The fixed-step ascent of trajectory_core.simulate(), restartable from any step.
+
+       The steps are the same operations in the same order as in
+       simulate(), so the apogees match it exactly. Only the ascent
+       is flown, the chutes never deploy before apogee."""
+
+    def __init__(self, inputs, atmosphere=standard_atmosphere):
+
+        self.inputs = inputs
+        self.atmosphere = atmosphere
+        self.mass_dry = inputs.mass_init - inputs.mass_propellant
+
+    def start(self):
+        """State (time, alt, vel, mass, thrust, drag) at the first step."""
+
+        inputs = self.inputs
+        thrust = inputs.mdot * inputs.eev + inputs.exit_area * (inputs.exit_pressure - self.atmosphere.pressure(inputs.alt_init))
+        return (inputs.time_increment, inputs.alt_init, 0.0, inputs.mass_init, thrust, 0.0)
+
+    def apogee(self, state, command=True, checkpoints=None):
+        """Flies from state to apogee, returns the apogee altitude.
+
+           command sends the shutdown command at the first step.
+           If a checkpoints list is given, the state of every step
+           with propellant left is appended to it."""
+
+        inputs = self.inputs
+        dt = inputs.time_increment
+        mdot = inputs.mdot
+        eev = inputs.eev
+        exit_area = inputs.exit_area
+        exit_pressure = inputs.exit_pressure
+        delay = inputs.engine_shutdown_delay
+        mass_dry = self.mass_dry
+        drag_enabled = inputs.drag_enabled
+        drag_coeff = inputs.drag_coeff
+        cross_sec = inputs.cross_sec
+        alt2dens = self.atmosphere.density
+        alt2press = self.atmosphere.pressure
+        calc_grav = self.atmosphere.gravity
+
+        time, alt, vel, mass, thrust, drag = state
+        time_since_shutdown_command = 0.0
+        engine_shutdown = False
+
+        while True:
+
+            if checkpoints is not None and mass > mass_dry:
+                checkpoints.append((time, alt, vel, mass, thrust, drag))
+
+            if command and time_since_shutdown_command < delay:
+                time_since_shutdown_command = time_since_shutdown_command + dt
+            elif command and time_since_shutdown_command >= delay and not engine_shutdown:
+                engine_shutdown = True
+
+            gravity = -calc_grav(alt)
+            external_pressure = alt2press(alt)
+
+            if mass > mass_dry and not engine_shutdown:
+                vel = vel + ((thrust/mass) * dt) + (gravity * dt) + (drag/mass * dt)
+                mass = mass - mdot * dt
+                thrust = mdot * eev + exit_area * (exit_pressure - external_pressure)
+            else:
+                thrust = 0
+                vel = vel + gravity * dt + drag/mass * dt
+
+            alt = alt + vel * dt
+
+            if drag_enabled:
+                drag = (0.5 * alt2dens(alt) * vel**2 * drag_coeff * cross_sec) * -(1 if vel >= 0 else -1)
+
+            if vel <= 0:
+                return alt
+
+            time = time + dt
+
+def solve_shutdown_time(inputs, atmosphere=standard_atmosphere):
+    """Finds the shutdown command time that hits inputs.target_apogee.
+
+       The fixed time step makes apogee a step function of the
+       command time, so the root is searched over the steps of the
+       boost: secant guesses inside a bracket, with a bisection step
+       whenever a guess doesn't halve the bracket. Returns the step
+       whose apogee is closest to the target, as a ShutdownSolution."""
+
+    inputs.validate()
+    if not inputs.target_apogee_enabled:
+        raise SimulationError("No target apogee set.")
+
+    model = AscentModel(inputs, atmosphere)
+    if model.start()[4] < atmosphere.gravity(inputs.alt_init) * inputs.mass_init:
+        raise InsufficientThrustError("Not enough thrust - vehicle won't lift off.")
+
+    checkpoints = []
+    model.apogee(model.start(), command=False, checkpoints=checkpoints)
+
+    target = inputs.target_apogee
+    apogees = {}
+
+    def margin(step):
+        if step not in apogees:
+            apogees[step] = model.apogee(checkpoints[step])
+        return apogees[step] - target
+
+    low, high = 0, len(checkpoints) - 1
+    low_margin, high_margin = margin(low), margin(high)
+
+    if low_margin >= 0:
+        best = low
+    elif high_margin <= 0:
+        best = high
+    else:
+        bisect = False
+        while high - low > 1:
+            width = high - low
+            if bisect:
+                step = (low + high)//2
+            else:
+                step = low + int(round(width * -low_margin/(high_margin - low_margin)))
+            step = min(max(step, low + 1), high - 1)
+
+            step_margin = margin(step)
+            if step_margin < 0:
+                low, low_margin = step, step_margin
+            else:
+                high, high_margin = step, step_margin
+            bisect = high - low > width/2
+
+        best = low if -low_margin <= high_margin else high
+
+    command_time = checkpoints[best][0]
+    return ShutdownSolution(command_time, apogees[best], target, len(apogees),
+                            replace(inputs, shutdown_command_time=command_time))
+
+def simulate_to_target(inputs, step_callback=None, atmosphere=standard_atmosphere, store=None):
+    """Solves the shutdown time, then flies the design once with it.
+
+       Returns (ShutdownSolution, SimResult)."""
+
+    solution = solve_shutdown_time(inputs, atmosphere)
+    return solution, simulate(solution.inputs, step_callback=step_callback, atmosphere=atmosphere, store=store)
+
+# - - - - - - - - - - - - - - - - - - - - - - - - - - - -
+#                 COMMAND LINE
+# - - - - - - - - - - - - - - - - - - - - - - - - - - - -
+
+def main():
+
+    from savefile import Case, read_save_file, write_cases
+
+    parser = argparse.ArgumentParser(description="Solve the engine shutdown command time for a save file's target apogee.")
+    parser.add_argument("save_file", help="save file with an apogee target")
+    parser.add_argument("--target", type=float, help="target apogee (m), overrides the save file's")
+    parser.add_argument("--output", help="write the solved design to this .json/.toml case file")
+    args = parser.parse_args()
+
+    try:
+        inputs, file_version = read_save_file(args.save_file)
+        if args.target is not None:
+            inputs = replace(inputs, target_apogee_enabled=True, target_apogee=args.target,
+                             engine_shutdown_delay=max(inputs.engine_shutdown_delay, 0.0))
+
+        start = t.perf_counter()
+        solution = solve_shutdown_time(inputs)
+        solve_time = t.perf_counter() - start
+        result = simulate(solution.inputs)
+    except SimulationError as e:
+        parser.error(str(e))
+
+    print("Shutdown command time: %.4f s (%d apogee evaluations, %.3f s)" % (solution.command_time, solution.evaluations, solve_time))
+    print("Apogee: %.3f m, target %.3f m, error %+.3f m" % (solution.apogee, solution.target, solution.error))
+    print("Final run: apogee %.3f m, engine cutoff at %.4f s" % (result.alt_max, result.cutoff_time))
+
+    if args.output:
+        write_cases(args.output, [Case("solved shutdown time", solution.inputs, {"alt_max": result.alt_max})])
+        print("Solved design saved in " + args.output)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,270 @@
+#   BACKGROUND SIMULATION WORKER
+
+# runs simulations one after another on a background thread, so a GUI
+# (or any other caller) stays responsive. Runs are queued, can be
+# cancelled, and report their progress through a message queue.
+
+# usage: worker = SimWorker()
+#        job = worker.submit(inputs)
+#        ... worker.poll() every frame, handle the SimMessages ...
+
+import itertools
+import queue
+import threading
+import time as t
+from dataclasses import dataclass, replace
+
+from trajectory_core import SimulationError, simulate, standard_atmosphere
+from adaptive_integrator import simulate_adaptive
+from result_cache import result_key
+
+class SimulationCancelled(SimulationError):
+    """Raised inside a run that was cancelled."""
+
+@dataclass
+class SimJob:
+    """A queued run.
+
+       store, if given, replaces the in-memory result store
+       (see simulate()). profiler, a profiling.PhaseProfiler, if
+       given, profiles the run. controller, a flight_controllers
+       FlightController, flies in the loop (fixed time step only,
+       see simulate()). estimated_flight_time is filled in when the
+       run starts."""
+
+    id: int
+    inputs: object
+    adaptive: bool = False
+    store: object = None
+    profiler: object = None
+    controller: object = None
+    estimated_flight_time: float = None
+
+    def __post_init__(self):
+        self.cancel_event = threading.Event()
+
+    @property
+    def cancelled(self):
+        return self.cancel_event.is_set()
+
+@dataclass
+class SimMessage:
+    """Something the worker wants the caller to know.
+
+       kind is one of
+         "started"   - the job left the queue
+         "progress"  - state is a FlightState copy, progress the
+                       estimated fraction done (or None), rows the
+                       result rows since the last message (one row
+                       per channel, see results.flight_channels)
+         "done"      - result is the SimResult, cached is True if
+                       it came from the result cache
+         "failed"    - error is the exception the run raised
+         "cancelled" - the job was cancelled, queued or running"""
+
+    kind: str
+    job: SimJob
+    state: object = None
+    progress: float = None
+    rows: object = None
+    result: object = None
+    error: Exception = None
+    cached: bool = False
+
+def estimate_flight_time(inputs, atmosphere=standard_atmosphere):
+    """Flight time of a quick, loose-tolerance adaptive run.
+
+       Takes a small fraction of the time of the real run. Returns
+       None if the inputs can't be flown."""
+
+    try:
+        return simulate_adaptive(replace(inputs), atmosphere=atmosphere, rtol=1e-3, atol=1e-2).flight_time
+    except SimulationError:
+        return None
+
+class SimWorker:
+    """Runs SimJobs one at a time on a daemon thread.
+
+       Progress messages are sent at most every message_interval
+       seconds. Set realtime to True (at any time) to slow the
+       running simulation down to real time.
+
+       If a result_cache.ResultCache is given, designs that have
+       been flown before are answered from it right away (except
+       streamed runs, which have to write their file, and profiled
+       or flight controller runs, which have to be measured)."""
+
+    def __init__(self, message_interval=1/60, atmosphere=standard_atmosphere, cache=None):
+
+        self.message_interval = message_interval
+        self.atmosphere = atmosphere
+        self.cache = cache
+        self.realtime = False
+
+        self._ids = itertools.count(1)
+        self._jobs = queue.Queue()
+        self._messages = queue.Queue()
+        self._queued = []
+        self._current = None
+        self._lock = threading.Lock()
+        self._thread = None
+
+    # - - - CALLER SIDE - - -
+
+    def submit(self, inputs, adaptive=False, store=None, profiler=None, controller=None):
+        """Queues a run, returns its SimJob."""
+
+        job = SimJob(next(self._ids), inputs, adaptive, store, profiler, controller)
+        with self._lock:
+            self._queued.append(job)
+        self._jobs.put(job)
+
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._work, name="SimWorker", daemon=True)
+            self._thread.start()
+        return job
+
+    def cancel(self, job=None):
+        """Cancels a job, the running one if none is given."""
+
+        with self._lock:
+            job = job or self._current
+        if job is not None:
+            job.cancel_event.set()
+
+    def cancel_all(self):
+        """Cancels the running job and everything queued behind it."""
+
+        with self._lock:
+            jobs = self._queued + [self._current]
+        for job in jobs:
+            if job is not None:
+                job.cancel_event.set()
+
+    @property
+    def busy(self):
+        with self._lock:
+            return self._current is not None or len(self._queued) > 0
+
+    @property
+    def queued(self):
+        """Number of jobs waiting behind the running one."""
+        with self._lock:
+            return len(self._queued)
+
+    def poll(self):
+        """Returns the messages sent since the last poll, oldest first."""
+
+        messages = []
+        while True:
+            try:
+                messages.append(self._messages.get_nowait())
+            except queue.Empty:
+                return messages
+
+    # - - - WORKER THREAD - - -
+
+    def _work(self):
+
+        while True:
+            job = self._jobs.get()
+            with self._lock:
+                self._queued.remove(job)
+                self._current = job
+
+            try:
+                if job.cancelled:
+                    self._messages.put(SimMessage("cancelled", job))
+                else:
+                    self._run(job)
+            finally:
+                with self._lock:
+                    self._current = None
+
+    def _run(self, job):
+
+        self._messages.put(SimMessage("started", job))
+        job_start = t.perf_counter()
+        profiler = job.profiler
+
+        key = None
+        if self.cache is not None and job.store is None and job.controller is None:
+            key = result_key(job.inputs, self.atmosphere, job.adaptive)
+            result = self.cache.get(key) if profiler is None else None
+            if result is not None:
+                self._messages.put(SimMessage("done", job, result=result, cached=True))
+                return
+
+        job.estimated_flight_time = estimate_flight_time(job.inputs, self.atmosphere)
+        if profiler is not None:
+            profiler.add("flight time estimate", t.perf_counter() - job_start)
+
+        rows_sent = 0
+        next_message = 0.0
+
+        # (wall clock, simulated time) real-time pacing is measured from
+        pace_start = None
+
+        def step(state):
+
+            nonlocal rows_sent, next_message, pace_start
+
+            if job.cancel_event.is_set():
+                raise SimulationCancelled("Simulation cancelled.")
+
+            if self.realtime:
+                if pace_start is None:
+                    pace_start = (t.perf_counter(), state.time)
+                ahead = (state.time - pace_start[1]) - (t.perf_counter() - pace_start[0])
+                if ahead > 0.002:
+                    t.sleep(ahead)
+                    if profiler is not None:
+                        profiler.add("step callback/realtime wait", ahead)
+            else:
+                pace_start = None
+
+            now = t.perf_counter()
+            if now < next_message:
+                return
+            next_message = now + self.message_interval
+
+            if profiler is not None:
+                message_start = now
+
+            channels = state.result.channels
+            rows = channels.rows_since(rows_sent)
+            rows_sent = len(channels)
+
+            progress = None
+            if job.estimated_flight_time:
+                progress = min(state.time/job.estimated_flight_time, 0.99)
+
+            self._messages.put(SimMessage("progress", job, state=state.copy(), progress=progress, rows=rows))
+
+            if profiler is not None:
+                profiler.add("step callback/progress messages", t.perf_counter() - message_start)
+
+        try:
+            if job.adaptive and job.controller is None:
+                result = simulate_adaptive(job.inputs, step_callback=step, atmosphere=self.atmosphere, store=job.store, profiler=profiler)
+            else:
+                result = simulate(job.inputs, step_callback=step, atmosphere=self.atmosphere, store=job.store, profiler=profiler,
+                                  controller=job.controller)
+
+        except SimulationCancelled:
+            if job.store is not None:
+                job.store.finish()
+            self._messages.put(SimMessage("cancelled", job))
+
+        except Exception as e:
+            if job.store is not None:
+                job.store.finish()
+            self._messages.put(SimMessage("failed", job, error=e))
+
+        else:
+            if profiler is not None:
+                # the whole job, not just the simulator's loop
+                profiler.wall_time = t.perf_counter() - job_start
+            if key is not None:
+                self.cache.put(key, result)
+            self._messages.put(SimMessage("done", job, result=result))
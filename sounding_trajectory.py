@@ -12,15 +12,25 @@
 # to install dearpygui 0.6.415 using pip:
 # pip install dearpygui==0.6.415
 
-version = "1.3.4"
-
 from dearpygui.core import *
 from dearpygui.simple import *
 import math
-import pandas as pd
 import time as t
 import os
 
+# the physics are in trajectory_core.py, which can also be
+# used on its own without any GUI
+from trajectory_core import version, SimInputs, SimulationError, InsufficientThrustError, ChuteOrderError
+from savefile import read_save_file, save_file_path, SaveFileError, Case, write_cases, case_extensions
+from exporters import export_result, export_extensions, ExportError
+from streaming import StreamingStore
+from decimation import minmax_decimate, IncrementalMinMax
+from results import flight_channels
+from sim_worker import SimWorker
+from result_cache import ResultCache
+from profiling import PhaseProfiler, phase
+from flight_controllers import controllers, create_controller, timing_report
+
 #set initial window configuration (purely cosmetic)
 set_main_window_size(1300, 700)
 set_main_window_title("TrajectorySim v" + str(version))
@@ -29,44 +39,13 @@ set_theme("Dark")
 
 calc_run_number = 0
 
-#variables to save values of last run
-#saving in another variable in case user makes changes to the input fields before clicking Export
-last_eev = None
-last_mdot = None
-last_mass_init = None
-last_mass_propellant = None
-last_alt_init = None
-last_time_increment = None
-last_exit_pressure = None
-last_exit_area = None
-last_cross_sec = None
-last_drag_coeff = None
-last_drag_model = None
-
-last_target_apogee_enabled = None
-last_target_apogee = None
-last_engine_shutdown_delay = None
-
-last_drogue_enabled = None
-last_drogue_deploy_alt = None
-last_drogue_deploy_time = None
-last_drogue_area = None
-last_drogue_coeff = None
-last_drogue_mass = None
-
-last_chute_enabled = None
-last_chute_deploy_alt = None
-last_chute_deploy_time = None
-last_chute_area = None
-last_chute_coeff = None
-
-last_results = []
-
-# atmospheric density lookup file has values in kg/m^3, with steps of 100 meters
-# retrieved from https://www.digitaldutch.com/atmoscalc/table.htm
-model_filename = "./data/atm_density_model.txt"
-model_file = open(model_filename, "r")
-model_lines = model_file.readlines()
+# SimResult of the last run (see trajectory_core.py), kept in case
+# the user makes changes to the input fields before clicking Export
+last_results = None
+
+# outputs written into the case file next to an export
+case_output_fields = ["alt_max", "tt_apoapsis", "vel_max", "tt_max_vel", "accel_max", "max_Q",
+                      "isp_min", "isp_max", "cutoff_time", "flight_time", "impact_vel"]
 
 # graph display toggles
 is_ground_displayed = False
@@ -79,351 +58,145 @@ set_value(name="progress", value=0)
 # - - - - - - - - - - - - - - - - - - - - - - - - - - - -
 
 def browseSaves():  
-    open_file_dialog(extensions=".txt", callback=selectSave)
+    open_file_dialog(extensions=".json,.toml,.txt", callback=selectSave)
 
 def selectSave(dialog, save_path):
     set_value("filepath_field", save_path[0] + "\\" + save_path[1])
 
 def importFile():
 
+    import_filepath = get_value("filepath_field")
+    if os.path.splitext(import_filepath)[1].lower() in export_extensions:
+        log_warning("Exported data files don't contain input info. Trying " + save_file_path(import_filepath) + " instead...", logger="Logs")
+    import_filepath = save_file_path(import_filepath)
+
+    log_info("Importing inputs from " + import_filepath, logger="Logs")
+
     try:
-        import_filepath = get_value("filepath_field")
-        
-        if not import_filepath[-4:] == ".txt":
-            if import_filepath[-5:] == ".xlsx":
-                log_warning("Exported .xlsx files don't contain input info. Trying " + import_filepath[:-5] + ".txt instead...", logger="Logs")
-                import_filepath = import_filepath[:-5] + ".txt"
-            else:
-                import_filepath = import_filepath + ".txt"
-            
-        log_info("Importing inputs from " + import_filepath, logger="Logs")
-        import_file = open(import_filepath, "r")
-    except:
-        log_error("Import failed. Check filepath.", logger="Logs")
+        inputs, file_version = read_save_file(import_filepath)
+    except SaveFileError as e:
+        log_error("Import failed. " + str(e), logger="Logs")
         return
 
-    try:
-        import_lines = import_file.readlines()
-        if not import_lines[0][18:-1] == version:
-            log_warning("Save file version does not match software version. Import might fail.", logger="Logs")
-
-        set_value(name="eev_field", value=import_lines[4][28:-5])
-        set_value(name="mdot_field", value=import_lines[5][11:-6])
-        set_value(name="mass_init_field", value=import_lines[6][14:-4])
-        set_value(name="mass_propellant_field", value=import_lines[7][17:-4])
-        set_value(name="alt_init_field", value=import_lines[8][18:-3])
-        set_value(name="exit_pressure_field", value=import_lines[9][22:-4])
-        set_value(name="exit_area_field", value=import_lines[10][18:-5])
-        set_value(name="time_increment_field", value=import_lines[11][16:-3])
-
-        if import_lines[14] == "Drag model ENABLED.\n":
-            set_value(name="drag_model_checkbox", value=True)
-            set_value(name="cross_sec_field", value=import_lines[12][39:-5])
-            set_value(name="drag_coeff_field", value=import_lines[13][41:-1])
-        else:
-            set_value(name="drag_model_checkbox", value=False)
-            set_value(name="cross_sec_field", value="Drag model disabled.")
-            set_value(name="drag_coeff_field", value="Drag model disabled.")
-
-        if import_lines[15] == "Drogue chute ENABLED.\n":
-            set_value(name="drogue_checkbox", value=True)
-            set_value(name="drogue_deploy_alt_field", value=import_lines[16][34:-3])
-            set_value(name="drogue_deploy_time_field", value=import_lines[17][30:-3])
-            set_value(name="drogue_area_field", value=import_lines[18][19:-5])
-            set_value(name="drogue_coeff_field", value=import_lines[19][31:-1])
-            set_value(name="drogue_mass_field", value=import_lines[20][19:-4])
-        else:
-            set_value(name="drogue_checkbox", value=False)
-            set_value(name="drogue_deploy_alt_field", value="Drogue chute disabled.")
-            set_value(name="drogue_deploy_time_field", value="Drogue chute disabled.")
-            set_value(name="drogue_area_field", value="Drogue chute disabled.")
-            set_value(name="drogue_coeff_field", value="Drogue chute disabled.")
-            set_value(name="drogue_mass_field", value="Drogue chute disabled.")
-
-        if import_lines[21] == "Main chute ENABLED.\n":
-            set_value(name="chute_checkbox", value=True)
-            set_value(name="chute_deploy_alt_field", value=import_lines[22][32:-3])
-            set_value(name="chute_deploy_time_field", value=import_lines[23][28:-3])
-            set_value(name="chute_area_field", value=import_lines[24][17:-5])
-            set_value(name="chute_coeff_field", value=import_lines[25][29:-1])
-        else:
-            set_value(name="chute_checkbox", value=False)
-            set_value(name="chute_deploy_alt_field", value="Main chute disabled.")
-            set_value(name="chute_deploy_time_field", value="Main chute disabled.")
-            set_value(name="chute_area_field", value="Main chute disabled.")
-            set_value(name="chute_coeff_field", value="Main chute disabled.")
-
-        if import_lines[26] == "Apogee target SET.\n":
-            set_value(name="target_apogee_checkbox", value=True)
-            set_value(name="target_apogee_field", value=import_lines[27][15:-3])
-            set_value(name="engine_shutdown_delay_field", value=import_lines[28][23:-3])
+    # case files are checked against their schema, old .txt files aren't
+    if import_filepath.endswith(".txt") and not file_version == version:
+        log_warning("Save file version does not match software version. Import might fail.", logger="Logs")
+
+    set_value(name="eev_field", value=str(inputs.eev))
+    set_value(name="mdot_field", value=str(inputs.mdot))
+    set_value(name="mass_init_field", value=str(inputs.mass_init))
+    set_value(name="mass_propellant_field", value=str(inputs.mass_propellant))
+    set_value(name="alt_init_field", value=str(inputs.alt_init))
+    set_value(name="exit_pressure_field", value=str(inputs.exit_pressure))
+    set_value(name="exit_area_field", value=str(inputs.exit_area))
+    set_value(name="time_increment_field", value=str(inputs.time_increment))
+
+    if inputs.drag_enabled:
+        set_value(name="drag_model_checkbox", value=True)
+        set_value(name="cross_sec_field", value=str(inputs.cross_sec))
+        set_value(name="drag_coeff_field", value=str(inputs.drag_coeff))
+    else:
+        set_value(name="drag_model_checkbox", value=False)
+        set_value(name="cross_sec_field", value="Drag model disabled.")
+        set_value(name="drag_coeff_field", value="Drag model disabled.")
+
+    if inputs.drogue_enabled:
+        set_value(name="drogue_checkbox", value=True)
+        set_value(name="drogue_deploy_alt_field", value=str(inputs.drogue_deploy_alt))
+        set_value(name="drogue_deploy_time_field", value=str(inputs.drogue_deploy_time))
+        set_value(name="drogue_area_field", value=str(inputs.drogue_area))
+        set_value(name="drogue_coeff_field", value=str(inputs.drogue_coeff))
+        set_value(name="drogue_mass_field", value=str(inputs.drogue_mass))
+    else:
+        set_value(name="drogue_checkbox", value=False)
+        set_value(name="drogue_deploy_alt_field", value="Drogue chute disabled.")
+        set_value(name="drogue_deploy_time_field", value="Drogue chute disabled.")
+        set_value(name="drogue_area_field", value="Drogue chute disabled.")
+        set_value(name="drogue_coeff_field", value="Drogue chute disabled.")
+        set_value(name="drogue_mass_field", value="Drogue chute disabled.")
+
+    if inputs.chute_enabled:
+        set_value(name="chute_checkbox", value=True)
+        set_value(name="chute_deploy_alt_field", value=str(inputs.chute_deploy_alt))
+        set_value(name="chute_deploy_time_field", value=str(inputs.chute_deploy_time))
+        set_value(name="chute_area_field", value=str(inputs.chute_area))
+        set_value(name="chute_coeff_field", value=str(inputs.chute_coeff))
+    else:
+        set_value(name="chute_checkbox", value=False)
+        set_value(name="chute_deploy_alt_field", value="Main chute disabled.")
+        set_value(name="chute_deploy_time_field", value="Main chute disabled.")
+        set_value(name="chute_area_field", value="Main chute disabled.")
+        set_value(name="chute_coeff_field", value="Main chute disabled.")
+
+    if inputs.target_apogee_enabled:
+        set_value(name="target_apogee_checkbox", value=True)
+        set_value(name="target_apogee_field", value=str(inputs.target_apogee))
+        set_value(name="engine_shutdown_delay_field", value=str(inputs.engine_shutdown_delay))
+        # solved cases (shutdown_solver.py) come with a fixed command time
+        if inputs.shutdown_command_time >= 0.0:
+            set_value(name="shutdown_command_time_field", value=str(inputs.shutdown_command_time))
         else:
-            set_value(name="target_apogee_checkbox", value=False)
-            set_value(name="target_apogee_field", value="No target.")
-            set_value(name="engine_shutdown_delay_field", value="No target.")
-            
-    except:
-        log_error("Import failed. Check file version or formatting.", logger="Logs")
-        return
+            set_value(name="shutdown_command_time_field", value="")
+    else:
+        set_value(name="target_apogee_checkbox", value=False)
+        set_value(name="target_apogee_field", value="No target.")
+        set_value(name="engine_shutdown_delay_field", value="No target.")
+        set_value(name="shutdown_command_time_field", value="No target.")
 
     log_info("Import successful.", logger="Logs")
     simulateTraj()
 
 def exportFile():
 
-    global version
-    
-    if not calc_run_number > 0:
+    if last_results is None:
         log_error("Cannot export. Run the calculations first.", logger="Logs")
         return
 
     show_item("progress_bar")
     setProgressBarOverlay("Attempting export...")
-    excelFilename = get_value("filepath_field")
-
-    # sanitize filename
-    if not excelFilename == "" or excelFilename == None:
-        log_info("Attempting export (this might take a while)...", logger = "Logs")
-        if len(excelFilename) > 5 and excelFilename[-5:] == ".xlsx":
-            exportFile = excelFilename
-        elif len(excelFilename) > 4 and excelFilename[-4:] == ".txt":
-            exportFile = excelFilename[:-4] + ".xlsx"
+    exportFilename = get_value("filepath_field")
+
+    # sanitize filename, data format is picked by the extension (.xlsx if none given)
+    if not exportFilename == "" or exportFilename == None:
+        log_info("Attempting export...", logger = "Logs")
+        root, extension = os.path.splitext(exportFilename)
+        if extension.lower() in export_extensions:
+            exportFile = exportFilename
+        elif extension.lower() in (".txt",) + case_extensions:
+            exportFile = root + ".xlsx"
         else:
-            exportFile = excelFilename + ".xlsx"
+            exportFile = exportFilename + ".xlsx"
+
+        def exportProgress(fraction, text):
+            set_value(name="progress", value=0.9 * fraction)
+            setProgressBarOverlay(text)
 
-        # Actual writing to Excel happens here
+        # Actual writing of the data file happens here
         try:
-            
-            # map of last_results:
-            #
-            # [0]: thrust_list
-            # [1]: time_list
-            # [2]: alt_list
-            # [3]: vel_list
-            # [4]: ground_level_list
-            # [5]: karman_line_list
-            # [6]: external_pressure_list
-            # [7]: gravity_list
-            # [8]: accel_list
-            # [9]: isp_list
-            # [10]: drag_list
-            # [11]: dyn_press_list
-            # [12]: drogue_deployment_list
-            # [13]: chute_deployment_list
-
-            setProgressBarOverlay("Preparing data for export...")
-            progress_bar_divisions = 8
-            progress_step = 0
-
-            global last_drag_model, last_target_apogee_enabled
-
-            # prepare data lists
-            export_thrust = {'Time (s)': last_results[1],'Thrust (N)': last_results[0]}
-            export_alt = {'Time (s)': last_results[1],'Altitude (m)': last_results[2]}
-            export_vel = {'Time (s)': last_results[1],'Velocity (m/s)': last_results[3]}
-            export_external_pressure = {'Time (s)': last_results[1],'Ext. Pressure': last_results[6]}
-            export_gravity = {'Time (s)': last_results[1],'Gravity (m/s^2)': last_results[7]}
-            export_accel = {'Time (s)': last_results[1],'Acceleration (m/s^2)': last_results[8]}
-            export_isp = {'Time (s)': last_results[1],'Specific Impulse (s)': last_results[9]}
-            if last_drag_model:
-                progress_bar_divisions = progress_bar_divisions + 2
-                export_drag = {'Time (s)': last_results[1],'Drag (N)': last_results[10]}
-                export_dyn_press = {'Time (s)': last_results[1],'Dynamic Pressure (Pa)': last_results[11]}
-            if last_drogue_enabled:
-                progress_bar_divisions = progress_bar_divisions + 1
-                export_drogue = {'Time(s)': last_results[1],'Drogue Deployment': last_results[12]}
-            if last_chute_enabled:
-                progress_bar_divisions = progress_bar_divisions + 1
-                export_chute = {'Time(s)': last_results[1],'Main Chute Deployment': last_results[13]}
-
-            # create dataframes
-            df_alt = pd.DataFrame(export_alt)
-            df_vel = pd.DataFrame(export_vel)
-            df_accel = pd.DataFrame(export_accel)
-            df_thrust = pd.DataFrame(export_thrust)
-            df_external_pressure = pd.DataFrame(export_external_pressure)
-            df_gravity = pd.DataFrame(export_gravity)
-            df_isp = pd.DataFrame(export_isp)
-            if last_drag_model:
-                df_drag = pd.DataFrame(export_drag)
-                df_dyn_press = pd.DataFrame(export_dyn_press)
-            if last_drogue_enabled:
-                df_drogue = pd.DataFrame(export_drogue)
-            if last_chute_enabled:
-                df_chute = pd.DataFrame(export_chute)
-
-            # write to xlsx file
-            with pd.ExcelWriter(exportFile) as writer:
-                progress_step = progress_step + 1
-                set_value(name="progress", value=float(progress_step/progress_bar_divisions))
-                setProgressBarOverlay("Writing altitude...")
-                df_alt.to_excel(writer, sheet_name = 'Altitude')
-                progress_step = progress_step + 1
-                set_value(name="progress", value=float(progress_step/progress_bar_divisions))
-                setProgressBarOverlay("Writing velocity...")
-                df_vel.to_excel(writer, sheet_name = 'Velocity')
-                progress_step = progress_step + 1
-                set_value(name="progress", value=float(progress_step/progress_bar_divisions))
-                setProgressBarOverlay("Writing acceleration...")
-                df_accel.to_excel(writer, sheet_name = 'Acceleration')
-                progress_step = progress_step + 1
-                set_value(name="progress", value=float(progress_step/progress_bar_divisions))
-                setProgressBarOverlay("Writing thrust...")
-                df_thrust.to_excel(writer, sheet_name = 'Thrust')
-                progress_step = progress_step + 1
-                set_value(name="progress", value=float(progress_step/progress_bar_divisions))
-                setProgressBarOverlay("Writing ext. press...")
-                df_external_pressure.to_excel(writer, sheet_name = 'Ext. Press.')
-                progress_step = progress_step + 1
-                set_value(name="progress", value=float(progress_step/progress_bar_divisions))
-                setProgressBarOverlay("Writing gravity...")
-                df_gravity.to_excel(writer, sheet_name = 'Gravity')
-                progress_step = progress_step + 1
-                set_value(name="progress", value=float(progress_step/progress_bar_divisions))
-                setProgressBarOverlay("Writing Isp...")
-                df_isp.to_excel(writer, sheet_name = 'Isp')
-                progress_step = progress_step + 1
-                set_value(name="progress", value=float(progress_step/progress_bar_divisions))
-                if last_drag_model:
-                    setProgressBarOverlay("Writing drag...")
-                    df_drag.to_excel(writer, sheet_name = 'Drag')
-                    progress_step = progress_step + 1
-                    set_value(name="progress", value=float(progress_step/progress_bar_divisions))
-                    setProgressBarOverlay("Writing dyn. press...")
-                    df_dyn_press.to_excel(writer, sheet_name = 'Dyn. Press.')
-                if last_drogue_enabled:
-                    progress_step = progress_step + 1
-                    set_value(name="progress", value=float(progress_step/progress_bar_divisions))
-                    setProgressBarOverlay("Writing drogue deploy...")
-                    df_drogue.to_excel(writer, sheet_name = 'Drogue Deployment')
-                if last_chute_enabled:
-                    progress_step = progress_step + 1
-                    set_value(name="progress", value=float(progress_step/progress_bar_divisions))
-                    setProgressBarOverlay("Writing chute deploy...")
-                    df_chute.to_excel(writer, sheet_name = 'Main Chute Deployment')
-
-                setProgressBarOverlay("Finishing xlsx export...")
-  
+            # last_results is a trajectory_core.SimResult
+            if isinstance(last_results.channels, StreamingStore):
+                log_warning("Last run was streamed, exporting the graph data only. Full data is in " + last_results.channels.filepath, logger = "Logs")
+            setProgressBarOverlay("Writing " + os.path.splitext(exportFile)[1] + " file...")
+            export_result(last_results, exportFile, exportProgress)
             log_info("Successfully saved data to " + exportFile, logger = "Logs")
-            
+
+        except ExportError as e:
+            log_error(str(e), logger = "Logs")
         except:
-            log_error("Excel export failed.", logger = "Logs")
+            log_error("Data export failed.", logger = "Logs")
 
-        setProgressBarOverlay("Saving inputs to TXT...")
-        
-        # Save given inputs to TXT
+        setProgressBarOverlay("Saving inputs...")
+
+        # save the inputs of the run (and its outputs) as a case file,
+        # Import reads it back
         try:
-            progress_step = progress_step + 1
-            set_value(name="progress", value=float(progress_step/progress_bar_divisions))
-            inputSaveFile = exportFile[0:-5] + ".txt"
-            result_file = open(inputSaveFile, "w")
-            result_file.write("Save file version " + version + "\n\n")
-            result_file.write("INPUTS\n\n")
-            result_file.write("Effective exhaust velocity: ")
-            result_file.write(str(last_eev)+" m/s\n")
-            result_file.write("Mass flow: ")
-            result_file.write(str(last_mdot)+" kg/s\n")
-            result_file.write("Initial mass: ")
-            result_file.write(str(last_mass_init)+" kg\n")
-            result_file.write("Propellant mass: ")
-            result_file.write(str(last_mass_propellant)+" kg\n")
-            result_file.write("Initial altitude: ")
-            result_file.write(str(last_alt_init)+" m\n")
-            result_file.write("Nozzle exit pressure: ")
-            result_file.write(str(last_exit_pressure)+" Pa\n")
-            result_file.write("Nozzle exit area: ")
-            result_file.write(str(last_exit_area)+" m^2\n")
-            result_file.write("Time increment: ")
-            result_file.write(str(last_time_increment)+" s\n")
-            result_file.write("Vessel cross-section (facing airflow): ")
-            if last_drag_model:
-                result_file.write(str(last_cross_sec)+" m^2\n")
-            else:
-                result_file.write(str(last_cross_sec)+"\n")
-            result_file.write("Drag coefficient (launch configuration): ")
-            result_file.write(str(last_drag_coeff)+"\n")
-            if last_drag_model:
-                result_file.write("Drag model ENABLED.\n")
-            else:
-                result_file.write("Drag model DISABLED.\n")
-            if last_drogue_enabled:
-                result_file.write("Drogue chute ENABLED.\n")
-                result_file.write("Drogue chute deployment altitude: ")
-                result_file.write(str(last_drogue_deploy_alt) + " m\n")
-                result_file.write("Drogue chute deployment time: ")
-                result_file.write(str(last_drogue_deploy_time) + " s\n")
-                result_file.write("Drogue chute area: ")
-                result_file.write(str(last_drogue_area) + " m^2\n")
-                result_file.write("Drogue chute drag coefficient: ")
-                result_file.write(str(last_drogue_coeff) + "\n")
-                result_file.write("Drogue chute mass: ")
-                result_file.write(str(last_drogue_mass) + " kg\n")
-            else:
-                result_file.write("Drogue chute DISABLED.\n")
-                result_file.write("Drogue chute deployment altitude: ")
-                result_file.write(str(last_drogue_deploy_alt) + "\n")
-                result_file.write("Drogue chute deployment time: ")
-                result_file.write(str(last_drogue_deploy_time) + "\n")
-                result_file.write("Drogue chute area: ")
-                result_file.write(str(last_drogue_area) + "\n")
-                result_file.write("Drogue chute drag coefficient: ")
-                result_file.write(str(last_drogue_coeff) + "\n")
-                result_file.write("Drogue chute mass: ")
-                result_file.write(str(last_drogue_mass) + "\n")
-            if last_chute_enabled:
-                result_file.write("Main chute ENABLED.\n")
-                result_file.write("Main chute deployment altitude: ")
-                result_file.write(str(last_chute_deploy_alt) + " m\n")
-                result_file.write("Main chute deployment time: ")
-                result_file.write(str(last_chute_deploy_time) + " s\n")
-                result_file.write("Main chute area: ")
-                result_file.write(str(last_chute_area) + " m^2\n")
-                result_file.write("Main chute drag coefficient: ")
-                result_file.write(str(last_chute_coeff) + "\n")
-            else:
-                result_file.write("Main chute DISABLED.\n")
-                result_file.write("Main chute deployment altitude: ")
-                result_file.write(str(last_chute_deploy_alt) + "\n")
-                result_file.write("Main chute deployment time: ")
-                result_file.write(str(last_chute_deploy_time) + "\n")
-                result_file.write("Main chute area: ")
-                result_file.write(str(last_chute_area) + "\n")
-                result_file.write("Main chute drag coefficient: ")
-                result_file.write(str(last_chute_coeff) + "\n")
-            if last_target_apogee_enabled:
-                result_file.write("Apogee target SET.\n")
-                result_file.write("Target apogee: " + str(last_target_apogee) + " m\n")
-                result_file.write("Engine shutdown delay: " + str(last_engine_shutdown_delay) + " s\n")
-            else:
-                result_file.write("Apogee target NOT SET.\n")
-                result_file.write("Target apogee: " + str(last_target_apogee) + "\n")
-                result_file.write("Engine shutdown delay: " + str(last_engine_shutdown_delay) + " \n")
-            
-            result_file.write("\nOUTPUTS\n\n")
-            result_file.write("Maximum altitude: ")
-            result_file.write(str(get_value("alt_max"))+" m\n")
-            result_file.write("Time to apoapsis: ")
-            result_file.write(str(get_value("tt_apoapsis"))+" s\n")
-            result_file.write("Maximum velocity: ")
-            result_file.write(str(get_value("vel_max"))+" m/s\n")
-            result_file.write("Time to max. velocity: ")
-            result_file.write(str(get_value("tt_max_vel"))+" s\n")
-            result_file.write("Flight time: ")
-            result_file.write(str(get_value("flight_time"))+" s\n")
-            result_file.write("Min. specific impulse: ")
-            result_file.write(str(get_value("isp_min"))+" s\n")
-            result_file.write("Max. specific impulse: ")
-            result_file.write(str(get_value("isp_max"))+" s\n")
-            result_file.write("Max. dynamic pressure: ")
-            if last_drag_model:
-                result_file.write(str(get_value("max_Q"))+" Pa\n")
-            else:
-                result_file.write("Drag model disabled.\n")
-            result_file.write("Simulation export file: " + exportFile + "\n")
-            result_file.close()
-            log_info("Inputs saved in " + inputSaveFile, logger = "Logs")
+            set_value(name="progress", value=0.95)
+            caseFile = os.path.splitext(exportFile)[0] + ".json"
+            outputs = {name: getattr(last_results, name) for name in case_output_fields}
+            write_cases(caseFile, [Case(os.path.splitext(os.path.basename(exportFile))[0], last_results.inputs, outputs, exportFile)])
+            log_info("Inputs saved in " + caseFile, logger = "Logs")
         except:
-            log_error("TXT export failed.", logger = "Logs")  
+            log_error("Case file export failed.", logger = "Logs")
         
     else:
         log_warning("No filename provided. Export aborted.", logger = "Logs")
@@ -434,111 +207,142 @@ def exportFile():
     setProgressBarOverlay("")
 
 # - - - - - - - - - - - - - - - - - - - - - - - - - - - -
-#               APOGEE PREDICTION ROUTINE
+#                     VISUALIZER
 # - - - - - - - - - - - - - - - - - - - - - - - - - - - -
 
-def calcApogeeDelayed(param_a, param_v, param_m, target_apogee, drag_model, param_cross_sec, param_drag_coeff, param_time_incr, param_last_accel, param_delay, param_mdot):
-
-    vel_init = param_v
-    alt_init = param_a
-    mass = param_m
-    time_increment = param_time_incr
-    drag_enabled = drag_model
-    cross_sec = param_cross_sec
-    drag_coeff = param_drag_coeff
-
-    last_accel = param_last_accel
-    shutdown_delay = param_delay
-
-    # Calculation sub-functions
+# every canvas item is drawn once with a tag and then moved around
+# with modify_draw_command. In the fixed view the sea, ground and
+# guide lines never move, so only the rocket is touched per frame.
 
-    def clamp(num, min_value, max_value):
-        return max(min(num, max_value), min_value)
+# (lock_on_rocket, vis_scale, alt_init) the canvas was last laid out for
+vis_layout = None
 
-    def sign(x): return 1 if x >= 0 else -1
+vis_draw = {"line": draw_line, "text": draw_text, "rect": draw_rectangle}
 
-    def alt2dens(altitude):
+# sea, ground, Karman line and 10 km lines as (kind, tag, arguments)
+def visGuideItems(alt, alt_init, vis_scale, lock_on_rocket):
 
-        if altitude > 85000:
-            return 0.0
-        else:
-            alt_low = int(altitude/100)
-            alt_high = alt_low + 1
-
-            lookup_line_low = float(model_lines[alt_low])
-            lookup_line_high = float(model_lines[alt_high])
-
-            # do linear interpolation so you don't get "staircase" values
-            interpolated_density = lookup_line_low + ((lookup_line_high - lookup_line_low)/100) * ((altitude - (alt_low * 100)))
-
-            return float(interpolated_density)
-
-    # Approximate drag force on the vessel
-    def calc_drag(velocity, altitude):
-
-        if drag_enabled:
-            drag = (0.5 * alt2dens(altitude) * velocity**2 * drag_coeff * cross_sec) * -sign(velocity)
-        else:
-            drag = 0.0
+    items = []
 
-        return drag
+    if not lock_on_rocket:
+        ground_y = int(alt_init/vis_scale)
+        items.append(("line", "sea", {"p1": space2screen(-340,1,680,380), "p2": space2screen(340,1,680,380), "color": [0,100,255,255], "thickness": 1}))
+        items.append(("text", "sea_text", {"pos": [space2screen(-340,1,680,380)[0], space2screen(340,1,680,380)[1] - 14], "text": "Sea Level", "size": 14, "color": [0,100,255,255]}))
+        items.append(("line", "ground", {"p1": space2screen(-340,ground_y+1,680,380), "p2": space2screen(340,ground_y+1,680,380), "color": [0,255,0,255], "thickness": 1}))
+        items.append(("text", "ground_text", {"pos": [space2screen(-340,ground_y+1,680,380)[0], space2screen(-340,ground_y,680,380)[1] - 14], "text": "Ground", "size": 14, "color": [0,255,0,255]}))
+        karman_y = int(100000/vis_scale)
+        items.append(("line", "karman", {"p1": space2screen(-340,karman_y,680,380), "p2": space2screen(340,karman_y,680,380), "color": [255,100,255,128], "thickness": 1}))
+        items.append(("text", "karman_text", {"pos": [space2screen(-340,karman_y,680,380)[0], space2screen(-340,karman_y,680,380)[1] - 14], "text": "Karman Line", "size": 14, "color": [255,100,255,128]}))
+        for i in range(1, 10):
+            line_y = int(i*10000/vis_scale)
+            items.append(("line", "km_" + str(i), {"p1": space2screen(-340,line_y,680,380), "p2": space2screen(-50,line_y,680,380), "color": [255,255,255,128], "thickness": 1}))
+            items.append(("text", "km_text_" + str(i), {"pos": [space2screen(-340,line_y,680,380)[0], space2screen(-340,line_y,680,380)[1] - 14], "text": str(i*10)+" km (ASL)", "size": 14, "color": [255,255,255,128]}))
 
-    def calc_grav(altitude):
-        gravity = 9.80665 * (6369000/(6369000+altitude))**2
-        return gravity
+    else:
+        sea_y = 170-int(alt/vis_scale)
+        items.append(("line", "sea", {"p1": space2screen(-340,sea_y,680,380), "p2": space2screen(340,sea_y,680,380), "color": [0,100,255,255], "thickness": 1}))
+        items.append(("text", "sea_text", {"pos": space2screen(-340,sea_y+14,680,380), "text": "Sea Level", "size": 14, "color": [0,100,255,255]}))
+        ground_y = 170-int((alt-alt_init)/vis_scale)
+        items.append(("line", "ground", {"p1": space2screen(-340,ground_y,680,380), "p2": space2screen(340,ground_y,680,380), "color": [0,255,0,255], "thickness": 1}))
+        items.append(("text", "ground_text", {"pos": space2screen(-340,ground_y+14,680,380), "text": "Ground", "size": 14, "color": [0,255,0,255]}))
+        karman_y = 170+int((100000-alt)/vis_scale)
+        items.append(("line", "karman", {"p1": space2screen(-340,karman_y,680,380), "p2": space2screen(340,karman_y,680,380), "color": [255,100,255,128], "thickness": 1}))
+        items.append(("text", "karman_text", {"pos": space2screen(-340,karman_y+14,680,380), "text": "Karman Line", "size": 14, "color": [255,100,255,128]}))
+        for i in range(1, 10):
+            line_y = 170+int((i*10000-alt)/vis_scale)
+            items.append(("line", "km_" + str(i), {"p1": space2screen(-340,line_y,680,380), "p2": space2screen(-50,line_y,680,380), "color": [255,255,255,128], "thickness": 1}))
+            items.append(("text", "km_text_" + str(i), {"pos": space2screen(-340,line_y+14,680,380), "text": str(i*10)+" km", "size": 14, "color": [255,255,255,128]}))
+
+    return items
+
+# rocket, chutes and plume, hidden ones are drawn transparent
+def visRocketItems(state, vis_scale, lock_on_rocket):
+
+    # (bottom, top) of each item above the base line
+    if not lock_on_rocket:
+        base = int(state.alt/vis_scale)
+        spans = {"rocket": (1, 5), "drogue": (6, 8), "chute": (6, 10), "plume": (-2, 1)}
+    else:
+        base = 170
+        spans = {"rocket": (0, 5), "drogue": (6, 8), "chute": (6, 10), "plume": (-5, 0)}
 
-    # - - - - - - - - - - - - - - - - - - - - - - - - - - - -
-    #                   RUN PREDICTION
-    # - - - - - - - - - - - - - - - - - - - - - - - - - - - -
+    drogue_alpha = 255*state.drogue_deployment if state.drogue_deployment > 0 and not state.drogue_released else 0
+    chute_alpha = 255*state.chute_deployment if state.chute_deployment > 0 else 0
+    plume_alpha = 255 if state.is_accelerating_up else 0
 
-    #set initial values
-    
-    alt = alt_init
-    vel = vel_init
-    drag = 0
-    density = alt2dens(alt_init)
-    gravity = -calc_grav(alt_init)
-    time = 0
-    
-    accel = last_accel[1]
+    return [("rect", "rocket", {"pmin": space2screen(0,base+spans["rocket"][0],680,380), "pmax": space2screen(0,base+spans["rocket"][1],680,380), "color": [200,0,0,255]}),
+            ("rect", "drogue", {"pmin": space2screen(-2,base+spans["drogue"][0],680,380), "pmax": space2screen(2,base+spans["drogue"][1],680,380), "color": [255,10,10,drogue_alpha]}),
+            ("rect", "chute", {"pmin": space2screen(-4,base+spans["chute"][0],680,380), "pmax": space2screen(4,base+spans["chute"][1],680,380), "color": [255,10,10,chute_alpha]}),
+            ("rect", "plume", {"pmin": space2screen(0,base+spans["plume"][0],680,380), "pmax": space2screen(0,base+spans["plume"][1],680,380), "color": [200,150,10,plume_alpha]})]
 
-    is_going_up = True
+def drawVisualizer(state, alt_init, vis_scale, lock_on_rocket):
 
-    # BEGIN TIMESTEPS
-    
-    while (True):
-
-        time = time + time_increment
+    global vis_layout
 
-        if time < shutdown_delay:
-            vel = vel + accel * time_increment
-            accel = accel + (last_accel[1] - last_accel[0]) #don't multiply this with time_accel, it is included already
-            mass = mass - param_mdot * time_increment
-        else:
-            density = alt2dens(alt)
-            gravity = -calc_grav(alt)
-            drag = calc_drag(vel, alt)
-            vel = vel + gravity * time_increment + drag/mass * time_increment
+    layout = (lock_on_rocket, vis_scale, alt_init)
+    if layout != vis_layout:
+        # new layout, draw everything from scratch
+        clear_drawing("vis_canvas")
+        for kind, tag, args in visGuideItems(state.alt, alt_init, vis_scale, lock_on_rocket) + visRocketItems(state, vis_scale, lock_on_rocket):
+            vis_draw[kind](drawing="vis_canvas", tag=tag, **args)
+        vis_layout = layout
+        return
 
-        alt = alt + vel * time_increment
+    if lock_on_rocket:
+        items = visGuideItems(state.alt, alt_init, vis_scale, lock_on_rocket) + visRocketItems(state, vis_scale, lock_on_rocket)
+    else:
+        items = visRocketItems(state, vis_scale, lock_on_rocket)
 
-        if is_going_up and vel <= 0:
-            is_going_up = False
-            alt_max = alt
-            if alt_max >= target_apogee:
-                return True
-            else:
-                return False
+    for kind, tag, args in items:
+        modify_draw_command("vis_canvas", tag, **args)
 
 # - - - - - - - - - - - - - - - - - - - - - - - - - - - -
 #                SIMULATION SETUP
 # - - - - - - - - - - - - - - - - - - - - - - - - - - - -
 
+# the physics live in trajectory_core.simulate(), which runs on the
+# background worker (see sim_worker.py). simulateTraj only collects
+# the inputs and queues a run, pollSimulation is called every GUI
+# frame and shows whatever the worker has sent since.
+# Designs flown before in this session come from the result cache,
+# give it a directory to keep them across sessions as well.
+result_cache = ResultCache()
+sim_worker = SimWorker(cache=result_cache)
+
+# job id -> run number shown in the logs
+run_numbers = {}
+
+# (series, plot, channel) of the output graphs, the live graphs
+# leave out the chute deployments
+plot_series = [("Altitude", "alt_plot", "alt"),
+               ("Velocity", "vel_plot", "vel"),
+               ("Acceleration", "accel_plot", "accel"),
+               ("Thrust", "thrust_plot", "thrust"),
+               ("External Pressure", "ext_press_plot", "external_pressure"),
+               ("Gravity", "grav_plot", "gravity"),
+               ("Isp", "isp_plot", "isp"),
+               ("Drag", "drag_plot", "drag"),
+               ("Dynamic Pressure", "dyn_press_plot", "dyn_press"),
+               ("Drogue Deployment", "drogue_deployment_plot", "drogue_deployment"),
+               ("Chute Deployment", "chute_deployment_plot", "chute_deployment")]
+live_plot_series = plot_series[:9]
+
+# graphs are about 700 pixels wide, each bucket adds up to two points
+plot_buckets = 1000
+
+# live graphs of the running job, fed with the rows of every progress message
+live_decimators = {}
+
+# wall clock time of the next visualizer/live graph update
+next_frame = 0.0
+
+# the simulator's own apogee check, every time step
+builtin_flight_computer = "Built-in (every step)"
+
 def simulateTraj():
     
     global calc_run_number
     calc_run_number += 1
-    log_info(message = "Run [" + str(calc_run_number) + "]: Simulating trajectory...", logger = "Logs")
 
     # get input values from entry fields
     target_apogee_enabled = get_value("target_apogee_checkbox")
@@ -547,520 +351,262 @@ def simulateTraj():
     chute_enabled = get_value("chute_checkbox")
     
     try:
-        eev = float(get_value("eev_field"))
-        mdot = float(get_value("mdot_field"))
-        mass_init = float(get_value("mass_init_field"))
-        mass_propellant = float(get_value("mass_propellant_field"))
-        alt_init = float(get_value("alt_init_field"))
-        exit_pressure = float(get_value("exit_pressure_field"))
-        exit_area = float(get_value("exit_area_field"))
-        time_increment = float(get_value("time_increment_field"))
+        inputs = SimInputs(eev = float(get_value("eev_field")),
+                           mdot = float(get_value("mdot_field")),
+                           mass_init = float(get_value("mass_init_field")),
+                           mass_propellant = float(get_value("mass_propellant_field")),
+                           alt_init = float(get_value("alt_init_field")),
+                           exit_pressure = float(get_value("exit_pressure_field")),
+                           exit_area = float(get_value("exit_area_field")),
+                           time_increment = float(get_value("time_increment_field")))
 
         if target_apogee_enabled:
-            target_apogee = float(get_value("target_apogee_field"))
-            engine_shutdown_delay = float(get_value("engine_shutdown_delay_field"))
+            inputs.target_apogee_enabled = True
+            inputs.target_apogee = float(get_value("target_apogee_field"))
+            inputs.engine_shutdown_delay = float(get_value("engine_shutdown_delay_field"))
+            if get_value("shutdown_command_time_field").strip():
+                inputs.shutdown_command_time = float(get_value("shutdown_command_time_field"))
 
         if drag_enabled:
-            cross_sec = float(get_value("cross_sec_field"))
-            drag_coeff = float(get_value("drag_coeff_field"))
+            inputs.drag_enabled = True
+            inputs.cross_sec = float(get_value("cross_sec_field"))
+            inputs.drag_coeff = float(get_value("drag_coeff_field"))
             
             if chute_enabled:
-                chute_deploy_alt = float(get_value("chute_deploy_alt_field"))
-                chute_deploy_time = float(get_value("chute_deploy_time_field"))
-                chute_area = float(get_value("chute_area_field"))
-                chute_coeff = float(get_value("chute_coeff_field"))
-            else:
-                chute_deploy_alt = -1.0
-                chute_deploy_time = -1.0
-                chute_area = -1.0
-                chute_coeff = -1.0
+                inputs.chute_deploy_alt = float(get_value("chute_deploy_alt_field"))
+                inputs.chute_deploy_time = float(get_value("chute_deploy_time_field"))
+                inputs.chute_area = float(get_value("chute_area_field"))
+                inputs.chute_coeff = float(get_value("chute_coeff_field"))
                 
             if drogue_enabled:
-                drogue_deploy_alt = float(get_value("drogue_deploy_alt_field"))
-                drogue_deploy_time = float(get_value("drogue_deploy_time_field"))
-                drogue_area = float(get_value("drogue_area_field"))
-                drogue_coeff = float(get_value("drogue_coeff_field"))
-                drogue_mass = float(get_value("drogue_mass_field"))
-            else:
-                drogue_deploy_alt = -1.0
-                drogue_deploy_time = -1.0
-                drogue_area = -1.0
-                drogue_coeff = -1.0
-                
-        else:
-            cross_sec = -1.0
-            drag_coeff = -1.0
+                inputs.drogue_deploy_alt = float(get_value("drogue_deploy_alt_field"))
+                inputs.drogue_deploy_time = float(get_value("drogue_deploy_time_field"))
+                inputs.drogue_area = float(get_value("drogue_area_field"))
+                inputs.drogue_coeff = float(get_value("drogue_coeff_field"))
+                inputs.drogue_mass = float(get_value("drogue_mass_field"))
+
+        inputs.drogue_enabled = drogue_enabled
+        inputs.chute_enabled = chute_enabled
             
     except:
-        log_error("Input error. Make sure all design parameters are float values.", logger = "Logs")
+        log_error("Run [" + str(calc_run_number) + "]: Input error. Make sure all design parameters are float values.", logger = "Logs")
         return
 
-    if mass_propellant >= mass_init:
-        log_error("Propellant mass can not be larger than initial mass!", logger = "Logs")
+    try:
+        inputs.validate()
+    except SimulationError as e:
+        log_error("Run [" + str(calc_run_number) + "]: " + str(e), logger = "Logs")
         return
 
-    # save these values in global scope, in case we want to export
-    global last_eev, last_mdot, last_mass_init, last_mass_propellant, last_alt_init, last_time_increment, last_exit_area, last_exit_pressure, last_drag_model
-    last_eev = eev
-    last_mdot = mdot
-    last_mass_init = mass_init
-    last_mass_propellant = mass_propellant
-    last_alt_init = alt_init
-    last_exit_area = exit_area
-    last_exit_pressure = exit_pressure
-    last_time_increment = time_increment
-
-    global last_cross_sec, last_drag_coeff, last_target_apogee, last_target_apogee_enabled, last_engine_shutdown_delay
-
-    if target_apogee_enabled:
-        last_target_apogee_enabled = True
-        last_target_apogee = target_apogee
-        last_engine_shutdown_delay = engine_shutdown_delay
-    else:
-        last_target_apogee_enabled = False
-        last_target_apogee = "Target not set."
-        last_engine_shutdown_delay = "Target not set."
-
-    if drag_enabled:
-        last_drag_model = True
-        last_cross_sec = cross_sec
-        last_drag_coeff = drag_coeff
-    else:
-        last_drag_model = False
-        last_cross_sec = "Drag model disabled."
-        last_drag_coeff = "Drag model disabled."
-
-    global last_drogue_enabled, last_drogue_deploy_alt, last_drogue_deploy_time, last_drogue_area, last_drogue_coeff, last_drogue_mass
-
-    if drogue_enabled:
-        last_drogue_enabled =  True
-        last_drogue_deploy_alt = drogue_deploy_alt
-        last_drogue_deploy_time = drogue_deploy_time
-        last_drogue_area = drogue_area
-        last_drogue_coeff = drogue_coeff
-        last_drogue_mass = drogue_mass
-    else:
-        last_drogue_enabled =  False
-        last_drogue_deploy_alt = "Drogue chute disabled."
-        last_drogue_deploy_time = "Drogue chute disabled."
-        last_drogue_area = "Drogue chute disabled."
-        last_drogue_coeff = "Drogue chute disabled."
-        last_drogue_mass = "Drogue chute disabled."
-
-    global last_chute_enabled, last_chute_deploy_alt, last_chute_deploy_time, last_chute_area, last_chute_coeff
-
-    if chute_enabled:
-        last_chute_enabled = True
-        last_chute_deploy_alt = chute_deploy_alt
-        last_chute_deploy_time = chute_deploy_time
-        last_chute_area = chute_area
-        last_chute_coeff = chute_coeff
-    else:
-        last_chute_enabled = False
-        last_chute_deploy_alt = "Main recovery chute disabled."
-        last_chute_deploy_time = "Main recovery chute disabled."
-        last_chute_area = "Main recovery chute disabled."
-        last_chute_coeff = "Main recovery chute disabled."
-
-    # Calculation sub-functions
-
-    def clamp(num, min_value, max_value):
-        return max(min(num, max_value), min_value)
-
-    def sign(x): return 1 if x >= 0 else -1
-
-    def alt2dens(altitude):
-
-        if altitude > 85000:
-            return 0.0
-        else:
-            alt_low = int(altitude/100)
-            alt_high = alt_low + 1
-
-            lookup_line_low = float(model_lines[alt_low])
-            lookup_line_high = float(model_lines[alt_high])
-
-            # do linear interpolation so you don't get "staircase" values
-            interpolated_density = lookup_line_low + ((lookup_line_high - lookup_line_low)/100) * ((altitude - (alt_low * 100)))
-
-            return float(interpolated_density)
-
-    # https://www.grc.nasa.gov/www/k-12/airplane/atmosmet.html
-    def alt2press(altitude):
-
-        # takes altitude in meters
-        # returns typical pressure, density or temperature on demand
-        # altitude: m
-        # pressure: Pa
-        # temp: degrees C
-
-        if altitude < 11000:
-            temp = -131.21 + 0.00299 * altitude
-            press = 101330 * (1-((0.0065 * altitude)/(288.15)))**((9.807)/(286.9 * 0.0065))
-
-        if 25000 > altitude >= 11000:
-            temp = -56.46
-            press = (22.65 * math.e ** (1.73 - 0.000157 * altitude)) * 1000
-
-        if altitude >= 25000:
-            temp = -131.21 + 0.00299 * altitude
-            press = (2.488 * ((temp + 273.1)/(216.6))**(-11.388)) * 1000
-        
-        return press
-
-    # Approximate drag force on the vessel
-    def calc_drag(velocity, altitude):
-
-        if drag_enabled:
-
-            if drogue_deployment > 0.0 and not drogue_released:
-                airflow_area = cross_sec + (drogue_area - cross_sec) * drogue_deployment
-                drag = (0.5 * alt2dens(altitude) * velocity**2 * drogue_coeff * airflow_area) * -sign(velocity)
-                
-            elif chute_deployment > 0.0:
-                airflow_area = cross_sec + (chute_area - cross_sec) * chute_deployment
-                drag = (0.5 * alt2dens(altitude) * velocity**2 * chute_coeff * airflow_area) * -sign(velocity)
-                
-            else:
-                drag = (0.5 * alt2dens(altitude) * velocity**2 * drag_coeff * cross_sec) * -sign(velocity)
-                
-            dynamic_press = 0.5 * alt2dens(altitude) * velocity**2
-
-            return drag, dynamic_press
-        
-        else:
-            return 0.0, 0.0
-
-    def calc_grav(altitude):
-        gravity = 9.80665 * (6369000/(6369000+altitude))**2
-        return gravity
-
-    # - - - - - - - - - - - - - - - - - - - - - - - - - - - -
-    #                   RUN SIMULATION
-    # - - - - - - - - - - - - - - - - - - - - - - - - - - - -
-
-    #set initial values
-    
-    alt = alt_init
-    thrust = mdot * eev + exit_area * (exit_pressure - alt2press(alt_init))
-    mass = mass_init
-    vel = 0
-    accel = 0
-    external_pressure = alt2press(alt_init)
-    isp = (thrust)/(mdot * 9.80665)
-    set_value(name="isp_min", value=isp)
-    drag = 0
-    dyn_press = 0
-    density = alt2dens(alt_init)
-    gravity = -calc_grav(alt_init)
-    time = 0
-    
-    time_list = []
-    alt_list = []
-    vel_list = []
-    accel_list = []
-    ground_level_list = []
-    karman_line_list = []
-    thrust_list = []
-    external_pressure_list = []
-    gravity_list = []
-    isp_list = []
-    drag_list = []
-    dyn_press_list = []
-    density_list = []
-
-    drogue_deployment_list = []
-    chute_deployment_list = []
-
-    is_going_up = True
-    is_accelerating_up = True
-    is_launching = True
-
-    engine_shutdown = False
-    engine_shutdown_command = False
-    time_since_shutdown_command = 0.0
-
-    drogue_deployment = 0.0
-    chute_deployment = 0.0
-
-    drogue_released = False
+    adaptive = get_value("adaptive_checkbox")
 
+    # a flight computer plugin flies in the loop instead of the built-in apogee check
+    controller = None
+    if target_apogee_enabled and get_value("flight_computer_combo") != builtin_flight_computer:
+        try:
+            controller = create_controller(get_value("flight_computer_combo"), float(get_value("flight_computer_rate_field")))
+        except ValueError:
+            log_error("Run [" + str(calc_run_number) + "]: Flight computer rate must be a float value.", logger = "Logs")
+            return
+        except SimulationError as e:
+            log_error("Run [" + str(calc_run_number) + "]: " + str(e), logger = "Logs")
+            return
+        if adaptive:
+            log_warning("Run [" + str(calc_run_number) + "]: Flight computers fly on the fixed time step, adaptive step not used.", logger = "Logs")
+
+    # opt-in: write every step to disk instead of keeping it in memory
+    store = None
+    if get_value("stream_checkbox"):
+        stream_filepath = get_value("filepath_field")
+        if not os.path.splitext(stream_filepath)[1] in (".csv", ".npy"):
+            stream_filepath = os.path.splitext(stream_filepath)[0] + ".npy"
+        if stream_filepath in (".csv", ".npy"):
+            stream_filepath = "trajectory_stream" + stream_filepath
+        try:
+            store = StreamingStore(stream_filepath)
+        except OSError:
+            log_error("Can not write stream file " + stream_filepath + ". Check filepath.", logger = "Logs")
+            return
+        log_info("Run [" + str(calc_run_number) + "]: Streaming results to " + stream_filepath, logger = "Logs")
+
+    if sim_worker.busy:
+        log_info("Run [" + str(calc_run_number) + "]: Queued.", logger = "Logs")
+
+    profiler = None
+    if get_value("profile_checkbox"):
+        profiler = PhaseProfiler()
+
+    sim_worker.realtime = get_value("sim_mode")
+    job = sim_worker.submit(inputs, adaptive=adaptive, store=store, profiler=profiler, controller=controller)
+    run_numbers[job.id] = calc_run_number
     show_item("progress_bar")
-    progress_loop = 0
-
-    # BEGIN TIMESTEPS
-    
-    while (True):
 
-        cycle_start = t.perf_counter()
-
-        # --- UPDATE VISUALIZER ---
-
-        vis_scale = float(get_value("vis_scale_field"))
-        clear_drawing("vis_canvas")
-
-        if not get_value("lock_on_rocket"):
-            # sea
-            draw_line(drawing="vis_canvas", p1=space2screen(-340,1,680,380), p2=space2screen(340,1,680,380),
-                      color=[0,100,255,255], thickness=1)
-            draw_text(drawing="vis_canvas", pos=[space2screen(-340,1,680,380)[0], space2screen(340,1,680,380)[1] - 14],
-                      text="Sea Level", size=14, color=[0,100,255,255])
-            
-            # ground
-            draw_line(drawing="vis_canvas", p1=space2screen(-340,int(alt_init/vis_scale)+1,680,380), p2=space2screen(340,int(alt_init/vis_scale)+1,680,380),
-                      color=[0,255,0,255], thickness=1)
-            draw_text(drawing="vis_canvas", pos=[space2screen(-340,int(alt_init/vis_scale)+1,680,380)[0], space2screen(-340,int(alt_init/vis_scale),680,380)[1] - 14],
-                      text="Ground", size=14, color=[0,255,0,255])
-
-            # rocket
-            draw_rectangle(drawing="vis_canvas", pmin=space2screen(0,int(alt/vis_scale)+1,680,380), pmax=space2screen(0,int(alt/vis_scale)+5,680,380),
-                           color=[200,0,0,255])
-
-            # drogue
-            if drogue_deployment > 0 and not drogue_released:
-                draw_rectangle(drawing="vis_canvas", pmin=space2screen(-2,int(alt/vis_scale)+6,680,380), pmax=space2screen(2,int(alt/vis_scale)+8,680,380),
-                               color=[255,10,10,255*drogue_deployment])
-
-            # main chute
-            if chute_deployment > 0:
-                draw_rectangle(drawing="vis_canvas", pmin=space2screen(-4,int(alt/vis_scale)+6,680,380), pmax=space2screen(4,int(alt/vis_scale)+10,680,380),
-                               color=[255,10,10,255*chute_deployment])
-
-            # plume
-            if is_accelerating_up:
-                draw_rectangle(drawing="vis_canvas", pmin=space2screen(0,int(alt/vis_scale)-2,680,380), pmax=space2screen(0,int(alt/vis_scale)+1,680,380),
-                               color=[200,150,10,255])
-
-            # Karman line
-            draw_line(drawing="vis_canvas", p1=space2screen(-340,int(100000/vis_scale),680,380), p2=space2screen(340,int(100000/vis_scale),680,380),
-                      color=[255,100,255,128], thickness=1)
-            draw_text(drawing="vis_canvas", pos=[space2screen(-340,int(100000/vis_scale),680,380)[0], space2screen(-340,int(100000/vis_scale),680,380)[1] - 14],
-                      text="Karman Line", size=14, color=[255,100,255,128])
-
-            # 10 kilometer lines
-            for i in range(1, 10):
-                draw_line(drawing="vis_canvas", p1=space2screen(-340,int(i*10000/vis_scale),680,380), p2=space2screen(-50,int(i*10000/vis_scale),680,380),
-                          color=[255,255,255,128], thickness=1)
-                draw_text(drawing="vis_canvas", pos=[space2screen(-340,int(i*10000/vis_scale),680,380)[0], space2screen(-340,int(i*10000/vis_scale),680,380)[1] - 14],
-                          text=(str(i*10)+" km (ASL)"), size=14, color=[255,255,255,128])
-
-        else:
-            # sea
-            draw_line(drawing="vis_canvas", p1=space2screen(-340, 170-int(alt/vis_scale), 680, 380), p2=space2screen(340, 170-int(alt/vis_scale), 680, 380),
-                      color=[0,100,255,255], thickness=1)
-            draw_text(drawing="vis_canvas", pos=space2screen(-340, 170-int(alt/vis_scale)+14, 680, 380), text="Sea Level", size=14, color=[0,100,255,255])
-            
-            # ground
-            draw_line(drawing="vis_canvas", p1=space2screen(-340, 170-int((alt-alt_init)/vis_scale), 680, 380), p2=space2screen(340, 170-int((alt-alt_init)/vis_scale), 680, 380),
-                      color=[0,255,0,255], thickness=1)
-            draw_text(drawing="vis_canvas", pos=space2screen(-340, 170-int((alt-alt_init)/vis_scale)+14, 680, 380),
-                      text="Ground", size=14, color=[0,255,0,255])
-
-            # rocket
-            draw_rectangle(drawing="vis_canvas", pmin=space2screen(0,170,680,380), pmax=space2screen(0,175,680,380),
-                           color=[200,0,0,255])
-
-            # drogue
-            if drogue_deployment > 0 and not drogue_released:
-                draw_rectangle(drawing="vis_canvas", pmin=space2screen(-2,176,680,380), pmax=space2screen(2,178,680,380),
-                               color=[255,10,10,255*drogue_deployment])
-
-            # main chute
-            if chute_deployment > 0:
-                draw_rectangle(drawing="vis_canvas", pmin=space2screen(-4,176,680,380), pmax=space2screen(4,180,680,380),
-                               color=[255,10,10,255*chute_deployment])
-
-            # plume
-            if is_accelerating_up:
-                draw_rectangle(drawing="vis_canvas", pmin=space2screen(0,165,680,380), pmax=space2screen(0,170,680,380),
-                               color=[200,150,10,255])
-
-            # Karman line
-            draw_line(drawing="vis_canvas", p1=space2screen(-340, 170+int((100000-alt)/vis_scale), 680, 380), p2=space2screen(340, 170+int((100000-alt)/vis_scale), 680, 380),
-                      color=[255,100,255,128], thickness=1)
-            draw_text(drawing="vis_canvas", pos=space2screen(-340, 170+int((100000-alt)/vis_scale)+14, 680, 380), text="Karman Line", size=14, color=[255,100,255,128])
-
-            # 10 km lines
-            for i in range(1, 10):
-                draw_line(drawing="vis_canvas", p1=space2screen(-340, 170+int((i*10000-alt)/vis_scale), 680, 380), p2=space2screen(-50, 170+int((i*10000-alt)/vis_scale), 680, 380),
-                          color=[255,255,255,128], thickness=1)
-                draw_text(drawing="vis_canvas", pos=space2screen(-340, 170+int((i*10000-alt)/vis_scale)+14, 680, 380),
-                          text=(str(i*10)+" km"), size=14, color=[255,255,255,128])
-
-        # --- --- --- --- ---
-
-        if progress_loop < 1.0:
-            progress_loop = progress_loop + 0.01
-        else:
-            progress_loop = 0.0
-
-        set_value(name="progress", value=progress_loop)
-        setProgressBarOverlay("Simulation running...")
-
-        if is_launching:
-
-            # not enough thrust at lift-off!
-            if thrust < (-gravity * mass_init):
-                log_error("Not enough thrust - vehicle won't lift off.", logger = "Logs")
-                delete_series(series="Altitude", plot="alt_plot")
-                set_value(name="alt_max", value="Not enough thrust at launch. Simulation terminated.")
-                set_value(name="vel_max", value="")
-                set_value(name="flight_time", value="")
-                return
-
-            # main chute deployment before main
-            if drogue_enabled and chute_enabled and drogue_deploy_alt <= chute_deploy_alt:
-                log_error("Attempt to deploy main chute before drogue!", logger = "Logs")
-                delete_series(series="Altitude", plot="alt_plot")
-                set_value(name="alt_max", value="Main chute deployment altitude is larger than")
-                set_value(name="vel_max", value="drogue chute deployment altitude.")
-                set_value(name="flight_time", value="Simulation terminated.")
-                return
-            
-            is_launching = False
-
-        thrust_list.append(thrust)
-        time_list.append(time)
-        alt_list.append(alt)
-        vel_list.append(vel)
-        ground_level_list.append(alt_init)
-        karman_line_list.append(100000)
-        external_pressure_list.append(external_pressure)
-        gravity_list.append(-gravity)
-        accel_list.append(accel)
-        isp_list.append(isp)
-        drag_list.append(drag)
-        dyn_press_list.append(dyn_press)
-        density_list.append(density)
-
-        if not drogue_released:
-            drogue_deployment_list.append(drogue_deployment)
-        else: 
-            drogue_deployment_list.append(0.0)
-        chute_deployment_list.append(chute_deployment)
-            
-        density = alt2dens(alt)    
-        time = time + time_increment
-
-        if target_apogee_enabled and not engine_shutdown_command and time > time_increment * 2:
-            engine_shutdown_command = calcApogeeDelayed(alt, vel, mass, target_apogee, drag_enabled, cross_sec, drag_coeff, time_increment, [accel_list[-2], accel_list[-1]], engine_shutdown_delay, mdot)
-            if engine_shutdown_command:
-                time_since_shutdown_command = 0
-
-        if engine_shutdown_command and time_since_shutdown_command < engine_shutdown_delay:
-            time_since_shutdown_command = time_since_shutdown_command + time_increment
-        elif engine_shutdown_command and time_since_shutdown_command >= engine_shutdown_delay and not engine_shutdown:
-            engine_shutdown = True
-
-        gravity = -calc_grav(alt)
-        external_pressure = alt2press(alt)
-
-        # don't provide thrust if propellants are depleted or engine shutdown command was given!
-        if mass > (mass_init - mass_propellant) and ((target_apogee_enabled and not engine_shutdown) or not target_apogee_enabled):   
-            vel = vel + ((thrust/mass) * time_increment) + (gravity * time_increment) + (drag/mass * time_increment)
-            mass = mass - mdot * time_increment
-            thrust = mdot * eev + exit_area * (exit_pressure - external_pressure)
-        else:
-            thrust = 0
-            vel = vel + gravity * time_increment + drag/mass * time_increment
-
-        if drogue_enabled and not is_going_up and alt <= drogue_deploy_alt:
-            if drogue_deployment < 1.0:
-                drogue_deployment = drogue_deployment + time_increment/drogue_deploy_time
+def cancelSimulation():
+    if sim_worker.busy:
+        sim_worker.cancel()
+    else:
+        log_warning("No simulation running.", logger = "Logs")
 
-        if chute_enabled and not is_going_up and alt <= chute_deploy_alt:
-            if drogue_enabled and not drogue_released:
-                drogue_released = True
-                mass = mass - drogue_mass
-                
-            if chute_deployment < 1.0:
-                chute_deployment = chute_deployment + time_increment/chute_deploy_time
-
-        alt = alt + vel * time_increment
-        alt_g = alt - alt_init
-        accel = thrust/mass + gravity + drag/mass
-        isp = (thrust)/(mdot * 9.80665)
-        drag, dyn_press = calc_drag(vel, alt)
-
-        if is_going_up and vel <= 0:
-            is_going_up = False
-            alt_max = alt
-            set_value(name="tt_apoapsis", value=time)
-            set_value(name="alt_max", value=alt_max)
-            set_value(name="max_Q", value=max(dyn_press_list))
-
-        if is_accelerating_up and (not mass > (mass_init - mass_propellant) or (target_apogee_enabled and engine_shutdown)):
-            is_accelerating_up = False
-            set_value(name="tt_max_vel", value=time)
-            set_value(name="vel_max", value=max(vel_list))
-            set_value(name="accel_max", value=max(accel_list))
-            set_value(name="isp_max", value=max(isp_list))
-            set_value(name="cutoff_time", value=time)
-
-        # vehicle reached ground!
-        if alt <= alt_init:
-            flight_time = time
-            set_value(name="flight_time", value=flight_time)
-            log_info("Simulation completed.", logger="Logs")
-            if time_increment > 0.1:
-                log_warning("Time increment too large. Last simulation may be inaccurate.", logger = "Logs")
-                
+def cancelAllSimulations():
+    if sim_worker.busy:
+        sim_worker.cancel_all()
+    else:
+        log_warning("No simulation running.", logger = "Logs")
+
+def updateLivePlots():
+    for series, plot, channel in live_plot_series:
+        x, y = live_decimators[channel].points()
+        add_line_series(name=series, plot=plot, x=x.tolist(), y=y.tolist())
+
+# called by dearpygui every frame
+def pollSimulation():
+
+    global next_frame, live_decimators
+
+    # switching modes mid-run takes effect right away
+    sim_worker.realtime = get_value("sim_mode")
+
+    messages = sim_worker.poll()
+
+    latest = None
+    for message in messages:
+        job = message.job
+        run = "Run [" + str(run_numbers.get(job.id)) + "]: "
+
+        if message.kind == "started":
+            log_info(run + "Simulating trajectory...", logger = "Logs")
+            live_decimators = {channel: IncrementalMinMax(plot_buckets) for series, plot, channel in live_plot_series}
+            latest = None
+
+        elif message.kind == "progress":
+            # every row goes into the decimators, so the live graphs can
+            # be switched on mid-run
+            with phase(job.profiler, "gui/live plot data"):
+                channels = {name: message.rows[i] for i, name in enumerate(flight_channels)}
+                for series, plot, channel in live_plot_series:
+                    live_decimators[channel].update(channels["time"], channels[channel])
+            latest = message
+
+        elif message.kind == "done":
+            finishSimulation(job, message.result, message.cached)
+            latest = None
+
+        elif message.kind == "failed":
+            showSimulationError(run, message.error)
+            latest = None
+
+        elif message.kind == "cancelled":
+            log_warning(run + "Simulation cancelled.", logger = "Logs")
+            if job.store is not None:
+                log_info("Partial results saved in " + job.store.filepath, logger = "Logs")
+            latest = None
+
+    if not sim_worker.busy:
+        if messages:
             set_value(name="progress", value=0)
             hide_item("progress_bar")
             setProgressBarOverlay("")
+        return
 
-            set_value(name="alt", value=alt_init)
-            set_value(name="alt_g", value="IMPACT!")
-            set_value(name="vel", value=vel)
-            set_value(name="time", value=time)
-            
-            break
-
-        # reduce computation speed to real-time if user prefers
-        if get_value("sim_mode"):
-            cycle_dt = t.perf_counter() - cycle_start
-            try:
-                if get_value("realtime_graph"):
-                    t.sleep((time_increment-cycle_dt)*(1/time))
-                else:
-                    t.sleep(time_increment-cycle_dt)
-            except:
-                log_warning("cycle_dt < 0", logger="Logs")
-        
-        set_value(name="alt", value=alt)
-        set_value(name="alt_g", value=alt_g)
-        set_value(name="vel", value=vel)
-        set_value(name="time", value=time)
-
-        if get_value("realtime_graph"):
-            add_line_series(name="Altitude", plot="alt_plot",x=time_list, y=alt_list)
-            add_line_series(name="Velocity", plot="vel_plot",x=time_list, y=vel_list)
-            add_line_series(name="Acceleration", plot="accel_plot",x=time_list, y=accel_list)
-            add_line_series(name="Thrust", plot="thrust_plot",x=time_list, y=thrust_list)
-            add_line_series(name="External Pressure", plot="ext_press_plot",x=time_list, y=external_pressure_list)
-            add_line_series(name="Gravity", plot="grav_plot",x=time_list, y=gravity_list)
-            add_line_series(name="Isp", plot="isp_plot", x=time_list, y=isp_list)
-            add_line_series(name="Drag", plot="drag_plot", x=time_list, y=drag_list)
-            add_line_series(name="Dynamic Pressure", plot="dyn_press_plot", x=time_list, y=dyn_press_list) 
-
-    setProgressBarOverlay("Updating graphs...")
-    add_line_series(name="Altitude", plot="alt_plot",x=time_list, y=alt_list)
-    add_line_series(name="Velocity", plot="vel_plot",x=time_list, y=vel_list)
-    add_line_series(name="Acceleration", plot="accel_plot",x=time_list, y=accel_list)
-    add_line_series(name="Thrust", plot="thrust_plot",x=time_list, y=thrust_list)
-    add_line_series(name="External Pressure", plot="ext_press_plot",x=time_list, y=external_pressure_list)
-    add_line_series(name="Gravity", plot="grav_plot",x=time_list, y=gravity_list)
-    add_line_series(name="Isp", plot="isp_plot", x=time_list, y=isp_list)
-    add_line_series(name="Drag", plot="drag_plot", x=time_list, y=drag_list)
-    add_line_series(name="Dynamic Pressure", plot="dyn_press_plot", x=time_list, y=dyn_press_list)
-    #add_line_series(name="Density", plot="density_plot", x=time_list, y=density_list)
-    add_line_series(name="Drogue Deployment", plot="drogue_deployment_plot", x=time_list, y=drogue_deployment_list)
-    add_line_series(name="Chute Deployment", plot="chute_deployment_plot", x=time_list, y=chute_deployment_list)
+    if latest is None:
+        return
+
+    # visualizer and live graphs are updated at most vis_fps_field times a second
+    now = t.perf_counter()
+    if now < next_frame:
+        return
+    try:
+        next_frame = now + 1/max(float(get_value("vis_fps_field")), 1.0)
+    except ValueError:
+        next_frame = now + 1/30
+
+    state = latest.state
+    profiler = latest.job.profiler
+    with phase(profiler, "gui/visualizer"):
+        drawVisualizer(state, latest.job.inputs.alt_init, float(get_value("vis_scale_field")), get_value("lock_on_rocket"))
+
+    with phase(profiler, "gui/set_value"):
+        if latest.progress is not None:
+            set_value(name="progress", value=latest.progress)
+        overlay = "Simulation running..."
+        if sim_worker.queued:
+            overlay = overlay + " (" + str(sim_worker.queued) + " queued)"
+        setProgressBarOverlay(overlay)
+
+        set_value(name="alt", value=state.alt)
+        set_value(name="alt_g", value=state.alt_g)
+        set_value(name="vel", value=state.vel)
+        set_value(name="time", value=state.time)
+
+    if get_value("realtime_graph"):
+        with phase(profiler, "gui/live plots"):
+            updateLivePlots()
+
+def showSimulationError(run, error):
+
+    if isinstance(error, InsufficientThrustError):
+        log_error(run + str(error), logger = "Logs")
+        delete_series(series="Altitude", plot="alt_plot")
+        set_value(name="alt_max", value="Not enough thrust at launch. Simulation terminated.")
+        set_value(name="vel_max", value="")
+        set_value(name="flight_time", value="")
+
+    elif isinstance(error, ChuteOrderError):
+        log_error(run + str(error), logger = "Logs")
+        delete_series(series="Altitude", plot="alt_plot")
+        set_value(name="alt_max", value="Main chute deployment altitude is larger than")
+        set_value(name="vel_max", value="drogue chute deployment altitude.")
+        set_value(name="flight_time", value="Simulation terminated.")
+
+    else:
+        log_error(run + "Simulation failed: " + str(error), logger = "Logs")
+
+def finishSimulation(job, results, cached=False):
+
+    with phase(job.profiler, "gui/set_value"):
+        set_value(name="isp_min", value=results.isp_min)
+        set_value(name="tt_apoapsis", value=results.tt_apoapsis)
+        set_value(name="alt_max", value=results.alt_max)
+        set_value(name="max_Q", value=results.max_Q)
+        set_value(name="tt_max_vel", value=results.tt_max_vel)
+        set_value(name="vel_max", value=results.vel_max)
+        set_value(name="accel_max", value=results.accel_max)
+        set_value(name="isp_max", value=results.isp_max)
+        set_value(name="cutoff_time", value=results.cutoff_time)
+        set_value(name="flight_time", value=results.flight_time)
+
+    if cached:
+        log_info("Run [" + str(run_numbers.get(job.id)) + "]: Same design as an earlier run, results loaded from cache.", logger="Logs")
+    else:
+        log_info("Run [" + str(run_numbers.get(job.id)) + "]: Simulation completed.", logger="Logs")
+    if job.store is not None:
+        log_info("Full results saved in " + job.store.filepath + " (" + str(len(job.store)) + " rows). Graphs show every " + str(job.store.stride) + ". step.", logger="Logs")
+    if job.inputs.time_increment > 0.1 and not job.adaptive:
+        log_warning("Time increment too large. Last simulation may be inaccurate.", logger = "Logs")
+
+    with phase(job.profiler, "gui/set_value"):
+        set_value(name="alt", value=job.inputs.alt_init)
+        set_value(name="alt_g", value="IMPACT!")
+        set_value(name="vel", value=results.impact_vel)
+        set_value(name="time", value=results.flight_time)
+
+    with phase(job.profiler, "gui/plots"):
+        time_points = results.channels["time"]
+        for series, plot, channel in plot_series:
+            x, y = minmax_decimate(time_points, results.channels[channel], plot_buckets)
+            add_line_series(name=series, plot=plot, x=x.tolist(), y=y.tolist())
+
+    if job.profiler is not None and not cached:
+        log_info("Profile of the last run:", logger = "Logs")
+        for line in job.profiler.report():
+            log_info(line, logger = "Logs")
+
+    if job.controller is not None:
+        for line in timing_report(results, job.controller):
+            log_info(line, logger = "Logs")
 
     global last_results
-    last_results = [thrust_list, time_list, alt_list, vel_list, ground_level_list, karman_line_list,
-                    external_pressure_list, gravity_list, accel_list, isp_list, drag_list, dyn_press_list,
-                    drogue_deployment_list, chute_deployment_list]
+    last_results = results
 
 # - - - - - - - - - - - - - - - - - - - - - - - - - - - -
 #                    USER INTERFACE
@@ -1081,24 +627,24 @@ def setProgressBarOverlay(overlay_str):
 # toggle graph guidelines to aid the naked eye
 def toggleGround():
     global is_ground_displayed
-    if calc_run_number > 0:
+    if last_results is not None:
         if is_ground_displayed:
             delete_series(series="Ground", plot="alt_plot")
             is_ground_displayed = False
         else:
-            add_line_series(name="Ground", plot="alt_plot",x=last_results[1], y=last_results[4], color=[0, 255, 0, 255])
+            add_line_series(name="Ground", plot="alt_plot",x=[0, last_results.flight_time], y=[last_results.ground_level]*2, color=[0, 255, 0, 255])
             is_ground_displayed = True
     else:
         log_warning("Run a calculation first!", logger = "Logs")
 
 def toggleKarman():
     global is_karman_displayed
-    if calc_run_number > 0:
+    if last_results is not None:
         if is_karman_displayed:
             delete_series(series="Karman Line", plot="alt_plot")
             is_karman_displayed = False
         else:
-            add_line_series(name="Karman Line", plot="alt_plot", x=last_results[1], y=last_results[5], color=[255, 0, 0, 255])
+            add_line_series(name="Karman Line", plot="alt_plot", x=[0, last_results.flight_time], y=[last_results.karman_line]*2, color=[255, 0, 0, 255])
             is_karman_displayed = True
     else:
         log_warning("Run a calculation first!", logger = "Logs")
@@ -1130,6 +676,9 @@ with window("Input", width=550, height=360, no_close=True):
     add_input_text(name = "exit_pressure_field", label = "Exhaust Exit Press. (Pa)", width=250)
     add_input_text(name = "exit_area_field", label = "Nozzle Exit Area (m^2)", width=250)
     add_input_text(name = "time_increment_field", label = "Time Increments (s)", tip="Enter lower values for higher precision.", default_value="0.01", width=250)
+    add_checkbox(name = "adaptive_checkbox", label = "Adaptive time step (RK45)", tip="Error-controlled steps with exact event times.\nTime increment is only used as the first step.")
+    add_checkbox(name = "stream_checkbox", label = "Stream results to file", tip="Writes every step to the file path (.npy, or .csv if given) during the run.\nOnly a thinned-out copy is kept in memory for the graphs.")
+    add_checkbox(name = "profile_checkbox", label = "Profile run", tip="Logs the time spent in physics, apogee prediction, drawing and plotting\nwhen the run is done. Profiled runs are never taken from the result cache.")
     add_spacing(count=6)
     add_separator()
     add_text("Optional Parameters")
@@ -1137,6 +686,9 @@ with window("Input", width=550, height=360, no_close=True):
     add_checkbox(name = "target_apogee_checkbox", label = "Enable apogee target")
     add_input_text(name = "target_apogee_field", label = "Target Apogee (m, ASL)", width=250)
     add_input_text(name = "engine_shutdown_delay_field", label = "Engine Shutdown Delay (s)", width = 250, tip = "Time between the computer sending the engine shutdown signal\nand the actual mechanical shutdown. (Enter 0 if there is no delay.)")
+    add_input_text(name = "shutdown_command_time_field", label = "Shutdown Command Time (s)", width = 250, tip = "Sends the shutdown signal at this time instead of predicting the apogee,\nas in cases solved by shutdown_solver.py. (Leave empty to predict.)")
+    add_combo(name = "flight_computer_combo", label = "Flight Computer", items = [builtin_flight_computer] + list(controllers), default_value = builtin_flight_computer, width = 250, tip = "Code that decides the engine shutdown. Plugins run at their own rate,\nindependent of the time increment, and their compute time is logged.")
+    add_input_text(name = "flight_computer_rate_field", label = "Flight Computer Rate (Hz)", default_value = "50", width = 250)
     add_spacing(count=6)
     add_checkbox(name = "drag_model_checkbox", label = "Enable drag model")
     add_input_text(name = "cross_sec_field", label = "Vessel Cross Section (m^2)", tip="Cross-sec facing the airflow.", width=250)
@@ -1161,6 +713,10 @@ with window("Input", width=550, height=360, no_close=True):
     add_spacing(count=6)
     add_button("Simulate Trajectory", callback = simulateTraj)
     add_same_line()
+    add_button("Cancel", callback = cancelSimulation)
+    add_same_line()
+    add_button("Cancel All", callback = cancelAllSimulations, tip="Also drops the queued runs.")
+    add_same_line()
     add_checkbox(name = "realtime_graph", label = "Update graphs every cycle", tip="Looks really cool but significantly reduces performance.")
 
 #OUTPUTS WINDOW
@@ -1190,6 +746,8 @@ with window("Output", width=700, height=560, no_close=True):
 
     add_same_line(parent="vis_tab")
     add_checkbox(name="lock_on_rocket", label="Lock View on Rocket", parent="vis_tab")
+    add_same_line(parent="vis_tab")
+    add_input_text(name="vis_fps_field", label="FPS", default_value="30", tip="Visualizer and live graph updates per second.", parent="vis_tab", width=40)
 
     add_drawing("vis_canvas", parent="vis_tab", width=680, height=380)
     clear_drawing("vis_canvas")
@@ -1283,4 +841,5 @@ with window("Log", width=550, height=190, no_close=True):
     add_logger("Logs", log_level=0, autosize_x = True, autosize_y = True)
     log_info(message = "TrajectorySim v" + str(version), logger = "Logs")
 
+set_render_callback(pollSimulation)
 start_dearpygui()
@@ -0,0 +1,175 @@
+#   STREAMING RESULT SINK
+
+# a drop-in replacement for results.ResultStore that writes the rows of
+# a run to disk chunk by chunk instead of keeping them, so memory stays
+# bounded no matter how long or fine-grained the run is. Only a
+# decimated copy is kept in memory for plotting.
+
+# usage: simulate(inputs, store=StreamingStore("run.npy"))
+#        np.load("run.npy")["alt"]
+
+import struct
+
+import numpy as np
+
+from results import flight_channels
+
+# .npy files get a fixed size header, so it can be rewritten with the
+# final row count when the run is done
+npy_header_size = 1024
+
+def load_stream(filepath):
+    """Reads a streamed .npy or .csv file back, returns {channel: array}."""
+
+    if filepath.endswith(".csv"):
+        data = np.genfromtxt(filepath, delimiter=",", names=True)
+    else:
+        data = np.load(filepath)
+    return {name: data[name] for name in data.dtype.names}
+
+class StreamingStore:
+    """Writes named float64 channels to a .csv or .npy file as they come.
+
+       Rows are buffered chunk_size at a time, then appended to the
+       file. The file is only complete after finish(). Indexing a
+       channel returns the decimated in-memory copy (at most about
+       2 * plot_points rows), not the full data. Running extremes of
+       every channel are tracked, so max() and min() are exact."""
+
+    def __init__(self, filepath, channels=flight_channels, chunk_size=4096, plot_points=4000):
+
+        self.filepath = filepath
+        self.channels = tuple(channels)
+        self.chunk_size = chunk_size
+        self.plot_points = plot_points
+        self._index = {name: i for i, name in enumerate(self.channels)}
+
+        self._length = 0
+        self._pending = []
+        self._last_rows = []
+
+        # last chunk written out, for rows_since()
+        self._last_chunk = np.empty((0, len(self.channels)))
+
+        self._maxima = np.full(len(self.channels), -np.inf)
+        self._minima = np.full(len(self.channels), np.inf)
+
+        # every stride-th row is kept for the plots
+        self._stride = 1
+        self._plot_rows = []
+
+        self.binary = not filepath.endswith(".csv")
+        self._file = open(filepath, "wb")
+        if self.binary:
+            self._file.write(self._npy_header(0))
+        else:
+            self._file.write((",".join(self.channels) + "\n").encode())
+
+    def _npy_header(self, rows):
+
+        header = {"descr": [(name, "<f8") for name in self.channels], "fortran_order": False, "shape": (rows,)}
+        text = repr(header).encode("latin1")
+        padding = npy_header_size - 10 - len(text) - 1
+        if padding < 0:
+            raise ValueError("Too many channels for the .npy header.")
+        return b"\x93NUMPY\x01\x00" + struct.pack("<H", npy_header_size - 10) + text + b" " * padding + b"\n"
+
+    def __len__(self):
+        return self._length + len(self._pending)
+
+    def __contains__(self, name):
+        return name in self._index
+
+    def __getitem__(self, name):
+        """Returns the decimated channel for plotting."""
+
+        i = self._index[name]
+        first = (-self._length) % self._stride
+        return np.array([row[i] for row in self._plot_rows] + [row[i] for row in self._pending[first::self._stride]])
+
+    def append(self, row):
+        """Adds one row, a tuple with a value for every channel."""
+
+        pending = self._pending
+        pending.append(row)
+        if len(pending) >= self.chunk_size:
+            self.flush()
+
+    def flush(self):
+        """Writes the pending rows to the file."""
+
+        pending = self._pending
+        if not pending:
+            return
+
+        chunk = np.array(pending, dtype=np.float64)
+        if self.binary:
+            self._file.write(chunk.astype("<f8", copy=False).tobytes())
+        else:
+            np.savetxt(self._file, chunk, delimiter=",", fmt="%.17g")
+
+        self._maxima = np.maximum(self._maxima, chunk.max(axis=0))
+        self._minima = np.minimum(self._minima, chunk.min(axis=0))
+
+        # keep row numbers that are multiples of the stride
+        first = (-self._length) % self._stride
+        self._plot_rows.extend(pending[first::self._stride])
+        while len(self._plot_rows) > 2 * self.plot_points:
+            self._plot_rows = self._plot_rows[::2]
+            self._stride = self._stride * 2
+
+        self._length = self._length + len(pending)
+        self._last_rows = pending[-2:]
+        self._last_chunk = chunk
+        self._pending = []
+
+    def last(self, name, count=1):
+        """Returns the last count values (up to 2) of a channel as a list."""
+
+        i = self._index[name]
+        rows = (self._last_rows + self._pending)[-count:]
+        return [row[i] for row in rows]
+
+    def rows_since(self, start):
+        """Returns a copy of the rows from row number start on, one row per channel.
+
+           Only the pending rows and the last chunk written out are
+           still in memory, older rows are skipped."""
+
+        pending = np.array(self._pending, dtype=np.float64).reshape(-1, len(self.channels))
+        available = np.concatenate((self._last_chunk, pending))
+        first = self._length - len(self._last_chunk)
+        return available[max(start - first, 0):].T.copy()
+
+    def max(self, name):
+        """Largest value of a channel so far, as a float."""
+
+        i = self._index[name]
+        return max([float(self._maxima[i])] + [row[i] for row in self._pending])
+
+    def min(self, name):
+        """Smallest value of a channel so far, as a float."""
+
+        i = self._index[name]
+        return min([float(self._minima[i])] + [row[i] for row in self._pending])
+
+    def finish(self):
+        """Writes the remaining rows and closes the file."""
+
+        if self._file.closed:
+            return
+
+        self.flush()
+        if self.binary:
+            self._file.seek(0)
+            self._file.write(self._npy_header(self._length))
+        self._file.close()
+
+    @property
+    def stride(self):
+        """Rows of the file per row of the in-memory copy."""
+        return self._stride
+
+    @property
+    def nbytes(self):
+        return len(self._plot_rows) * len(self.channels) * 8
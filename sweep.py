@@ -0,0 +1,194 @@
+#   PARAMETER SWEEP RUNNER
+
+# runs a base save file with many sets of overridden inputs, spread
+# over all CPU cores with a process pool
+
+# usage: python sweep.py demo_saves/apogee_target.txt --set eev=2000,2250,2500 --set drag_coeff=0.4:0.6:5
+#        python sweep.py demo_saves/simple.txt --cases cases.csv --output results.csv
+#        python sweep.py demo_saves/simple.txt --cases designs.json
+#        python sweep.py demo_saves/simple.txt --set eev=2000:2500:101 --jit
+
+import argparse
+import csv
+import itertools
+import os
+import sys
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from dataclasses import dataclass, fields, replace
+
+from trajectory_core import SimInputs, SimulationError, simulate
+from savefile import read_save_file, read_cases as read_case_file, case_extensions
+
+# scalar outputs reported for every case, time histories stay in the worker
+summary_fields = ["alt_max", "tt_apoapsis", "max_Q", "vel_max", "tt_max_vel", "accel_max",
+                  "isp_min", "isp_max", "cutoff_time", "flight_time", "impact_vel"]
+
+input_types = {f.name: f.type for f in fields(SimInputs)}
+
+@dataclass
+class SweepResult:
+    """Outcome of one sweep case.
+
+       index is the position of the case in the submitted list,
+       summary maps summary_fields to values and is None if the
+       case could not be simulated (error says why)."""
+
+    index: int
+    overrides: dict
+    summary: dict = None
+    error: str = None
+
+def expand_grid(grid):
+    """Cartesian product of {input name: list of values}, as a list of override dicts."""
+
+    names = list(grid)
+    return [dict(zip(names, values)) for values in itertools.product(*(grid[name] for name in names))]
+
+def apply_overrides(base, overrides):
+    """Returns a copy of base (a SimInputs) with the overrides applied."""
+
+    for name in overrides:
+        if name not in input_types:
+            raise ValueError("Unknown input: " + name)
+    return replace(base, **overrides)
+
+def _run_chunk(base, chunk, jit=False):
+
+    fly = simulate
+    if jit:
+        # only imported when asked for, loading Numba takes a while
+        from jit_kernel import simulate_jit as fly
+
+    results = []
+    for index, overrides in chunk:
+        try:
+            inputs = apply_overrides(base, overrides)
+            inputs.validate()
+            result = fly(inputs)
+            results.append(SweepResult(index, overrides, {name: getattr(result, name) for name in summary_fields}))
+        except (SimulationError, ValueError) as e:
+            results.append(SweepResult(index, overrides, error=str(e)))
+        except Exception as e:
+            # one bad case must not take the rest of the chunk down with it
+            results.append(SweepResult(index, overrides, error=type(e).__name__ + ": " + str(e)))
+    return results
+
+def run_sweep(base, cases, workers=None, chunksize=1, progress=None, executor=None, jit=False):
+    """Simulates base with every override dict in cases.
+
+       Cases are handed to the worker processes chunksize at a time.
+       Yields a SweepResult as soon as it is done, so results come
+       back in completion order, not submission order. progress,
+       if given, is called with (done, total) after each result.
+       An executor can be passed in to reuse its worker processes
+       over several sweeps, workers is ignored then. jit flies the
+       cases on the compiled kernel of jit_kernel.py (if Numba is
+       installed)."""
+
+    if executor is None:
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            yield from run_sweep(base, cases, chunksize=chunksize, progress=progress, executor=executor, jit=jit)
+        return
+
+    cases = list(cases)
+    total = len(cases)
+    indexed = list(enumerate(cases))
+    chunks = [indexed[i:i + chunksize] for i in range(0, total, chunksize)]
+
+    done = 0
+    futures = [executor.submit(_run_chunk, base, chunk, jit) for chunk in chunks]
+    for future in as_completed(futures):
+        for result in future.result():
+            done += 1
+            if progress:
+                progress(done, total)
+            yield result
+
+# - - - - - - - - - - - - - - - - - - - - - - - - - - - -
+#                 COMMAND LINE
+# - - - - - - - - - - - - - - - - - - - - - - - - - - - -
+
+def parse_value(name, text):
+
+    if input_types[name] in (bool, "bool"):
+        if text.lower() in ("1", "true", "yes", "on"):
+            return True
+        if text.lower() in ("0", "false", "no", "off"):
+            return False
+        raise ValueError("Not a boolean for " + name + ": " + text)
+    return float(text)
+
+def parse_set(option):
+    """Parses name=v1,v2,... or name=start:stop:count into (name, values)."""
+
+    name, sep, text = option.partition("=")
+    if not sep or name not in input_types:
+        raise argparse.ArgumentTypeError("Expected <input>=<values>, got " + option)
+
+    if text.count(":") == 2:
+        start, stop, count = text.split(":")
+        start, stop, count = float(start), float(stop), int(count)
+        if count < 2:
+            return name, [start]
+        return name, [start + (stop - start) * i/(count - 1) for i in range(count)]
+
+    return name, [parse_value(name, value) for value in text.split(",")]
+
+def read_cases(filepath, base):
+    """Reads override dicts from a CSV file with input names as header,
+       or from a .json/.toml case file (see savefile.py).
+
+       Case file cases are complete designs, their overrides are
+       the inputs that differ from base."""
+
+    if os.path.splitext(filepath)[1].lower() in case_extensions:
+        return [{name: value for name, value in vars(case.inputs).items() if value != getattr(base, name)}
+                for case in read_case_file(filepath)]
+
+    with open(filepath, newline="") as cases_file:
+        return [{name: parse_value(name, value) for name, value in row.items() if value != ""}
+                for row in csv.DictReader(cases_file)]
+
+def main():
+
+    parser = argparse.ArgumentParser(description="Run a save file with a grid or list of input overrides.")
+    parser.add_argument("save_file", help="base save file (case file or .txt written by Export)")
+    parser.add_argument("--set", action="append", default=[], metavar="INPUT=VALUES",
+                        help="sweep an input over v1,v2,... or start:stop:count, repeat for a grid")
+    parser.add_argument("--cases", help="CSV file with one case per row, input names as header, or a .json/.toml case file")
+    parser.add_argument("--workers", type=int, default=None, help="worker processes (default: all cores)")
+    parser.add_argument("--chunksize", type=int, default=1, help="cases per task sent to a worker")
+    parser.add_argument("--output", help="write results to this CSV file instead of stdout")
+    parser.add_argument("--jit", action="store_true", help="use the compiled step kernel (needs Numba)")
+    args = parser.parse_args()
+
+    try:
+        base, file_version = read_save_file(args.save_file)
+        grid = dict(parse_set(option) for option in args.set)
+        cases = read_cases(args.cases, base) if args.cases else [{}]
+    except (argparse.ArgumentTypeError, ValueError, SimulationError) as e:
+        parser.error(str(e))
+
+    cases = [dict(case, **overrides) for case in cases for overrides in expand_grid(grid)]
+    input_names = sorted(set(name for case in cases for name in case), key=list(input_types).index)
+
+    def report(done, total):
+        sys.stderr.write("\r%d/%d cases" % (done, total))
+        if done == total:
+            sys.stderr.write("\n")
+        sys.stderr.flush()
+
+    output = open(args.output, "w", newline="") if args.output else sys.stdout
+    try:
+        writer = csv.writer(output)
+        writer.writerow(["case"] + input_names + summary_fields + ["error"])
+        for result in run_sweep(base, cases, args.workers, args.chunksize, report, jit=args.jit):
+            summary = result.summary or {}
+            writer.writerow([result.index] + [result.overrides.get(name, getattr(base, name)) for name in input_names]
+                            + [summary.get(name, "") for name in summary_fields] + [result.error or ""])
+    finally:
+        if args.output:
+            output.close()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,592 @@
+#   SOUNDING ROCKET TRAJECTORY SIMULATOR - HEADLESS CORE
+
+# this module holds the actual physics of the simulator
+# it does not touch the GUI at all, so it can be used
+# for batch runs, scripts and servers as well as by
+# sounding_trajectory.py (which is now just a client of it)
+
+import math
+from dataclasses import dataclass, field
+from time import perf_counter
+
+from atmosphere import Atmosphere
+from results import ResultStore
+
+version = "1.3.4"
+
+# loaded once, shared by every run that doesn't bring its own model
+standard_atmosphere = Atmosphere()
+
+# - - - - - - - - - - - - - - - - - - - - - - - - - - - -
+#                 INPUTS AND RESULTS
+# - - - - - - - - - - - - - - - - - - - - - - - - - - - -
+
+class SimulationError(Exception):
+    """Raised when the given inputs can not be simulated."""
+
+class InsufficientThrustError(SimulationError):
+    """Raised when the vehicle can not lift off the pad."""
+
+class ChuteOrderError(SimulationError):
+    """Raised when the main chute would deploy before the drogue."""
+
+@dataclass
+class SimInputs:
+    """Every design parameter of a single simulation run.
+
+       Optional subsystems keep the -1.0 placeholders the GUI
+       has always used when they are disabled."""
+
+    eev: float
+    mdot: float
+    mass_init: float
+    mass_propellant: float
+    alt_init: float
+    exit_pressure: float
+    exit_area: float
+    time_increment: float = 0.01
+
+    drag_enabled: bool = False
+    cross_sec: float = -1.0
+    drag_coeff: float = -1.0
+
+    target_apogee_enabled: bool = False
+    target_apogee: float = -1.0
+    engine_shutdown_delay: float = -1.0
+
+    # send the engine shutdown command at this time instead of when the
+    # apogee predictor says so (see shutdown_solver.py), -1.0 if unset
+    shutdown_command_time: float = -1.0
+
+    drogue_enabled: bool = False
+    drogue_deploy_alt: float = -1.0
+    drogue_deploy_time: float = -1.0
+    drogue_area: float = -1.0
+    drogue_coeff: float = -1.0
+    drogue_mass: float = -1.0
+
+    chute_enabled: bool = False
+    chute_deploy_alt: float = -1.0
+    chute_deploy_time: float = -1.0
+    chute_area: float = -1.0
+    chute_coeff: float = -1.0
+
+    def validate(self):
+        """Raises SimulationError if the inputs are physically inconsistent."""
+
+        if self.mass_propellant >= self.mass_init:
+            raise SimulationError("Propellant mass can not be larger than initial mass!")
+
+        if self.mdot <= 0:
+            raise SimulationError("Mass flow rate must be positive!")
+
+@dataclass
+class SimResult:
+    """Time histories and flight summary of a single simulation run."""
+
+    inputs: SimInputs
+
+    # time histories, one named channel per recorded quantity
+    # (see results.flight_channels), read as result.channels["alt"]
+    channels: ResultStore = field(default_factory=ResultStore)
+
+    # constant guide lines of the altitude plot
+    ground_level: float = None
+    karman_line: float = 100000.0
+
+    alt_max: float = None
+    tt_apoapsis: float = None
+    max_Q: float = None
+    vel_max: float = None
+    tt_max_vel: float = None
+    accel_max: float = None
+    isp_min: float = None
+    isp_max: float = None
+    cutoff_time: float = None
+    flight_time: float = None
+    impact_vel: float = None
+
+    # (name, time, altitude, velocity) of the flight events, filled
+    # in by the adaptive integrator
+    events: list = field(default_factory=list)
+
+    # the profiling.PhaseProfiler of the run, if it was profiled
+    profile: object = None
+
+    # (simulated time, compute time (s)) of every flight controller
+    # call, if the run had a controller
+    controller_calls: list = None
+
+class FlightState:
+    """Snapshot of the vehicle handed to the step callback of simulate().
+
+       The same object is updated in place every step, so copy
+       whatever you need to keep."""
+
+    __slots__ = ("time", "alt", "alt_g", "vel", "accel", "mass", "drogue_deployment",
+                 "chute_deployment", "drogue_released", "is_accelerating_up", "result")
+
+    def __init__(self, result):
+        self.time = 0.0
+        self.alt = 0.0
+        self.alt_g = 0.0
+        self.vel = 0.0
+        self.accel = 0.0
+        self.mass = 0.0
+        self.drogue_deployment = 0.0
+        self.chute_deployment = 0.0
+        self.drogue_released = False
+        self.is_accelerating_up = True
+        self.result = result
+
+    def copy(self):
+        """Returns a detached copy, without the result, e.g. for handing to another thread."""
+
+        state = FlightState(None)
+        for name in FlightState.__slots__[:-1]:
+            setattr(state, name, getattr(self, name))
+        return state
+
+# - - - - - - - - - - - - - - - - - - - - - - - - - - - -
+#               APOGEE PREDICTION ROUTINE
+# - - - - - - - - - - - - - - - - - - - - - - - - - - - -
+
+# returns the apogee the vehicle would reach if the engine shutdown
+# command was sent right now. A profiler, if given, counts the steps
+# of the prediction.
+def predictApogeeDelayed(param_a, param_v, param_m, drag_model, param_cross_sec, param_drag_coeff, param_time_incr, param_last_accel, param_delay, param_mdot, atmosphere=standard_atmosphere, profiler=None):
+
+    vel_init = param_v
+    alt_init = param_a
+    mass = param_m
+    time_increment = param_time_incr
+    drag_enabled = drag_model
+    cross_sec = param_cross_sec
+    drag_coeff = param_drag_coeff
+
+    last_accel = param_last_accel
+    shutdown_delay = param_delay
+
+    # Calculation sub-functions
+
+    def clamp(num, min_value, max_value):
+        return max(min(num, max_value), min_value)
+
+    def sign(x): return 1 if x >= 0 else -1
+
+    alt2dens = atmosphere.density
+
+    # Approximate drag force on the vessel
+    def calc_drag(velocity, density):
+
+        if drag_enabled:
+            drag = (0.5 * density * velocity**2 * drag_coeff * cross_sec) * -sign(velocity)
+        else:
+            drag = 0.0
+
+        return drag
+
+    calc_grav = atmosphere.gravity
+
+    # - - - - - - - - - - - - - - - - - - - - - - - - - - - -
+    #                   RUN PREDICTION
+    # - - - - - - - - - - - - - - - - - - - - - - - - - - - -
+
+    #set initial values
+
+    alt = alt_init
+    vel = vel_init
+    drag = 0
+    density = alt2dens(alt_init)
+    gravity = -calc_grav(alt_init)
+    time = 0
+
+    accel = last_accel[1]
+
+    is_going_up = True
+
+    # BEGIN TIMESTEPS
+
+    while (True):
+
+        time = time + time_increment
+
+        if time < shutdown_delay:
+            vel = vel + accel * time_increment
+            accel = accel + (last_accel[1] - last_accel[0]) #don't multiply this with time_accel, it is included already
+            mass = mass - param_mdot * time_increment
+        else:
+            density = alt2dens(alt)
+            gravity = -calc_grav(alt)
+            drag = calc_drag(vel, density)
+            vel = vel + gravity * time_increment + drag/mass * time_increment
+
+        alt = alt + vel * time_increment
+
+        if is_going_up and vel <= 0:
+            is_going_up = False
+            alt_max = alt
+            if profiler is not None:
+                profiler.count("predictor iterations", int(round(time/time_increment)))
+            return alt_max
+
+# returns True if the engine shutdown command should be sent now
+def calcApogeeDelayed(param_a, param_v, param_m, target_apogee, drag_model, param_cross_sec, param_drag_coeff, param_time_incr, param_last_accel, param_delay, param_mdot, atmosphere=standard_atmosphere):
+
+    alt_max = predictApogeeDelayed(param_a, param_v, param_m, drag_model, param_cross_sec, param_drag_coeff, param_time_incr,
+                                   param_last_accel, param_delay, param_mdot, atmosphere)
+    if alt_max >= target_apogee:
+        return True
+    else:
+        return False
+
+# Each apogee prediction integrates the whole coast, so polling it on
+# every timestep of the boost costs O(n^2). Instead we work out how long
+# the predicted apogee can not possibly reach the target and skip the
+# checks until then.
+#
+# Thrust can add at most vel * accel_max of specific energy per second
+# (drag only takes energy away), and the vehicle can not get faster than
+# vel + accel_max * t. Integrating that over the skipped interval and
+# converting energy to height with the weakest gravity on the way up
+# gives an upper bound on how much the predicted apogee can grow. The
+# checks are put off until half of the remaining gap could be covered,
+# which makes them denser and denser as the target gets close, and the
+# decision lands on exactly the same timestep as checking every step.
+def apogeeCheckHoldoff(predicted_apogee, target_apogee, vel, accel_max, gravity_min, shutdown_delay):
+
+    gap = 0.5 * (target_apogee - predicted_apogee)
+    if gap <= 0:
+        return 0.0
+
+    # the prediction already looks shutdown_delay seconds ahead
+    vel = max(vel, 0.0) + accel_max * max(shutdown_delay, 0.0)
+
+    return (math.sqrt(vel**2 + 2 * gravity_min * gap) - vel)/accel_max
+
+# same as apogeeCheckHoldoff, in whole timesteps
+def apogeeCheckSkip(predicted_apogee, target_apogee, vel, accel_max, gravity_min, shutdown_delay, time_increment):
+
+    skip_time = apogeeCheckHoldoff(predicted_apogee, target_apogee, vel, accel_max, gravity_min, shutdown_delay)
+    return max(int(skip_time/time_increment) - 1, 0)
+
+# - - - - - - - - - - - - - - - - - - - - - - - - - - - -
+#                     SIMULATION
+# - - - - - - - - - - - - - - - - - - - - - - - - - - - -
+
+def simulate(inputs, step_callback=None, atmosphere=standard_atmosphere, exhaustive_apogee_check=False, store=None, profiler=None, controller=None):
+    """Runs a single trajectory simulation and returns a SimResult.
+
+       step_callback, if given, is called with a FlightState after
+       every timestep except the final (ground impact) one. This is
+       how the GUI hooks its visualizer and live graphs in.
+
+       exhaustive_apogee_check runs the apogee prediction on every
+       timestep of the boost instead of only when the target could
+       be within reach (see apogeeCheckSkip). It gives the same
+       result and is only useful for verification.
+
+       store replaces the default in-memory ResultStore, e.g. with a
+       streaming.StreamingStore for runs too long to keep in memory.
+
+       profiler, a profiling.PhaseProfiler, gets the time spent in
+       apogee prediction, in the step callback and in the rest of
+       the loop (physics, including recording), and the step and
+       prediction counts. It is kept in result.profile.
+
+       controller, a flight_controllers.FlightController, flies in
+       the loop instead of the simulator's own apogee check: it is
+       called every 1/controller.rate simulated seconds of the boost,
+       independent of the time increment, and commands the engine
+       shutdown. Every call is timed into result.controller_calls.
+       It needs the apogee target enabled, and a shutdown command
+       time still takes precedence over it."""
+
+    inputs.validate()
+
+    if controller is not None and not inputs.target_apogee_enabled:
+        raise SimulationError("A flight controller needs the apogee target enabled.")
+
+    profiling = profiler is not None
+    if profiling:
+        run_start = perf_counter()
+        prediction_time = 0.0
+        predictions = 0
+        callback_time = 0.0
+        controller_time = 0.0
+
+    eev = inputs.eev
+    mdot = inputs.mdot
+    mass_init = inputs.mass_init
+    mass_propellant = inputs.mass_propellant
+    alt_init = inputs.alt_init
+    exit_pressure = inputs.exit_pressure
+    exit_area = inputs.exit_area
+    time_increment = inputs.time_increment
+
+    drag_enabled = inputs.drag_enabled
+    cross_sec = inputs.cross_sec
+    drag_coeff = inputs.drag_coeff
+
+    target_apogee_enabled = inputs.target_apogee_enabled
+    target_apogee = inputs.target_apogee
+    engine_shutdown_delay = inputs.engine_shutdown_delay
+    shutdown_command_time = inputs.shutdown_command_time
+
+    drogue_enabled = inputs.drogue_enabled
+    drogue_deploy_alt = inputs.drogue_deploy_alt
+    drogue_deploy_time = inputs.drogue_deploy_time
+    drogue_area = inputs.drogue_area
+    drogue_coeff = inputs.drogue_coeff
+    drogue_mass = inputs.drogue_mass
+
+    chute_enabled = inputs.chute_enabled
+    chute_deploy_alt = inputs.chute_deploy_alt
+    chute_deploy_time = inputs.chute_deploy_time
+    chute_area = inputs.chute_area
+    chute_coeff = inputs.chute_coeff
+
+    # Calculation sub-functions
+
+    def clamp(num, min_value, max_value):
+        return max(min(num, max_value), min_value)
+
+    def sign(x): return 1 if x >= 0 else -1
+
+    # density, pressure, temperature and speed of sound in one table lookup
+    alt2air = atmosphere.lookup
+
+    # Approximate drag force on the vessel
+    def calc_drag(velocity, density):
+
+        if drag_enabled:
+
+            if drogue_deployment > 0.0 and not drogue_released:
+                airflow_area = cross_sec + (drogue_area - cross_sec) * drogue_deployment
+                drag = (0.5 * density * velocity**2 * drogue_coeff * airflow_area) * -sign(velocity)
+
+            elif chute_deployment > 0.0:
+                airflow_area = cross_sec + (chute_area - cross_sec) * chute_deployment
+                drag = (0.5 * density * velocity**2 * chute_coeff * airflow_area) * -sign(velocity)
+
+            else:
+                drag = (0.5 * density * velocity**2 * drag_coeff * cross_sec) * -sign(velocity)
+
+            dynamic_press = 0.5 * density * velocity**2
+
+            return drag, dynamic_press
+
+        else:
+            return 0.0, 0.0
+
+    calc_grav = atmosphere.gravity
+
+    # - - - - - - - - - - - - - - - - - - - - - - - - - - - -
+    #                   RUN SIMULATION
+    # - - - - - - - - - - - - - - - - - - - - - - - - - - - -
+
+    result = SimResult(inputs) if store is None else SimResult(inputs, channels=store)
+
+    #set initial values
+
+    alt = alt_init
+    density, air_pressure, air_temperature, sound_speed = alt2air(alt_init)
+    thrust = mdot * eev + exit_area * (exit_pressure - air_pressure)
+    mass = mass_init
+    vel = 0
+    accel = 0
+    external_pressure = air_pressure
+    isp = (thrust)/(mdot * 9.80665)
+    result.isp_min = isp
+    drag = 0
+    dyn_press = 0
+    gravity = -calc_grav(alt_init)
+    time = 0
+
+    # not enough thrust at lift-off!
+    if thrust < (-gravity * mass_init):
+        raise InsufficientThrustError("Not enough thrust - vehicle won't lift off.")
+
+    # main chute deployment before main
+    if drogue_enabled and chute_enabled and drogue_deploy_alt <= chute_deploy_alt:
+        raise ChuteOrderError("Attempt to deploy main chute before drogue!")
+
+    result.ground_level = alt_init
+    channels = result.channels
+    record = channels.append
+
+    # accel_list[-2] of the old list storage, for the apogee predictor
+    prev_accel = accel
+
+    is_going_up = True
+    is_accelerating_up = True
+
+    engine_shutdown = False
+    engine_shutdown_command = False
+    time_since_shutdown_command = 0.0
+
+    drogue_deployment = 0.0
+    chute_deployment = 0.0
+
+    drogue_released = False
+
+    # apogee predictions that can be skipped before the next check
+    apogee_check_countdown = 0
+    if target_apogee_enabled:
+        accel_max = (mdot * eev + exit_area * max(exit_pressure, 0.0))/(mass_init - mass_propellant)
+        gravity_min = calc_grav(max(target_apogee, alt_init))
+
+    if step_callback is not None or controller is not None:
+        state = FlightState(result)
+
+    # the controller is called on the first step at or after each of
+    # its cycle times, half a step of slack absorbs rounding
+    if controller is not None:
+        controller.start(inputs, atmosphere)
+        control_rate = controller.rate
+        control_time = 1/control_rate
+        controller_calls = result.controller_calls = []
+
+    # BEGIN TIMESTEPS
+
+    while (True):
+
+        # see results.flight_channels for the order
+        record((time, alt, vel, accel, thrust, external_pressure, -gravity, isp, drag, dyn_press,
+                drogue_deployment if not drogue_released else 0.0, chute_deployment, mass))
+
+        time = time + time_increment
+
+        if target_apogee_enabled and not engine_shutdown_command and shutdown_command_time >= 0.0:
+            engine_shutdown_command = time >= shutdown_command_time
+        elif controller is not None and not engine_shutdown_command and is_accelerating_up:
+            # the controller reads the state just recorded
+            sample_time = time - time_increment
+            if sample_time > control_time - time_increment/2:
+                state.time = sample_time
+                state.alt = alt
+                state.alt_g = alt - alt_init
+                state.vel = vel
+                state.accel = accel
+                state.mass = mass
+
+                call_start = perf_counter()
+                engine_shutdown_command = bool(controller.update(state))
+                call_time = perf_counter() - call_start
+                controller_calls.append((sample_time, call_time))
+                if profiling:
+                    controller_time = controller_time + call_time
+
+                if engine_shutdown_command:
+                    time_since_shutdown_command = 0
+                control_time = (int((sample_time + time_increment/2) * control_rate) + 1)/control_rate
+        elif target_apogee_enabled and not engine_shutdown_command and time > time_increment * 2:
+            if apogee_check_countdown > 0:
+                apogee_check_countdown = apogee_check_countdown - 1
+            else:
+                if profiling:
+                    phase_start = perf_counter()
+                    predicted_apogee = predictApogeeDelayed(alt, vel, mass, drag_enabled, cross_sec, drag_coeff, time_increment, [prev_accel, accel], engine_shutdown_delay, mdot, atmosphere, profiler)
+                    prediction_time = prediction_time + (perf_counter() - phase_start)
+                    predictions = predictions + 1
+                else:
+                    predicted_apogee = predictApogeeDelayed(alt, vel, mass, drag_enabled, cross_sec, drag_coeff, time_increment, [prev_accel, accel], engine_shutdown_delay, mdot, atmosphere)
+                engine_shutdown_command = predicted_apogee >= target_apogee
+                if engine_shutdown_command:
+                    time_since_shutdown_command = 0
+                elif not exhaustive_apogee_check:
+                    apogee_check_countdown = apogeeCheckSkip(predicted_apogee, target_apogee, vel, accel_max, gravity_min, engine_shutdown_delay, time_increment)
+
+        if engine_shutdown_command and time_since_shutdown_command < engine_shutdown_delay:
+            time_since_shutdown_command = time_since_shutdown_command + time_increment
+        elif engine_shutdown_command and time_since_shutdown_command >= engine_shutdown_delay and not engine_shutdown:
+            engine_shutdown = True
+
+        gravity = -calc_grav(alt)
+
+        # looked up at the end of the last step, at this same altitude
+        external_pressure = air_pressure
+
+        # don't provide thrust if propellants are depleted or engine shutdown command was given!
+        if mass > (mass_init - mass_propellant) and ((target_apogee_enabled and not engine_shutdown) or not target_apogee_enabled):
+            vel = vel + ((thrust/mass) * time_increment) + (gravity * time_increment) + (drag/mass * time_increment)
+            mass = mass - mdot * time_increment
+            thrust = mdot * eev + exit_area * (exit_pressure - external_pressure)
+        else:
+            thrust = 0
+            vel = vel + gravity * time_increment + drag/mass * time_increment
+
+        if drogue_enabled and not is_going_up and alt <= drogue_deploy_alt:
+            if drogue_deployment < 1.0:
+                drogue_deployment = drogue_deployment + time_increment/drogue_deploy_time
+
+        if chute_enabled and not is_going_up and alt <= chute_deploy_alt:
+            if drogue_enabled and not drogue_released:
+                drogue_released = True
+                mass = mass - drogue_mass
+
+            if chute_deployment < 1.0:
+                chute_deployment = chute_deployment + time_increment/chute_deploy_time
+
+        alt = alt + vel * time_increment
+        alt_g = alt - alt_init
+        prev_accel = accel
+        accel = thrust/mass + gravity + drag/mass
+        isp = (thrust)/(mdot * 9.80665)
+        density, air_pressure, air_temperature, sound_speed = alt2air(alt)
+        drag, dyn_press = calc_drag(vel, density)
+
+        if is_going_up and vel <= 0:
+            is_going_up = False
+            result.tt_apoapsis = time
+            result.alt_max = alt
+            result.max_Q = channels.max("dyn_press")
+
+        if is_accelerating_up and (not mass > (mass_init - mass_propellant) or (target_apogee_enabled and engine_shutdown)):
+            is_accelerating_up = False
+            result.tt_max_vel = time
+            result.vel_max = channels.max("vel")
+            result.accel_max = channels.max("accel")
+            result.isp_max = channels.max("isp")
+            result.cutoff_time = time
+
+        # vehicle reached ground!
+        if alt <= alt_init:
+            result.flight_time = time
+            result.impact_vel = vel
+            break
+
+        if step_callback is not None:
+            state.time = time
+            state.alt = alt
+            state.alt_g = alt_g
+            state.vel = vel
+            state.accel = accel
+            state.mass = mass
+            state.drogue_deployment = drogue_deployment
+            state.chute_deployment = chute_deployment
+            state.drogue_released = drogue_released
+            state.is_accelerating_up = is_accelerating_up
+            if profiling:
+                phase_start = perf_counter()
+                step_callback(state)
+                callback_time = callback_time + (perf_counter() - phase_start)
+            else:
+                step_callback(state)
+
+    channels.finish()
+
+    if profiling:
+        steps = len(channels)
+        profiler.wall_time = perf_counter() - run_start
+        profiler.add("physics", profiler.wall_time - prediction_time - callback_time - controller_time, steps)
+        profiler.add("apogee prediction", prediction_time, predictions)
+        if controller is not None:
+            profiler.add("flight controller", controller_time, len(controller_calls))
+        if step_callback is not None:
+            profiler.add("step callback", callback_time, steps - 1)
+        profiler.count("steps", steps)
+        profiler.count("apogee predictions", predictions)
+        result.profile = profiler
+
+    return result